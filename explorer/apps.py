@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class ExplorerConfig(AppConfig):
+    name = "explorer"
+
+    def ready(self):
+        from . import memory_db
+        if memory_db.load_mode():
+            memory_db.install()
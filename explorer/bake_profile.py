@@ -0,0 +1,247 @@
+"""
+Records timing, query counts and output size for each page in the bake
+
+Enabled with BAKE_PROFILE in settings. Each rendered page produces a row
+with the view class, args, wall time, time in logic(), time rendering
+the template, number of SQL queries and output bytes. Rows are appended
+as they finish to a file per process in _cache/bake_profile (so forked
+bake workers lose nothing however they exit), and write_manifest, run
+by the bake task once the bake is done, merges them into
+bake_manifest.json/.csv in the bake folder and prints a summary of the
+slowest views and pages.
+"""
+import csv
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+fields = ["view", "args", "wall", "logic", "template", "queries", "bytes"]
+
+_state = threading.local()
+
+
+def profile_enabled():
+    return getattr(settings, "BAKE_PROFILE", False)
+
+
+class QueryCounter(object):
+    """
+    execute wrapper that counts queries on the current thread
+    """
+
+    def __call__(self, execute, sql, params, many, context):
+        _state.queries = getattr(_state, "queries", 0) + 1
+        return execute(sql, params, many, context)
+
+
+query_counter = QueryCounter()
+
+
+def install_counter(sender, connection, **kwargs):
+    if query_counter not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_counter)
+
+
+def timed_render(render):
+    """
+    add the time in template rendering to the current record
+    """
+
+    def inner(self, *args, **kwargs):
+        record = getattr(_state, "record", None)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            if record is not None:
+                record["template"] += time.perf_counter() - start
+
+    inner.timed = True
+    return inner
+
+
+def install():
+    """
+    count queries on current and future connections
+    and time template rendering
+    """
+    from django.template.backends.django import Template
+    connection_created.connect(install_counter)
+    for connection in connections.all():
+        install_counter(None, connection)
+    if getattr(Template.render, "timed", False) is False:
+        Template.render = timed_render(Template.render)
+
+
+def query_count():
+    return getattr(_state, "queries", 0)
+
+
+def start_record():
+    """
+    start a record for a page, made current for this thread
+    """
+    record = OrderedDict([(x, None) for x in fields])
+    record["_start"] = time.perf_counter()
+    record["_queries"] = query_count()
+    record["logic"] = 0
+    record["template"] = 0
+    _state.record = record
+    return record
+
+
+def current_record():
+    record = getattr(_state, "record", None)
+    if record is None:
+        # not rendered through the middleware, track logic only
+        record = start_record()
+        record["_partial"] = True
+    return record
+
+
+def finish_record(record, output_bytes=None):
+    record["wall"] = round(time.perf_counter() - record["_start"], 4)
+    record["queries"] = query_count() - record["_queries"]
+    record["template"] = round(record["template"], 4)
+    if output_bytes is not None:
+        record["bytes"] = output_bytes
+    _state.record = None
+    append_part(record)
+
+
+# rows finished by this process, one json line each
+
+_part = {"pid": None, "file": None}
+_part_lock = threading.Lock()
+
+
+def parts_folder():
+    return os.path.join(settings.BASE_DIR, "_cache", "bake_profile")
+
+
+def append_part(record):
+    row = {k: v for k, v in record.items() if k in fields}
+    with _part_lock:
+        # a forked worker gets its own file rather than the parent's
+        if _part["pid"] != os.getpid():
+            folder = parts_folder()
+            if os.path.exists(folder) is False:
+                os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, "{0}.jsonl".format(os.getpid()))
+            _part["file"] = open(path, "a", buffering=1)
+            _part["pid"] = os.getpid()
+        _part["file"].write(json.dumps(row) + "\n")
+
+
+def part_paths():
+    folder = parts_folder()
+    if os.path.exists(folder) is False:
+        return []
+    return [os.path.join(folder, x) for x in sorted(os.listdir(folder))
+            if x.endswith(".jsonl")]
+
+
+def clear_parts():
+    """
+    called before a bake so only its rows are merged
+    """
+    for path in part_paths():
+        os.remove(path)
+
+
+def logic_started(view):
+    record = current_record()
+    record["view"] = view.__class__.__name__
+    arg_values = []
+    for a in getattr(view, "args", []):
+        if isinstance(a, (list, tuple)):
+            a = a[0]
+        arg_values.append(str(getattr(view, a, "")))
+    record["args"] = "/".join(arg_values)
+    record["_logic_start"] = time.perf_counter()
+
+
+def logic_finished(view):
+    record = current_record()
+    start = record.pop("_logic_start", None)
+    if start is not None:
+        record["logic"] = round(time.perf_counter() - start, 4)
+    if record.pop("_partial", False):
+        finish_record(record)
+
+
+class BakeProfileMiddleware(object):
+    """
+    outermost middleware for the bake, so output bytes are post-minify
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        record = start_record()
+        response = self.get_response(request)
+        size = None
+        if not getattr(response, "streaming", False):
+            size = len(response.content)
+        finish_record(record, size)
+        return response
+
+
+def read_parts():
+    rows = []
+    for path in part_paths():
+        with open(path) as f:
+            rows.extend(json.loads(x) for x in f if x.strip())
+    return rows
+
+
+def write_manifest(folder=None):
+    """
+    merge the rows from every bake process into the manifest
+    """
+    rows = read_parts()
+    if not rows:
+        return
+    if folder is None:
+        folder = settings.BAKE_LOCATION
+    with open(os.path.join(folder, "bake_manifest.json"), "w") as f:
+        json.dump(rows, f, indent=1)
+    with open(os.path.join(folder, "bake_manifest.csv"), "w",
+              newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print_summary(rows)
+
+
+def print_summary(rows, limit=10):
+    by_view = OrderedDict()
+    for r in rows:
+        v = by_view.setdefault(r["view"], [0, 0.0, 0])
+        v[0] += 1
+        v[1] += r["wall"] or 0
+        v[2] += r["queries"] or 0
+
+    print("{0} pages profiled".format(len(rows)))
+    print("slowest views (total seconds, pages, mean queries):")
+    ordered = sorted(by_view.items(), key=lambda x: x[1][1], reverse=True)
+    for name, (count, wall, queries) in ordered[:limit]:
+        print("  {0}: {1:.1f}s, {2}, {3:.0f}".format(
+            name, wall, count, queries / count))
+
+    print("slowest pages:")
+    for r in sorted(rows, key=lambda x: x["wall"] or 0, reverse=True)[:limit]:
+        print("  {0} {1}: {2}s".format(r["view"], r["args"], r["wall"]))
+
+    print("most queries:")
+    for r in sorted(rows, key=lambda x: x["queries"] or 0,
+                    reverse=True)[:limit]:
+        print("  {0} {1}: {2}".format(r["view"], r["args"], r["queries"]))
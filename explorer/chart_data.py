@@ -0,0 +1,66 @@
+"""
+Altair data transformer that moves chart data out of the page
+
+When enabled (EXTERNAL_CHART_DATA in the bake settings) each chart's data
+is written to a json file named by the hash of its contents and the
+vega-lite spec references it by url instead of holding the values inline.
+Charts sharing a dataset (e.g. the grand total charts repeated across the
+label pages) are stored once and can be cached by the browser.
+"""
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+transformer_name = "explorer_hashed_json"
+
+
+def chart_data_folder():
+    return getattr(settings, "CHART_DATA_FOLDER",
+                   os.path.join(settings.MEDIA_ROOT, "chart_data"))
+
+
+def chart_data_url():
+    return settings.MEDIA_URL + "chart_data/"
+
+
+def to_hashed_json(data):
+    """
+    write data to [hash].json (if not already present)
+    and return a url reference for the spec
+    """
+    import altair as alt
+    data = alt.limit_rows(data)
+    values = alt.to_values(data)["values"]
+    content = json.dumps(values, separators=(",", ":"), default=str)
+    content = content.encode("utf-8")
+
+    filename = hashlib.sha1(content).hexdigest()[:20] + ".json"
+    folder = chart_data_folder()
+    path = os.path.join(folder, filename)
+    if os.path.exists(path) is False:
+        if os.path.exists(folder) is False:
+            os.makedirs(folder, exist_ok=True)
+        # write then move so parallel bake workers never see half a file
+        temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+    return {"url": chart_data_url() + filename,
+            "format": {"type": "json"}}
+
+
+@lru_cache(maxsize=None)
+def enable_external_chart_data():
+    """
+    register the transformer and switch to it if the settings ask for it
+    called before the first chart is made
+    """
+    import altair as alt
+    if transformer_name not in alt.data_transformers.names():
+        alt.data_transformers.register(transformer_name, to_hashed_json)
+    if getattr(settings, "EXTERNAL_CHART_DATA", False):
+        alt.data_transformers.enable(transformer_name)
@@ -0,0 +1,88 @@
+"""
+Effect sizes for the comparison sets
+
+With this many reports nearly every table is significant, so p says
+little about which tables matter. update_service computes, for every set
+of a service at once, Cramer's V (chi2 / n scaled by the smaller side of
+the table, 0-1 whatever the size of the data), the bias corrected V
+(Bergsma 2013, less flattering for small sets with many cells) and
+Tschuprow's T. The table dimensions come from one aggregate query over
+the stored units, the rest is array arithmetic on the stored chi2 and
+grand totals.
+
+cramers_v is indexed and orders the sets within a priority on the item
+and grouped analysis pages.
+"""
+from django.db.models import Count
+
+from .models import ComparisonSet, ComparisonUnit
+
+
+def effect_sizes(chi2, n, rows, columns):
+    """
+    arrays of (cramers_v, cramers_v_corrected, tschuprows_t, effect_dof)
+    """
+    import numpy as np
+    chi2 = np.asarray(chi2, dtype=float)
+    n = np.asarray(n, dtype=float)
+    rows = np.asarray(rows, dtype=float)
+    columns = np.asarray(columns, dtype=float)
+
+    effect_dof = np.minimum(rows, columns) - 1
+    valid = (n > 1) & (effect_dof > 0)
+    # placeholders where invalid so nothing divides by zero
+    n = np.where(valid, n, 2)
+    k = np.where(valid, effect_dof, 1)
+
+    phi2 = chi2 / n
+    v = np.sqrt(phi2 / k)
+
+    phi2_corrected = np.maximum(
+        0, phi2 - (rows - 1) * (columns - 1) / (n - 1))
+    rows_corrected = rows - (rows - 1) ** 2 / (n - 1)
+    columns_corrected = columns - (columns - 1) ** 2 / (n - 1)
+    k_corrected = np.minimum(rows_corrected, columns_corrected) - 1
+    k_corrected = np.where(k_corrected > 0, k_corrected, 1)
+    v_corrected = np.sqrt(phi2_corrected / k_corrected)
+
+    t = np.sqrt(phi2 / np.sqrt(np.maximum((rows - 1) * (columns - 1), 1)))
+
+    def clean(x):
+        return np.where(valid, np.nan_to_num(x), 0)
+
+    return (clean(v), clean(v_corrected), clean(t),
+            np.where(valid, effect_dof, 0).astype(int))
+
+
+def update_service(service):
+    """
+    store the effect sizes of every set of the service
+    """
+    sets = list(ComparisonSet.objects.filter(
+        superset__group__service=service).only(
+            "id", "chi2", "grand_total"))
+    if not sets:
+        return 0
+
+    dimensions = ComparisonUnit.objects.filter(parent__in=sets)
+    dimensions = dimensions.values("parent_id").annotate(
+        rows=Count("collection", distinct=True),
+        columns=Count("label_slug", distinct=True))
+    dimensions = {x["parent_id"]: (x["rows"], x["columns"])
+                  for x in dimensions}
+
+    shape = [dimensions.get(x.id, (0, 0)) for x in sets]
+    v, v_corrected, t, effect_dof = effect_sizes(
+        [x.chi2 for x in sets], [x.grand_total or 0 for x in sets],
+        [x[0] for x in shape], [x[1] for x in shape])
+
+    for n, s in enumerate(sets):
+        s.cramers_v = float(v[n])
+        s.cramers_v_corrected = float(v_corrected[n])
+        s.tschuprows_t = float(t[n])
+        s.effect_dof = int(effect_dof[n])
+    ComparisonSet.objects.bulk_update(
+        sets, ["cramers_v", "cramers_v_corrected", "tschuprows_t",
+               "effect_dof"], batch_size=500)
+    print("effect sizes {0}: {1} sets".format(service.slug, len(sets)))
+    return len(sets)
@@ -0,0 +1,221 @@
+"""
+Bulk download of every crosstab cell for a service
+
+Streams the ComparisonUnit rows of a service in long form - one row per
+cell with its set, superset, collection item, label, value, expected
+value, standardised residual and totals - as gzipped CSV or Parquet.
+Rows are read with .iterator() and written out a chunk at a time, so
+memory stays flat however large the service is.
+
+    python manage.py export_service fms --format both
+    /sites/[site]/[service]/download/csv/ (or parquet)
+
+Parquet needs pyarrow.
+"""
+import csv
+import os
+import zlib
+
+from django.http import Http404, StreamingHttpResponse
+
+from .models import ComparisonUnit, Service
+
+
+def load_pyarrow():
+    """
+    pyarrow (with pyarrow.parquet loaded) - imported on first use as it
+    brings numpy, None if not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+# (column, query field, type)
+columns = [("service", "parent__superset__group__service__slug", "str"),
+           ("group", "parent__superset__group__slug", "str"),
+           ("set_id", "parent_id", "int"),
+           ("superset", "parent__superset__slug", "str"),
+           ("superset_name", "parent__superset__name", "str"),
+           ("collection_type", "parent__collectiontype__slug", "str"),
+           ("collection_item", "collection__slug", "str"),
+           ("collection_item_name", "collection__name", "str"),
+           ("label", "label", "str"),
+           ("label_slug", "label_slug", "str"),
+           ("order", "order", "int"),
+           ("value", "value", "float"),
+           ("expected", "expected_value", "float"),
+           ("std_residual", "chi_value", "float"),
+           ("row_total", "row_total", "float"),
+           ("column_total", "column_total", "float"),
+           ("set_grand_total", "parent__grand_total", "float"),
+           ("set_chi2", "parent__chi2", "float"),
+           ("set_p", "parent__p", "float"),
+           ("set_dof", "parent__dof", "float")]
+
+column_names = [x[0] for x in columns]
+
+chunk_size = 5000
+
+
+def unit_rows(service):
+    """
+    tuples in column order, fetched from the database in chunks
+    """
+    query = ComparisonUnit.objects.filter(
+        parent__superset__group__service=service)
+    query = query.order_by("parent_id", "collection_id", "order")
+    query = query.values_list(*[x[1] for x in columns])
+    return query.iterator(chunk_size=chunk_size)
+
+
+class Echo(object):
+    """
+    file-like object csv.writer can write a line to and hand back
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(column_names).encode("utf-8")
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= chunk_size:
+            yield "".join(lines).encode("utf-8")
+            lines = []
+    if lines:
+        yield "".join(lines).encode("utf-8")
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def csv_gz_stream(service):
+    return gzip_stream(csv_lines(unit_rows(service)))
+
+
+class Drain(object):
+    """
+    write-only file for the parquet writer
+    keeps its position but hands on (rather than keeps) what's written
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def take(self):
+        content = b"".join(self.chunks)
+        self.chunks = []
+        return content
+
+
+def parquet_schema(pa):
+    types = {"str": pa.string(), "int": pa.int64(), "float": pa.float64()}
+    return pa.schema([(name, types[kind]) for name, field, kind in columns])
+
+
+def parquet_stream(service, row_group_size=50000):
+    """
+    one row group per batch of rows, yielded as each is written
+    """
+    pa = load_pyarrow()
+    if pa is None:
+        raise ImportError("parquet export needs pyarrow")
+    schema = parquet_schema(pa)
+    drain = Drain()
+    writer = pa.parquet.ParquetWriter(drain, schema, compression="snappy")
+
+    def write(batch):
+        table = pa.Table.from_arrays(
+            [pa.array(list(x), type=schema.field(n).type)
+             for n, x in enumerate(zip(*batch))], schema=schema)
+        writer.write_table(table)
+
+    batch = []
+    for row in unit_rows(service):
+        batch.append(row)
+        if len(batch) >= row_group_size:
+            write(batch)
+            batch = []
+            yield drain.take()
+    if batch:
+        write(batch)
+    writer.close()
+    yield drain.take()
+
+
+formats = {"csv": ("csv.gz", "application/gzip", csv_gz_stream),
+           "parquet": ("parquet", "application/octet-stream",
+                       parquet_stream)}
+
+
+def export_filename(service, format):
+    return "{0}_crosstabs.{1}".format(service.slug, formats[format][0])
+
+
+def write_export(service, format, folder):
+    """
+    stream the export to [folder]/[service]_crosstabs.[ext]
+    """
+    if os.path.exists(folder) is False:
+        os.makedirs(folder)
+    path = os.path.join(folder, export_filename(service, format))
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        for chunk in formats[format][2](service):
+            f.write(chunk)
+    os.replace(temp_path, path)
+    return path
+
+
+def download_view(request, service_slug, format):
+    """
+    streamed download - /[service]/download/[csv|parquet]/
+    """
+    service = Service.objects.filter(slug=service_slug).first()
+    if service is None or format not in formats:
+        raise Http404("No such download")
+    if format == "parquet" and load_pyarrow() is None:
+        raise Http404("Parquet downloads are not available")
+    extension, content_type, stream = formats[format]
+    response = StreamingHttpResponse(stream(service),
+                                     content_type=content_type)
+    response["Content-Disposition"] = 'attachment; filename="{0}"'.format(
+        export_filename(service, format))
+    return response
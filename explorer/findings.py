@@ -0,0 +1,132 @@
+"""
+Service-wide index of notable findings
+
+After populate, rebuild(service) reads every comparison unit of the
+service in one query and picks out, as array operations, the cells that
+are both significant (|standardised residual| > sig_cutoff) and large
+(diff_percent >= large_cutoff) - the ones cell_style colours. These are
+stored as Finding rows sorted by effect (size of the residual, then the
+difference from expected) with a dense rank within each collection type
+and group, and one across all the groups of a collection type.
+
+Pages of the highlights view are rank ranges on an index, so any page
+costs the same to fetch.
+"""
+from .models import (ComparisonUnit, CollectionType, ComparisonGroup,
+                     Finding, large_cutoff, sig_cutoff)
+
+page_size = 50
+
+unit_columns = ["id", "value", "expected_value", "chi_value",
+                "parent__collectiontype_id", "parent__superset__group_id"]
+
+
+def diff_percents(value, expected_value):
+    """
+    ComparisonUnit.diff_percent over arrays
+    """
+    import numpy as np
+    expected = np.trunc(expected_value)
+    difference = np.abs(np.trunc(value - expected))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = np.round(difference / expected * 100, 2)
+    return np.where(expected == 0, 100.0, percent)
+
+
+def notable_units(service):
+    """
+    dataframe of the significant and large cells, in rank order
+    """
+    import numpy as np
+    import pandas as pd
+
+    units = ComparisonUnit.objects.filter(
+        parent__superset__group__service=service)
+    df = pd.DataFrame.from_records(
+        units.values_list(*unit_columns).iterator(chunk_size=20000),
+        columns=["unit_id", "value", "expected_value", "chi_value",
+                 "collectiontype_id", "group_id"])
+    if len(df) == 0:
+        return df
+
+    for c in ["value", "expected_value", "chi_value"]:
+        df[c] = df[c].fillna(0).astype(float)
+    df["diff_percent"] = diff_percents(df["value"].values,
+                                       df["expected_value"].values)
+    df["effect"] = np.abs(df["chi_value"].values)
+
+    notable = (df["effect"] > sig_cutoff) & (
+        df["diff_percent"] >= large_cutoff)
+    df = df[notable]
+    df = df.sort_values(["effect", "diff_percent", "unit_id"],
+                        ascending=[False, False, True])
+    df["rank"] = df.groupby(["collectiontype_id", "group_id"]).cumcount()
+    df["collection_rank"] = df.groupby("collectiontype_id").cumcount()
+    return df
+
+
+def rebuild(service):
+    Finding.objects.filter(service=service).delete()
+    df = notable_units(service)
+    for row in df.itertuples(index=False):
+        Finding(service=service,
+                collectiontype_id=row.collectiontype_id,
+                group_id=row.group_id,
+                unit_id=row.unit_id,
+                chi_value=row.chi_value,
+                diff_percent=row.diff_percent,
+                rank=row.rank,
+                collection_rank=row.collection_rank).queue()
+    Finding.save_queue()
+    print("findings {0}: {1} notable cells".format(service.slug, len(df)))
+    return len(df)
+
+
+def page(collection, group, number):
+    """
+    findings on page [number] (from 1) for a collection type and group
+    group is None for all groups
+    """
+    start = (number - 1) * page_size
+    query = Finding.objects.filter(collectiontype=collection)
+    if group is None:
+        query = query.filter(collection_rank__gte=start,
+                             collection_rank__lt=start + page_size)
+        query = query.order_by("collection_rank")
+    else:
+        query = query.filter(group=group, rank__gte=start,
+                             rank__lt=start + page_size)
+        query = query.order_by("rank")
+    return query.select_related("group", "unit", "unit__collection",
+                                "unit__parent__superset")
+
+
+def has_page(collection, group, number):
+    """
+    does page [number] exist - a lookup on the rank index
+    """
+    start = (number - 1) * page_size
+    query = Finding.objects.filter(collectiontype=collection)
+    if group is None:
+        return query.filter(collection_rank=start).exists()
+    return query.filter(group=group, rank=start).exists()
+
+
+def page_count(collection, group):
+    query = Finding.objects.filter(collectiontype=collection)
+    if group is not None:
+        query = query.filter(group=group)
+    return (query.count() + page_size - 1) // page_size
+
+
+def partitions(service):
+    """
+    (collection type, group slug, pages) for every page of the index
+    """
+    for collection in CollectionType.objects.filter(service=service):
+        groups = [None] + list(ComparisonGroup.objects.filter(
+            service=service).order_by("order"))
+        for group in groups:
+            pages = page_count(collection, group)
+            if pages or group is None:
+                yield collection, group.slug if group else "all", pages
@@ -1,12 +1,15 @@
 import calendar
 import datetime
 import os
-from collections import Counter
+from collections import Counter, OrderedDict
 
 import numpy as np
 import pandas as pd
 from useful_grid import QuickGrid, QuickText
 
+from . import instrument
+from .derived import add_derived_columns
+
 regenerate_processed = False
 
 # store the final product in the project directory
@@ -45,6 +48,7 @@ class CollectionType(object):
     default = False
     stored_labels = None
     require_columns = []
+    derived_columns = []
 
     def __init__(self):
         transitions = ["name",
@@ -112,6 +116,7 @@ class AnalysisType(object):
     verbose_allowed_values = []  # list of nicer namers for the allowed values
     use_passthrough_cross = False
     require_columns = []
+    derived_columns = []
 
     @classmethod
     def check_folders(cls):
@@ -228,14 +233,20 @@ class AnalysisType(object):
         """
         return df
 
-    def get_pickle_for_column(self, column):
+    def pickle_path(self, column):
         """
-        retrieve column from pickle
+        location of the cached copy of a column
         """
         source_file = self.source_file
         filename = os.path.splitext(os.path.basename(source_file))[0]
         filename += "_" + column + ".pickle"
-        pickle_path = os.path.join(self.pickle_folder, filename)
+        return os.path.join(self.pickle_folder, filename)
+
+    def get_pickle_for_column(self, column):
+        """
+        retrieve column from pickle
+        """
+        pickle_path = self.pickle_path(column)
         if os.path.exists(pickle_path):
             return pd.read_pickle(pickle_path)
         else:
@@ -245,13 +256,10 @@ class AnalysisType(object):
         """
         dump column in a pickle to retrieve later
         """
-        source_file = self.source_file
-        filename = os.path.splitext(os.path.basename(source_file))[0]
-        filename += "_" + column + ".pickle"
-        pickle_path = os.path.join(self.pickle_folder, filename)
+        pickle_path = self.pickle_path(column)
         if series is None:
             series = self.source_df[column]
-        print("saving {0} to pickle".format(column))
+        instrument.log("saving {0} to pickle".format(column))
         series.to_pickle(pickle_path)
 
     def source_header(self):
@@ -284,7 +292,7 @@ class AnalysisType(object):
         # clean out any remaining none values, will hopefully be generated in a minute
         remaining = [x[0] for x in existing.items() if x[1] is None]
         for r in remaining:
-            print("column {0} not found".format(r))
+            instrument.log("column {0} not found".format(r))
             del existing[r]
 
         return pd.DataFrame(existing)
@@ -311,33 +319,43 @@ class AnalysisType(object):
             self.collection.require_columns + self.require_columns
 
         core = [self.slug, self.collection.slug]
-        if required_columns:
-            self.source_df = self.prepare_limited_source(
-                required_columns, core)
-        else:
-            self.source_df = self.get_source_df()
-
-        # allow analysis to add columns for use in subsequent steps
-        self.source_df = self.add_columns(self.source_df)
-
-        if self.collection.slug not in self.source_df.columns or regenerate:
-            print("creating collection column")
-            self.create_collection_column()
-            self.column_to_pickle(self.collection.slug)
-
-        if self.slug not in self.source_df.columns or regenerate:
-            print("creating analysis column")
-            self.create_analysis_column()
-            self.column_to_pickle(self.slug)
+        with instrument.span("load columns") as record:
+            if required_columns:
+                self.source_df = self.prepare_limited_source(
+                    required_columns, core)
+            else:
+                self.source_df = self.get_source_df()
+            record["rows"] = len(self.source_df)
+
+        with instrument.span("derive", rows=len(self.source_df)):
+            # shared intermediate columns, cached between runs
+            derived = self.derived_columns + self.collection.derived_columns
+            if derived:
+                self.source_df = add_derived_columns(self, self.source_df,
+                                                     derived)
+
+            # allow analysis to add columns for use in subsequent steps
+            self.source_df = self.add_columns(self.source_df)
+
+            if self.collection.slug not in self.source_df.columns or regenerate:
+                instrument.log("creating collection column")
+                self.create_collection_column()
+                self.column_to_pickle(self.collection.slug)
+
+            if self.slug not in self.source_df.columns or regenerate:
+                instrument.log("creating analysis column")
+                self.create_analysis_column()
+                self.column_to_pickle(self.slug)
 
         # apply restriction at the analysis or collection level
         # need to do it here so we are always loading and saving the full columns
         # apply optional restriction first as it tends to be the largest
         # and the usage can be cached
-        if optional_restriction_function:
-            self.source_df = optional_restriction_function(self.source_df)
-        self.source_df = self.restrict_source_df(self.source_df)
-        self.source_df = self.collection.restrict_source_df(self.source_df)
+        with instrument.span("restrict", rows=len(self.source_df)):
+            if optional_restriction_function:
+                self.source_df = optional_restriction_function(self.source_df)
+            self.source_df = self.restrict_source_df(self.source_df)
+            self.source_df = self.collection.restrict_source_df(self.source_df)
 
         cols = ["id", self.slug, self.collection.slug]
         if "id" not in self.source_df.columns:
@@ -359,13 +377,23 @@ class AnalysisType(object):
         """
         df = self.source_df
         func = self.transform_function()
-        print("creating column: {0}".format(self.slug))
+        instrument.log("creating column: {0}".format(self.slug))
         df[self.slug] = df.apply(func, axis='columns')
 
     def create_cross_table(self):
         """
         create the cross analysis count table
         """
+        with instrument.span("pivot", rows=len(self.processed_df)):
+            final = self.cross_table()
+        with instrument.span("write", rows=len(final)):
+            final.to_csv(self.grid_file_location(), index=False)
+
+    def cross_table(self):
+        """
+        reference crosstab of processed_df - returns the grid
+        alternative engines must match this exactly (see engine_check)
+        """
         banned = [np.nan]
 
         df = self.processed_df.copy(deep=True)
@@ -447,24 +475,47 @@ class AnalysisType(object):
 
         if len(final) == 0:
             raise ValueError("Contains No Data")
-        final.to_csv(self.grid_file_location(), index=False)
+        return final
+
+
+# alternative crosstab engines - name: function(analysis) returning the grid
+cross_table_engines = OrderedDict()
+
+
+def register_cross_table_engine(name):
+    """
+    decorator to add a crosstab engine to compare against cross_table
+    """
+    def inner(func):
+        cross_table_engines[name] = func
+        return func
+    return inner
 
 
 class AnalysisRegister(object):
     """
     register store to access analysis and collection class
+
+    Classes can be registered directly with the register decorator, or
+    described so they are only created when the register is first used:
+    clone_from/clone_options copy another register's classes and functions
+    added with register_factory return further classes to register.
     """
     analysis_stored = None
     collections_stored = None
+    factories = None
+    clone_from = None
+    clone_options = {}
     service = ""
     require_columns = []
 
     @classmethod
     def init_registers(cls):
-        if cls.analysis_stored == None:
-            cls.analysis_stored = list()
-        if cls.collections_stored == None:
-            cls.collections_stored = list()
+        # check the class's own dict so subclassed registers
+        # don't share their parent's lists
+        for attr in ["analysis_stored", "collections_stored", "factories"]:
+            if cls.__dict__.get(attr) is None:
+                setattr(cls, attr, list())
 
     @classmethod
     def register(cls, class_to_register):
@@ -481,6 +532,41 @@ class AnalysisRegister(object):
 
         return class_to_register
 
+    @classmethod
+    def register_factory(cls, factory):
+        """
+        decorator for a function returning classes to register
+        run when the register is first used
+        """
+        cls.init_registers()
+        cls.factories.append(factory)
+        return factory
+
+    @classmethod
+    def build(cls):
+        """
+        create the clones and factory classes - once per process
+        """
+        if cls.__dict__.get("_built"):
+            return
+        cls._built = True
+        cls.init_registers()
+        if cls.clone_from is not None:
+            cls.clone(cls.clone_from, **cls.clone_options)
+        for factory in cls.factories:
+            for c in factory():
+                cls.register(c)
+
+    @classmethod
+    def get_collections(cls):
+        cls.build()
+        return cls.collections_stored
+
+    @classmethod
+    def get_analysis(cls):
+        cls.build()
+        return cls.analysis_stored
+
     @classmethod
     def clone(cls, parent, new_default="", exclude=[], extra=[], include=[], override_properties={}):
         """
@@ -496,7 +582,9 @@ class AnalysisRegister(object):
             if exclude:
                 return name not in exclude
 
-        for c in parent.collections_stored + parent.analysis_stored + extra:
+        parent_classes = parent.get_collections() + parent.get_analysis()
+
+        for c in parent_classes + extra:
             if passes_test(c.__name__):
                 if hasattr(c, "default"):
                     if new_default:
@@ -515,11 +603,12 @@ class AnalysisRegister(object):
                         if default == True:
                             display_in_header = True
 
+                # set on the clone so the parent register is unchanged
                 for k, v in override_properties.items():
                     if hasattr(c, k):
-                        setattr(c, k, v)
+                        setattr(clone, k, v)
 
-                clone.__name__ == c.__name__
+                clone.__name__ = c.__name__
 
                 cls.register(clone)
 
@@ -529,21 +618,19 @@ class AnalysisRegister(object):
     @classmethod
     def run_all(cls, force=False, create_locks=False, regenerate_pickle=False):
 
-        collections = cls.collections_stored
-        analysis = cls.analysis_stored
+        collections = cls.get_collections()
+        analysis = cls.get_analysis()
 
         func = cls().get_restriction_function()
         required_cols = cls.require_columns
 
         total = len(collections) * len(analysis)
-        count = 0
+        progress = instrument.Progress(total, cls.service)
         for c in collections:
-            print("collection: {0}".format(c.slug))
             for a in analysis:
                 a.check_folders()
-                count += 1
+                progress.update(1, "{0} / {1}".format(c.slug, a.slug))
                 if c.slug not in a.exclusions:
-                    print(a.name, "{0}/{1}".format(count, total))
                     combo = a(c)
                     if os.path.exists(combo.final_location) is False or force:
                         partial_loc = combo.final_location + ".partial.txt"
@@ -551,8 +638,13 @@ class AnalysisRegister(object):
                             continue
                         elif create_locks is True:
                             QuickText().save(partial_loc)
-                        a(c).process(func,
-                                     required_cols,
-                                     regenerate=regenerate_pickle)
+                        with instrument.span("combination",
+                                             collection=c.slug,
+                                             analysis=a.slug):
+                            a(c).process(func,
+                                         required_cols,
+                                         regenerate=regenerate_pickle)
                         if os.path.exists(partial_loc):
                             os.remove(partial_loc)
+
+        instrument.write_report("run_all_" + cls.service)
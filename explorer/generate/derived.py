@@ -0,0 +1,172 @@
+"""
+Derived columns shared between analyses
+
+A derived column declares the source columns and lookup files it is made
+from (require_columns may also name other derived columns). Analyses and
+collections list the derived columns they use in derived_columns and
+these are added to the source dataframe in dependency order before the
+collection and analysis columns are created.
+
+Each derived column is computed once per source file and pickled next to
+the column cache with a signature of its inputs (source and lookup file
+modification times, version, and the signatures of derived inputs). If
+any of these change the column is recalculated. Files are written to
+temporary names and moved into place, the signature last, so parallel
+workers can share them.
+"""
+import hashlib
+import json
+import os
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+from . import instrument
+
+join = os.path.join
+
+
+class DerivedColumn(ABC):
+    """
+    column calculated from other columns and lookup files
+    """
+    slug = ""
+    require_columns = []
+    lookup_files = []
+    version = 1
+
+    @abstractmethod
+    def create_column(self, df):
+        """
+        return a series aligned with df
+        """
+
+
+def derived_dependencies(derived):
+    """
+    derived columns this relies on
+    """
+    return [x for x in derived.require_columns
+            if isinstance(x, type) and issubclass(x, DerivedColumn)]
+
+
+def column_names(columns):
+    return [x.slug if isinstance(x, type) else x for x in columns]
+
+
+def topological_order(derived_columns):
+    """
+    derived columns and everything they depend on, inputs first
+    """
+    order = []
+    visiting = []
+
+    def visit(d):
+        if d in order:
+            return
+        if d in visiting:
+            raise ValueError(
+                "circular derived column dependency: {0}".format(d.slug))
+        visiting.append(d)
+        for dependency in derived_dependencies(d):
+            visit(dependency)
+        visiting.remove(d)
+        order.append(d)
+
+    for d in derived_columns:
+        visit(d)
+    return order
+
+
+def file_stamp(path):
+    if os.path.exists(path) is False:
+        return None
+    stat = os.stat(path)
+    return [stat.st_mtime, stat.st_size]
+
+
+class DerivedColumnCache(object):
+    """
+    pickled derived columns for one source file
+    """
+
+    def __init__(self, source_file, pickle_folder):
+        self.source_file = source_file
+        self.pickle_folder = pickle_folder
+        self.signatures = {}
+
+    def path(self, derived):
+        filename = os.path.splitext(os.path.basename(self.source_file))[0]
+        filename += "_derived_" + derived.slug
+        return join(self.pickle_folder, filename + ".pickle")
+
+    def signature(self, derived):
+        if derived not in self.signatures:
+            inputs = {"slug": derived.slug,
+                      "version": derived.version,
+                      "source": file_stamp(self.source_file),
+                      "lookups": [file_stamp(x) for x in derived.lookup_files],
+                      "derived": [self.signature(x)
+                                  for x in derived_dependencies(derived)]}
+            content = json.dumps(inputs, sort_keys=True).encode("utf-8")
+            self.signatures[derived] = hashlib.sha1(content).hexdigest()
+        return self.signatures[derived]
+
+    def is_cached(self, derived):
+        """
+        is there a stored copy matching the current inputs
+        """
+        path = self.path(derived)
+        if os.path.exists(path) is False or os.path.exists(path + ".json") is False:
+            return False
+        with open(path + ".json") as f:
+            stored = json.load(f)
+        return stored.get("signature") == self.signature(derived)
+
+    def get(self, derived):
+        if self.is_cached(derived) is False:
+            return None
+        return pd.read_pickle(self.path(derived))
+
+    def store(self, derived, series):
+        if os.path.exists(self.pickle_folder) is False:
+            os.makedirs(self.pickle_folder, exist_ok=True)
+        path = self.path(derived)
+        temp = "{0}.{1}.tmp".format(path, os.getpid())
+        series.to_pickle(temp)
+        with open(temp + ".json", "w") as f:
+            json.dump({"signature": self.signature(derived)}, f)
+        # the signature goes in last - an old one must never vouch for
+        # a new pickle (or the reverse)
+        try:
+            os.remove(path + ".json")
+        except FileNotFoundError:
+            pass
+        os.replace(temp, path)
+        os.replace(temp + ".json", path + ".json")
+
+
+def add_derived_columns(analysis, df, derived_columns):
+    """
+    add derived_columns (and their dependencies) to df
+    loading from the cache or calculating in dependency order
+    """
+    cache = DerivedColumnCache(analysis.source_file, analysis.pickle_folder)
+    for derived in topological_order(derived_columns):
+        if derived.slug in df.columns:
+            continue
+        series = cache.get(derived)
+        if series is None:
+            inputs = column_names(derived.require_columns)
+            missing = [x for x in inputs if x not in df.columns]
+            if missing:
+                extra = analysis.prepare_limited_source(missing, [])
+                for c in extra.columns:
+                    df[c] = extra[c]
+            instrument.log(
+                "creating derived column: {0}".format(derived.slug))
+            series = derived().create_column(df)
+            series.name = derived.slug
+            cache.store(derived, series)
+        df[derived.slug] = series
+    return df
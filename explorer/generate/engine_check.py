@@ -0,0 +1,149 @@
+"""
+Check alternative crosstab engines against the reference
+
+Engines registered with register_cross_table_engine take an analysis
+with processed_df loaded and return the grid. For each collection and
+analysis combination in a register, the processed dataframe is made once
+and given to the reference AnalysisType.cross_table and to each engine.
+The grids must produce identical csv output - where they don't the
+differing cells are reported. Timings are kept for each engine.
+
+Run against synthetic data with DJANGO_SETTINGS_MODULE set to
+proj.benchmark_settings (see explorer.synthetic).
+"""
+import time
+from collections import OrderedDict
+
+from .base import cross_table_engines
+
+reference_name = "reference"
+
+
+def all_registers():
+    from .fms import fms_register, fms_no_cobrands, year_clones
+    from .wtt import wtt_register, wtt_mp_only, wtt_year_clones
+    from .wdtk import wdtk_register
+    return ([fms_register, fms_no_cobrands] + year_clones +
+            [wtt_register, wtt_mp_only] + wtt_year_clones +
+            [wdtk_register])
+
+
+def find_register(service):
+    for r in all_registers():
+        if r.service == service:
+            return r
+    raise ValueError("no register for service {0}".format(service))
+
+
+def run_engine(func, analysis_class, collection_class, processed):
+    """
+    return (grid or None, error message, seconds)
+    """
+    analysis = analysis_class(collection_class)
+    analysis.processed_df = processed.copy()
+    start = time.perf_counter()
+    try:
+        grid = func(analysis)
+        error = ""
+    except ValueError as e:
+        grid = None
+        error = str(e)
+    return grid, error, time.perf_counter() - start
+
+
+def grid_differences(reference, other, limit=10):
+    """
+    list of human readable differences between two grids
+    """
+    if list(reference.columns) != list(other.columns):
+        return ["columns {0} != {1}".format(list(reference.columns),
+                                            list(other.columns))]
+    if reference.shape != other.shape:
+        return ["shape {0} != {1}".format(reference.shape, other.shape)]
+
+    differences = []
+    ref_values = reference.astype(str).values
+    other_values = other.astype(str).values
+    row_labels = reference.iloc[:, 0].astype(str).values
+    for r in range(ref_values.shape[0]):
+        for c in range(ref_values.shape[1]):
+            if ref_values[r][c] != other_values[r][c]:
+                differences.append("[{0}, {1}] {2!r} != {3!r}".format(
+                    row_labels[r], reference.columns[c],
+                    ref_values[r][c], other_values[r][c]))
+                if len(differences) >= limit:
+                    return differences
+    if not differences:
+        # values match as strings, but the written csv doesn't
+        differences.append("csv output differs (dtype or formatting)")
+    return differences
+
+
+def compare_grids(reference, reference_error, grid, error):
+    if reference is None or grid is None:
+        if reference_error == error:
+            return []
+        return ["error {0!r} != {1!r}".format(reference_error, error)]
+    if reference.to_csv(index=False) == grid.to_csv(index=False):
+        return []
+    return grid_differences(reference, grid)
+
+
+def check_register(register, engines=None, limit=None):
+    """
+    run reference and engines over each combination in register
+    returns summary dict of timings and mismatches
+    """
+    engines = OrderedDict((x, cross_table_engines[x])
+                          for x in (engines or cross_table_engines.keys()))
+    funcs = OrderedDict([(reference_name, lambda a: a.cross_table())])
+    funcs.update(engines)
+
+    timings = {x: 0.0 for x in funcs}
+    mismatches = {x: 0 for x in engines}
+    checked = 0
+
+    func = register().get_restriction_function()
+    for c in register.get_collections():
+        for a in register.get_analysis():
+            if c.slug in a.exclusions or a.use_passthrough_cross:
+                continue
+            if limit and checked >= limit:
+                break
+            combo = a(c)
+            combo.check_folders()
+            combo.created_processed(func, register.require_columns)
+            processed = combo.processed_df
+            checked += 1
+
+            results = {}
+            for name, engine in funcs.items():
+                results[name] = run_engine(engine, a, c, processed)
+                timings[name] += results[name][2]
+
+            reference, reference_error, _ = results[reference_name]
+            for name in engines:
+                grid, error, _ = results[name]
+                for d in compare_grids(reference, reference_error,
+                                       grid, error):
+                    mismatches[name] += 1
+                    print("{0} {1}/{2} {3}: {4}".format(
+                        register.service, c.slug, a.slug, name, d))
+
+    return {"service": register.service,
+            "checked": checked,
+            "timings": timings,
+            "mismatches": mismatches}
+
+
+def print_summary(summary):
+    print("{0}: {1} grids checked".format(summary["service"],
+                                          summary["checked"]))
+    reference_time = summary["timings"][reference_name]
+    for name, seconds in summary["timings"].items():
+        line = "  {0:<20} {1:>8.2f}s".format(name, seconds)
+        if name != reference_name:
+            if seconds:
+                line += " ({0:.1f}x)".format(reference_time / seconds)
+            line += " {0} mismatches".format(summary["mismatches"][name])
+        print(line)
@@ -9,7 +9,10 @@ from django.conf import settings
 from useful_grid import QuickGrid
 
 from .base import AnalysisRegister, AnalysisType, CollectionType
+from . import instrument
 from .funcs import md5_hash
+from .derived import DerivedColumn
+from .id_index import IdAttribute, IdAttributeIndex
 
 join = os.path.join
 
@@ -85,6 +88,31 @@ class FMSAnalysis(AnalysisType):
     source_file = os.path.join(source_folder, "merged_points_whole_years.csv")
 
 
+def fixed_by_council(df):
+    return df[df["state"] == "fixed - council"]
+
+
+def reported_before(df):
+    return df[df["ever_reported"] == 0]
+
+
+id_source = settings.FMS_EXPLORER_SOURCE
+
+# id keyed attributes, looked up by row rather than isin/merge on each run
+id_index = IdAttributeIndex(
+    FMSAnalysis.source_file, FMSAnalysis.pickle_folder, [
+        IdAttribute("photo", join(id_source, "photo_ids.csv")),
+        IdAttribute("fixed", join(id_source, "fixed_ids.csv")),
+        IdAttribute("fixed_council", join(id_source, "fixed_ids.csv"),
+                    restrict=fixed_by_council),
+        IdAttribute("survey", join(id_source, "survey_response.csv")),
+        IdAttribute("reported_before", join(id_source, "survey_response.csv"),
+                    restrict=reported_before),
+        IdAttribute("service", join(id_source, "service_ids.csv"),
+                    value_column="service", labels=["desktop", "Open311"]),
+    ])
+
+
 @fms_register.register
 class RepeatUse(FMSCollection):
     name = "Repeat use"
@@ -112,11 +140,8 @@ class RepeatUse(FMSCollection):
 
     def create_collection_column(self, df):
 
-        survey_responses = pd.read_csv(
-            join(settings.FMS_EXPLORER_SOURCE, "survey_response.csv"))
-
         df[self.slug] = "No"
-        df.loc[df["id"].isin(survey_responses["id"]), self.slug] = "Yes"
+        df.loc[id_index.flag("survey", df), self.slug] = "Yes"
 
         return df
 
@@ -209,16 +234,8 @@ class ReportedFixed(FMSCollection):
 
     def create_collection_column(self, df):
 
-        if self.__class__.lookup == None:
-            fi = pd.read_csv(join(self.source_folder, "fixed_ids.csv"))
-            ids = fi["id"]
-            lookup = set(ids)
-            self.__class__.lookup = lookup
-        else:
-            lookup = self.__class__.lookup
-
         df[self.slug] = "Not Reported Fixed"
-        df.loc[df["id"].isin(ids), self.slug] = "Reported Fixed"
+        df.loc[id_index.flag("fixed", df), self.slug] = "Reported Fixed"
 
         return df
 
@@ -242,16 +259,8 @@ class ReportedFixedCouncil(FMSCollection):
 
     def create_collection_column(self, df):
 
-        if self.__class__.lookup is None:
-            fi = pd.read_csv(join(self.source_folder, "fixed_ids.csv"))
-            ids = fi["id"][fi["state"] == "fixed - council"]
-            lookup = set(ids)
-            self.__class__.lookup = lookup
-        else:
-            lookup = self.__class__.lookup
-
         df[self.slug] = "No"
-        df.loc[df["id"].isin(lookup), self.slug] = "Yes"
+        df.loc[id_index.flag("fixed_council", df), self.slug] = "Yes"
 
         return df
 
@@ -295,12 +304,11 @@ class MethodCollection(FMSCollection):
 
     def create_collection_column(self, df):
 
-        lookup = pd.read_csv(join(self.source_folder, "service_ids.csv"))
-        df = df.merge(lookup, on="id", how="left")
+        service = id_index.values("service", df)
         df[self.slug] = "Mobile"
-        df.loc[(df["service"] == "desktop"), self.slug] = "Desktop"
-        df.loc[(df["service"] == "Open311"), self.slug] = "Open311"
-        df.loc[(df["service"].isnull()), self.slug] = "Unclear"
+        df.loc[service == 1, self.slug] = "Desktop"
+        df.loc[service == 2, self.slug] = "Open311"
+        df.loc[service == 0, self.slug] = "Unclear"
 
         return df
 
@@ -329,7 +337,7 @@ class Gender(FMSAnalysis):
     def create_analysis_column(self):
         df = self.source_df
         func = self.transform_function()
-        print("creating column: {0}".format(self.slug))
+        instrument.log("creating column: {0}".format(self.slug))
         df[self.slug] = df["derived_gender"]
 
 
@@ -352,13 +360,11 @@ class MethodAnalysis(FMSAnalysis):
     def create_analysis_column(self):
 
         df = self.source_df
-        lookup = pd.read_csv(join(self.source_folder, "service_ids.csv"))
-        df = df.merge(lookup, on="id", how="left")
+        service = id_index.values("service", df)
         df[self.slug] = "Mobile"
-        df.loc[(df["service"] == "desktop"), self.slug] = "Desktop"
-        df.loc[(df["service"] == "Open311"), self.slug] = "Open311"
-        df.loc[(df["service"].isnull()), self.slug] = "Unclear"
-        self.source_df = df
+        df.loc[service == 1, self.slug] = "Desktop"
+        df.loc[service == 2, self.slug] = "Open311"
+        df.loc[service == 0, self.slug] = "Unclear"
 
 
 
@@ -372,31 +378,19 @@ class Survey(FMSAnalysis):
     group = "Characteristics"
     require_columns = ["id"]
 
-    def add_columns(self, df):
+    def restrict_source_df(self, df):
         """
-        restrict to survey answers only and append
+        restrict to survey answers only
         """
-        survey_responses = pd.read_csv(
-            join(settings.FMS_EXPLORER_SOURCE, "survey_response.csv"))
-
-        ids = set(survey_responses["id"])
-        lookup = survey_responses.set_index("id")["ever_reported"].to_dict()
-
-        df["ever_reported"] = df["id"].map(lookup)
-
-        self.stored_ids = ids
-
-        return df
-
-    def restrict_source_df(self, df):
-        df = df[df["id"].isin(self.stored_ids)]
+        df = df[id_index.flag("survey", df)]
         return df
 
     def create_analysis_column(self):
 
         df = self.source_df
         df[self.slug] = "First Report"
-        df.loc[df["ever_reported"] == 0, self.slug] = "Reported Before"
+        df.loc[id_index.flag("reported_before", df),
+               self.slug] = "Reported Before"
 
 
 @ fms_register.register
@@ -407,25 +401,12 @@ class Photo(FMSAnalysis):
     h_label = "Photo submitted"
     description = "FixMyStreet allows photos of problems to be uploaded. This variable covers if a report has an attached photo."
     group = "Characteristics"
-    lookup = None
     require_columns = ["id"]
 
-    def get_lookup(self):
-        """
-        get photo lookup
-        """
-        if self.__class__.lookup == None:
-            lookup = pd.read_csv(
-                join(settings.FMS_EXPLORER_SOURCE, "photo_ids.csv"))
-            ids = set(lookup["id"])
-            self.__class__.lookup = ids
-        return self.__class__.lookup
-
     def create_analysis_column(self):
         df = self.source_df
-        lookup = self.get_lookup()
         df[self.slug] = "No Photo"
-        df.loc[df["id"].isin(lookup), self.slug] = "Photo"
+        df.loc[id_index.flag("photo", df), self.slug] = "Photo"
 
 
 @ fms_register.register
@@ -440,24 +421,11 @@ class FixedAnalysis(FMSAnalysis):
                    "in different contexts can still be useful.")
     group = "Characteristics"
     exclusions = ["status", "status-council"]
-    lookup = None
-
-    def get_lookup(self):
-        """
-        get photo lookup
-        """
-        if self.__class__.lookup == None:
-            lookup = pd.read_csv(
-                join(settings.FMS_EXPLORER_SOURCE, "fixed_ids.csv"))
-            ids = set(lookup["id"])
-            self.__class__.lookup = ids
-        return self.__class__.lookup
 
     def create_analysis_column(self):
         df = self.source_df
-        lookup = self.get_lookup()
         df[self.slug] = "Not Reported Fixed"
-        df.loc[df["id"].isin(lookup), self.slug] = "Reported Fixed"
+        df.loc[id_index.flag("fixed", df), self.slug] = "Reported Fixed"
 
 
 class TimeAnalysis(FMSAnalysis):
@@ -470,7 +438,7 @@ class TimeAnalysis(FMSAnalysis):
         add column based on time
         """
         df = self.source_df
-        print("creating column: {0}".format(self.slug))
+        instrument.log("creating column: {0}".format(self.slug))
         dt = pd.to_datetime(df['created'], format='%Y-%m-%d %H:%M:%S.%f')
         df[self.slug] = getattr(dt.dt, self.__class__.time_part)
 
@@ -597,6 +565,20 @@ class Ruc(FMSAnalysis):
         df[self.slug] = df["lsoa"].map(repeat)
 
 
+class ReportsByUser(DerivedColumn):
+    """
+    number of reports made by the user who made this report
+    """
+    slug = "reports_by_user"
+    require_columns = ["id"]
+    lookup_files = [join(settings.FMS_EXPLORER_SOURCE, "first_report.csv")]
+
+    def create_column(self, df):
+        repeat = pd.read_csv(self.lookup_files[0])
+        repeat = repeat.set_index("id")["user_count"].to_dict()
+        return df["id"].map(repeat)
+
+
 @ fms_register.register
 class UserCount(FMSAnalysis):
     name = "User activity"
@@ -609,21 +591,18 @@ class UserCount(FMSAnalysis):
                       "21-50 Reports",
                       "50+ Reports"]
     require_columns = ["id"]
+    derived_columns = [ReportsByUser]
 
     def create_analysis_column(self):
 
         df = self.source_df
-        repeat = pd.read_csv(
-            join(settings.FMS_EXPLORER_SOURCE, "first_report.csv"))
-        repeat = repeat.set_index("id")["user_count"].to_dict()
-
-        df["user_count"] = df["id"].map(repeat)
+        count = df[ReportsByUser.slug]
 
         conditions = [
-            (df['user_count'] == 1),
-            (df['user_count'] > 1) & (df['user_count'] <= 20),
-            (df['user_count'] > 20) & (df['user_count'] <= 50),
-            (df['user_count'] > 50)
+            (count == 1),
+            (count > 1) & (count <= 20),
+            (count > 20) & (count <= 50),
+            (count > 50)
         ]
 
         values = ["One Report", "2-20 Reports", "21-50 Reports", "50+ Reports"]
@@ -651,164 +630,188 @@ class DensityDeciles(FMSAnalysis):
 # generate seperate classes for each w_imd
 
 
-for i in welsh_imds:
-    nice_i = i.replace("_", " ").replace("-", " ").title()
-
-    class GenericWIMD(FMSAnalysis):
-        if i == "wimd":
-            overview = True
-            name = "Reports by Welsh index of multiple deprivation"
-            slug = i
-            priority = 1
-            h_label = "WIMD deciles"
-        else:
-            overview = False
-            name = f"Reports by {nice_i.lower()} deprivation subdomain (Wales)"
-            slug = "w_" + i
-            h_label = f"{nice_i} deciles"
-        exclusions = ["cobrand"]
-
-        description = "Reports sorted by the decile rank in against the Welsh Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
-        group = "Welsh IMD"
-        column = i
-        allowed_values = [x for x in range(1, 11)]
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", "wimd2019.csv"))
-            imd = imd[:-2]
-            # convert score to index
-            imd[self.__class__.column] = (
-                imd[self.__class__.column] / (1909 / 10)) + 1
-            imd[self.__class__.column] = imd[self.__class__.column].apply(
-                np.floor)
-            imd[self.__class__.column] = imd[self.__class__.column].astype(
-                "int")
-            index_lookup = imd.set_index(
-                "lsoa")[self.__class__.column].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericWIMD.__name__ == GenericWIMD.slug
-    fms_register.register(GenericWIMD)
-
-for i in english_imds:
-
-    class GenericEIMD(FMSAnalysis):
-        if i == "imd":
-            overview = True
-            name = "Reports by English index of multiple deprivation"
-            slug = i
-            priority = 2
-            h_label = "IMD deciles"
-        else:
-            overview = False
-            name = "Reports by " + \
-                english_name(i).lower() + \
-                " deprivation (England)"
-            slug = "e_" + i
-            h_label = "{0} deciles".format(english_name(i))
-        column = i
-        exclusions = ["cobrand"]
-        group = "English IMD"
-        unit = "Deprivation decile"
-        description = "Reports sorted by the decile rank in against the English Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
-        allowed_values = [x for x in range(1, 11)]
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", "imd2019.csv"))
-            index_lookup = imd.set_index(
-                "lsoa")[self.__class__.column + "_decile"].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericEIMD.__name__ == GenericEIMD.slug
-    fms_register.register(GenericEIMD)
-
-
-for i in uk_imds:
-
-    nice_i = i.replace("_", " ").replace("-", " ").title()
-
-    class GenericUKIMD(FMSAnalysis):
-        if i == "UK_IMD_E":
-            overview = True
-            name = "Reports by composite UK index of multiple deprivation"
-            priority = 3
-        if i == "GB_IMD_E":
-            overview = False
-            name = "Reports by composite GB index of multiple deprivation"
-            priority = 2
-        slug = i
-        column = i
-        exclusions = ["cobrand"]
-        h_label = "Composite UK deprivation deciles"
-        group = "UK IMD"
-        allowed_values = [x for x in range(1, 11)]
-        description = "Reports sorted by the decile rank in against the composite Index of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure. This measure excludes NI."
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(
-                join(self.lookup_folder, "imd", f"{self.slug}.csv"))
-            index_lookup = imd.set_index(
-                "lsoa")[self.slug + "_pop_decile"].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericUKIMD.__name__ = GenericUKIMD.slug
-    fms_register.register(GenericUKIMD)
-
-for i in scottish_imds:
-
-    nice_i = i.replace("_", " ").replace("-", " ").title()
-
-    class GenericSIMD(FMSAnalysis):
-        if i == "simd":
-            overview = True
-            name = "Reports by Scottish index of multiple deprivation"
+@fms_register.register_factory
+def welsh_imd_analyses():
+    """
+    one analysis class for each Welsh deprivation measure
+    """
+    for i in welsh_imds:
+        nice_i = i.replace("_", " ").replace("-", " ").title()
+
+        class GenericWIMD(FMSAnalysis):
+            if i == "wimd":
+                overview = True
+                name = "Reports by Welsh index of multiple deprivation"
+                slug = i
+                priority = 1
+                h_label = "WIMD deciles"
+            else:
+                overview = False
+                name = f"Reports by {nice_i.lower()} deprivation subdomain (Wales)"
+                slug = "w_" + i
+                h_label = f"{nice_i} deciles"
+            exclusions = ["cobrand"]
+
+            description = "Reports sorted by the decile rank in against the Welsh Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
+            group = "Welsh IMD"
+            column = i
+            allowed_values = [x for x in range(1, 11)]
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", "wimd2019.csv"))
+                imd = imd[:-2]
+                # convert score to index
+                imd[self.__class__.column] = (
+                    imd[self.__class__.column] / (1909 / 10)) + 1
+                imd[self.__class__.column] = imd[self.__class__.column].apply(
+                    np.floor)
+                imd[self.__class__.column] = imd[self.__class__.column].astype(
+                    "int")
+                index_lookup = imd.set_index(
+                    "lsoa")[self.__class__.column].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericWIMD.__name__ == GenericWIMD.slug
+        yield GenericWIMD
+
+
+@fms_register.register_factory
+def english_imd_analyses():
+    """
+    one analysis class for each English deprivation measure
+    """
+    for i in english_imds:
+
+        class GenericEIMD(FMSAnalysis):
+            if i == "imd":
+                overview = True
+                name = "Reports by English index of multiple deprivation"
+                slug = i
+                priority = 2
+                h_label = "IMD deciles"
+            else:
+                overview = False
+                name = "Reports by " + \
+                    english_name(i).lower() + \
+                    " deprivation (England)"
+                slug = "e_" + i
+                h_label = "{0} deciles".format(english_name(i))
+            column = i
+            exclusions = ["cobrand"]
+            group = "English IMD"
+            unit = "Deprivation decile"
+            description = "Reports sorted by the decile rank in against the English Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
+            allowed_values = [x for x in range(1, 11)]
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", "imd2019.csv"))
+                index_lookup = imd.set_index(
+                    "lsoa")[self.__class__.column + "_decile"].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericEIMD.__name__ == GenericEIMD.slug
+        yield GenericEIMD
+
+
+@fms_register.register_factory
+def uk_imd_analyses():
+    """
+    one analysis class for each composite UK deprivation measure
+    """
+    for i in uk_imds:
+
+        nice_i = i.replace("_", " ").replace("-", " ").title()
+
+        class GenericUKIMD(FMSAnalysis):
+            if i == "UK_IMD_E":
+                overview = True
+                name = "Reports by composite UK index of multiple deprivation"
+                priority = 3
+            if i == "GB_IMD_E":
+                overview = False
+                name = "Reports by composite GB index of multiple deprivation"
+                priority = 2
             slug = i
-            priority = 1
-            h_label = "SIMD Deciles"
-        else:
-            overview = False
-            name = "Reports by " + \
-                nice_i.lower() + \
-                " deprivation subdomain (Scotland)"
-            slug = "s_" + i
-            h_label = "{0} deciles".format(nice_i)
-        column = i
-        exclusions = ["cobrand"]
-        description = "Reports sorted by the decile rank in against the Scottish Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
-        group = "Scottish IMD"
-        unit = "Deprivation decile"
-        allowed_values = [x for x in range(1, 11)]
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", "simd2020.csv"))
-            # convert score to index
-            imd[self.__class__.column] = (
-                imd[self.__class__.column] / (6976 / 10)) + 1
-            imd[self.__class__.column] = imd[self.__class__.column].apply(
-                np.floor)
-            index_lookup = imd.set_index(
-                "lsoa")[self.__class__.column].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericSIMD.__name__ == GenericSIMD.slug
-    fms_register.register(GenericSIMD)
+            column = i
+            exclusions = ["cobrand"]
+            h_label = "Composite UK deprivation deciles"
+            group = "UK IMD"
+            allowed_values = [x for x in range(1, 11)]
+            description = "Reports sorted by the decile rank in against the composite Index of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure. This measure excludes NI."
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(
+                    join(self.lookup_folder, "imd", f"{self.slug}.csv"))
+                index_lookup = imd.set_index(
+                    "lsoa")[self.slug + "_pop_decile"].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericUKIMD.__name__ = GenericUKIMD.slug
+        yield GenericUKIMD
+
+
+@fms_register.register_factory
+def scottish_imd_analyses():
+    """
+    one analysis class for each Scottish deprivation measure
+    """
+    for i in scottish_imds:
+
+        nice_i = i.replace("_", " ").replace("-", " ").title()
+
+        class GenericSIMD(FMSAnalysis):
+            if i == "simd":
+                overview = True
+                name = "Reports by Scottish index of multiple deprivation"
+                slug = i
+                priority = 1
+                h_label = "SIMD Deciles"
+            else:
+                overview = False
+                name = "Reports by " + \
+                    nice_i.lower() + \
+                    " deprivation subdomain (Scotland)"
+                slug = "s_" + i
+                h_label = "{0} deciles".format(nice_i)
+            column = i
+            exclusions = ["cobrand"]
+            description = "Reports sorted by the decile rank in against the Scottish Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
+            group = "Scottish IMD"
+            unit = "Deprivation decile"
+            allowed_values = [x for x in range(1, 11)]
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", "simd2020.csv"))
+                # convert score to index
+                imd[self.__class__.column] = (
+                    imd[self.__class__.column] / (6976 / 10)) + 1
+                imd[self.__class__.column] = imd[self.__class__.column].apply(
+                    np.floor)
+                index_lookup = imd.set_index(
+                    "lsoa")[self.__class__.column].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericSIMD.__name__ == GenericSIMD.slug
+        yield GenericSIMD
 
 
 class fms_no_cobrands(AnalysisRegister):
     service = "fms-no-cobrands"
     require_columns = ["cobrand"]
+    clone_from = fms_register
+    clone_options = {"exclude": ["CobrandCollection"]}
 
     def get_restriction_function(self):
 
@@ -820,10 +823,6 @@ class fms_no_cobrands(AnalysisRegister):
         return inner
 
 
-fms_no_cobrands.clone(fms_register, exclude=[
-                      "CobrandCollection"])
-
-
 class fms_base_year(AnalysisRegister):
     """
     Create a class for records restrainted to a single year 
@@ -866,10 +865,10 @@ for y in years:
         """.format(y)
         service = name
         year = str(y)
+        clone_from = fms_register
+        clone_options = {"exclude": ["YearCollection", "Year"]}
 
     fms_year.__name__ == name
-    fms_year.clone(fms_register, exclude=[
-        "YearCollection", "Year"])
 
     year_clones.append(fms_year)
 
@@ -0,0 +1,170 @@
+"""
+Index of id keyed attributes for a source file
+
+Several analyses and collections depend on whether a report's id appears
+in a separate file (photos, fixed reports, survey responses) or on a value
+looked up by id (reporting service). Rather than each one reading the
+file and running isin/merge over the full source, the index makes one
+pass over the source ids and stores a small code per row for each
+attribute, saved alongside the pickled column cache.
+
+The source ids are stored with the arrays and values for a (possibly
+restricted or reindexed) dataframe are looked up by its id column with
+a binary search over the sorted ids.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import instrument
+
+join = os.path.join
+
+
+class IdAttribute(object):
+    """
+    attribute of a source row held in an id keyed file
+
+    Without a value_column this is a flag - 1 if the id is present.
+    With a value_column, codes are 0 for missing/null, 1..n for the
+    values in labels and n + 1 for any other value.
+    """
+    def __init__(self, slug, lookup_file, id_column="id", value_column="",
+                 labels=[], restrict=None):
+        self.slug = slug
+        self.lookup_file = lookup_file
+        self.id_column = id_column
+        self.value_column = value_column
+        self.labels = list(labels)
+        self.restrict = restrict
+
+    def load_lookup(self):
+        df = pd.read_csv(self.lookup_file)
+        if self.restrict:
+            df = self.restrict(df)
+        return df
+
+    def encode(self, ids):
+        """
+        return int8 array of codes aligned to ids
+        """
+        lookup = self.load_lookup()
+        if not self.value_column:
+            return np.isin(ids, lookup[self.id_column].values).astype(np.int8)
+
+        lookup = lookup.drop_duplicates(self.id_column)
+        positions = pd.Index(lookup[self.id_column]).get_indexer(ids)
+        values = lookup[self.value_column]
+        value_codes = np.full(len(values), len(self.labels) + 1, np.int8)
+        for n, label in enumerate(self.labels):
+            value_codes[(values == label).values] = n + 1
+        value_codes[values.isnull().values] = 0
+
+        codes = np.zeros(len(ids), np.int8)
+        found = positions >= 0
+        codes[found] = value_codes[positions[found]]
+        return codes
+
+
+class IdAttributeIndex(object):
+    """
+    aligned code arrays for a group of IdAttributes over one source file
+    built on first use, rebuilt if the source or a lookup file changes
+    """
+
+    ids_key = "_ids"
+
+    def __init__(self, source_file, pickle_folder, attributes,
+                 id_column="id"):
+        self.source_file = source_file
+        self.pickle_folder = pickle_folder
+        self.attributes = {x.slug: x for x in attributes}
+        self.id_column = id_column
+        self._arrays = None
+        self._sorted = None
+
+    @property
+    def index_path(self):
+        filename = os.path.splitext(os.path.basename(self.source_file))[0]
+        return join(self.pickle_folder, filename + "_id_index.npz")
+
+    def load_ids(self):
+        """
+        source ids - from the column pickle if present
+        """
+        filename = os.path.splitext(os.path.basename(self.source_file))[0]
+        pickle_path = join(self.pickle_folder, filename + "_id.pickle")
+        if os.path.exists(pickle_path):
+            return pd.read_pickle(pickle_path).values
+        return pd.read_csv(self.source_file, usecols=["id"])["id"].values
+
+    def is_stale(self):
+        path = self.index_path
+        if os.path.exists(path) is False:
+            return True
+        built = os.path.getmtime(path)
+        files = [self.source_file] + [x.lookup_file
+                                      for x in self.attributes.values()]
+        return any(os.path.exists(x) and os.path.getmtime(x) > built
+                   for x in files)
+
+    def build(self):
+        instrument.log("building id attribute index")
+        ids = self.load_ids()
+        arrays = {slug: attribute.encode(ids)
+                  for slug, attribute in self.attributes.items()}
+        arrays[self.ids_key] = ids
+        if os.path.exists(self.pickle_folder) is False:
+            os.makedirs(self.pickle_folder)
+        temp_path = self.index_path + ".tmp.npz"
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, self.index_path)
+        return arrays
+
+    def arrays(self):
+        if self._arrays is None:
+            arrays = None
+            if self.is_stale() is False:
+                with np.load(self.index_path) as stored:
+                    arrays = {x: stored[x] for x in stored.files}
+                expected = set(self.attributes) | {self.ids_key}
+                if set(arrays) != expected:
+                    arrays = None
+            if arrays is None:
+                arrays = self.build()
+            self._arrays = arrays
+        return self._arrays
+
+    def sorted_ids(self):
+        """
+        (sorted source ids, source position of each)
+        """
+        if self._sorted is None:
+            ids = self.arrays()[self.ids_key]
+            order = np.argsort(ids, kind="mergesort")
+            self._sorted = (ids[order], order)
+        return self._sorted
+
+    def values(self, slug, df):
+        """
+        codes for slug aligned with the rows of df, by id
+        ids not in the source get 0
+        """
+        ids, order = self.sorted_ids()
+        wanted = df[self.id_column].values
+        found = np.zeros(len(wanted), bool)
+        positions = np.zeros(len(wanted), np.int64)
+        if len(ids):
+            found_at = np.searchsorted(ids, wanted).clip(0, len(ids) - 1)
+            found = ids[found_at] == wanted
+            positions = order[found_at]
+        codes = np.zeros(len(wanted), np.int8)
+        codes[found] = self.arrays()[slug][positions[found]]
+        return codes
+
+    def flag(self, slug, df):
+        """
+        boolean mask for a flag attribute aligned with df
+        """
+        return self.values(slug, df) == 1
@@ -0,0 +1,215 @@
+"""
+Timing, memory and progress reporting for run_all and populate
+
+Stages of the generation (load columns, derive, restrict, pivot, write)
+and of populate (collection items, db insert, label generation) are
+wrapped in spans that record wall time, rows processed and the change
+in peak RSS (and tracemalloc peak if enabled). A progress line with an
+ETA is printed as combinations complete and a JSON report summarising
+each stage is written to [report_folder]/[run name].json at the end of
+a run. Messages go through log() so they don't break the progress line.
+
+    from explorer.generate import instrument
+    instrument.configure(profile_folder="profiles", tracemalloc=True)
+
+With a profile_folder, each stage is run under cProfile and the stats
+for all spans of that stage are dumped to [run name]_[stage].prof.
+"""
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc as tm
+from collections import OrderedDict
+from contextlib import contextmanager
+
+join = os.path.join
+
+options = {"report_folder": join("benchmarks", "reports"),
+           "profile_folder": None,
+           "tracemalloc": False}
+
+_spans = []
+_stack = []
+_profiles = {}
+_profiling = []
+# progress line currently drawn on stderr
+_progress = []
+
+
+def configure(report_folder=None, profile_folder=None, tracemalloc=None):
+    if report_folder is not None:
+        options["report_folder"] = report_folder
+    if profile_folder is not None:
+        options["profile_folder"] = profile_folder
+    if tracemalloc is not None:
+        options["tracemalloc"] = tracemalloc
+        if tracemalloc and tm.is_tracing() is False:
+            tm.start()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+@contextmanager
+def span(stage, rows=None, **meta):
+    """
+    time a stage - yields a dict rows can be set on once known
+    """
+    record = OrderedDict([("stage", stage),
+                          ("path", "/".join([x["stage"] for x in _stack] +
+                                            [stage]))])
+    record.update(meta)
+    record["rows"] = rows
+    _stack.append(record)
+
+    # only one profiler can be active - pause the outer stage's
+    profiler = None
+    if options["profile_folder"]:
+        profiler = _profiles.setdefault(stage, cProfile.Profile())
+        if _profiling:
+            _profiling[-1].disable()
+        _profiling.append(profiler)
+        profiler.enable()
+
+    tracing = options["tracemalloc"] and tm.is_tracing()
+    if tracing:
+        traced_start = tm.get_traced_memory()[0]
+        if hasattr(tm, "reset_peak"):
+            tm.reset_peak()
+    rss_start = peak_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["wall"] = round(time.perf_counter() - start, 4)
+        record["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        record["rss_growth_mb"] = round(record["peak_rss_mb"] - rss_start, 1)
+        if tracing:
+            current, peak = tm.get_traced_memory()
+            record["traced_mb"] = round((current - traced_start) / 1048576, 2)
+            record["traced_peak_mb"] = round((peak - traced_start) / 1048576,
+                                             2)
+        if profiler:
+            profiler.disable()
+            _profiling.pop()
+            if _profiling:
+                _profiling[-1].enable()
+        _stack.pop()
+        _spans.append(record)
+
+
+class Progress(object):
+    """
+    progress line with ETA for a known number of steps
+    """
+
+    def __init__(self, total, label=""):
+        self.total = total
+        self.label = label
+        self.count = 0
+        self.start = time.perf_counter()
+        self.interactive = sys.stderr.isatty()
+        self.line = ""
+
+    def eta(self):
+        if self.count == 0:
+            return "--:--"
+        elapsed = time.perf_counter() - self.start
+        remaining = elapsed / self.count * (self.total - self.count)
+        minutes, seconds = divmod(int(remaining), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            return "{0}h{1:02d}m".format(hours, minutes)
+        return "{0:02d}:{1:02d}".format(minutes, seconds)
+
+    def update(self, step=1, description=""):
+        self.count += step
+        width = 30
+        filled = int(width * self.count / self.total) if self.total else width
+        line = "{0} [{1}{2}] {3}/{4} ETA {5} {6}".format(
+            self.label, "#" * filled, " " * (width - filled),
+            self.count, self.total, self.eta(), description)
+        if self.interactive:
+            self.line = line[:150].ljust(150)
+            sys.stderr.write("\r" + self.line)
+            del _progress[:]
+            if self.count >= self.total:
+                sys.stderr.write("\n")
+            else:
+                _progress.append(self)
+            sys.stderr.flush()
+        else:
+            print(line)
+
+
+def log(message):
+    """
+    print a message, clearing and redrawing any progress line
+    """
+    if _progress:
+        sys.stderr.write("\r" + " " * 150 + "\r")
+        sys.stderr.flush()
+    print(message)
+    sys.stdout.flush()
+    if _progress:
+        sys.stderr.write("\r" + _progress[-1].line)
+        sys.stderr.flush()
+
+
+def summary():
+    """
+    totals per stage
+    """
+    stages = OrderedDict()
+    for s in _spans:
+        stage = stages.setdefault(s["stage"], OrderedDict([
+            ("count", 0), ("wall", 0.0), ("rows", 0),
+            ("max_rss_growth_mb", 0.0), ("peak_rss_mb", 0.0)]))
+        stage["count"] += 1
+        stage["wall"] = round(stage["wall"] + s["wall"], 4)
+        stage["rows"] += s["rows"] or 0
+        stage["max_rss_growth_mb"] = max(stage["max_rss_growth_mb"],
+                                         s["rss_growth_mb"])
+        stage["peak_rss_mb"] = max(stage["peak_rss_mb"], s["peak_rss_mb"])
+    return stages
+
+
+def write_report(name):
+    """
+    write the JSON report and any profiles, then start afresh
+    """
+    stages = summary()
+    report = OrderedDict([("name", name),
+                          ("stages", stages),
+                          ("spans", list(_spans))])
+    folder = options["report_folder"]
+    if folder:
+        if os.path.exists(folder) is False:
+            os.makedirs(folder)
+        path = join(folder, name + ".json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1, default=str)
+        print("timing report written to {0}".format(path))
+
+    folder = options["profile_folder"]
+    if folder and _profiles:
+        if os.path.exists(folder) is False:
+            os.makedirs(folder)
+        for stage, profiler in _profiles.items():
+            filename = "{0}_{1}.prof".format(name, stage.replace(" ", "_"))
+            profiler.dump_stats(join(folder, filename))
+        print("profiles written to {0}".format(folder))
+
+    for stage, values in stages.items():
+        print("  {0:<20} {1:>5} x {2:>9.2f}s {3:>12} rows {4:>8.1f}MB".format(
+            stage, values["count"], values["wall"], values["rows"],
+            values["peak_rss_mb"]))
+
+    del _spans[:]
+    _profiles.clear()
+    return report
@@ -0,0 +1,223 @@
+"""
+Plan a generation run without running it
+
+Walks the registers and, for each collection x analysis combination,
+checks whether the grid already exists and which of the columns it
+needs are already in the column cache. Source row counts come from the
+cached id column where there is one (otherwise the file is counted).
+
+Time and memory are estimated from earlier runs: the per combination
+spans in benchmarks/reports (see instrument) give seconds per source
+row, falling back to the benchmark results (see generate_benchmark)
+scaled by row count.
+"""
+import json
+import os
+from collections import OrderedDict
+
+from .derived import DerivedColumnCache, topological_order
+
+join = os.path.join
+
+reports_folder = join("benchmarks", "reports")
+results_file = join("benchmarks", "results.jsonl")
+
+_row_counts = {}
+
+
+def count_rows(analysis):
+    """
+    rows in the source file - from the id pickle if cached
+    """
+    source_file = analysis.source_file
+    if source_file in _row_counts:
+        return _row_counts[source_file]
+    rows = None
+    pickle_path = analysis.pickle_path("id")
+    if os.path.exists(pickle_path):
+        import pandas as pd
+        rows = len(pd.read_pickle(pickle_path))
+    elif os.path.exists(source_file):
+        rows = -1  # header
+        with open(source_file, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                rows += block.count(b"\n")
+    _row_counts[source_file] = rows
+    return rows
+
+
+def combination_columns(register, collection, analysis):
+    """
+    (source columns, created columns, derived columns) a combination needs
+    """
+    required = (register.require_columns + collection.require_columns +
+                analysis.require_columns)
+    created = [analysis.slug, collection.slug]
+    derived = topological_order(analysis.derived_columns +
+                                collection.derived_columns)
+    return list(OrderedDict.fromkeys(required)), created, derived
+
+
+def plan_register(register, force=False, seen_columns=None):
+    """
+    one row per combination with pending status and cache use
+    """
+    if seen_columns is None:
+        seen_columns = set()
+    rows = []
+    for c in register.get_collections():
+        for a in register.get_analysis():
+            if c.slug in a.exclusions:
+                continue
+            combo = a(c)
+            exists = os.path.exists(combo.final_location)
+            pending = force or exists is False
+            source_columns, created, derived = combination_columns(
+                register, c, a)
+            hits = []
+            misses = []
+            if pending:
+                cache = DerivedColumnCache(a.source_file, a.pickle_folder)
+                for column in source_columns + created:
+                    key = (a.source_file, column)
+                    cached = os.path.exists(combo.pickle_path(column))
+                    # a column read or created by an earlier combination
+                    # will be cached by the time this one runs
+                    if cached or key in seen_columns:
+                        hits.append(column)
+                    else:
+                        misses.append(column)
+                    seen_columns.add(key)
+                for d in derived:
+                    key = (a.source_file, "derived_" + d.slug)
+                    if cache.is_cached(d) or key in seen_columns:
+                        hits.append(d.slug)
+                    else:
+                        misses.append(d.slug)
+                    seen_columns.add(key)
+            rows.append({"service": register.service,
+                         "collection": c.slug,
+                         "analysis": a.slug,
+                         "pending": pending,
+                         "rows": count_rows(combo),
+                         "cache_hits": hits,
+                         "cache_misses": misses})
+    return rows
+
+
+def load_report_rates():
+    """
+    service -> (seconds per source row per combination, peak mb, rows)
+    from the latest run_all reports
+    """
+    rates = {}
+    if os.path.exists(reports_folder) is False:
+        return rates
+    for filename in os.listdir(reports_folder):
+        if filename.startswith("run_all_") is False:
+            continue
+        with open(join(reports_folder, filename)) as f:
+            report = json.load(f)
+        spans = report.get("spans", [])
+        wall = sum(x["wall"] for x in spans if x["stage"] == "combination")
+        loaded = [x["rows"] for x in spans
+                  if x["stage"] == "load columns" and x["rows"]]
+        if wall and loaded:
+            peak = max(x["peak_rss_mb"] for x in spans)
+            rates[filename[len("run_all_"):-len(".json")]] = (
+                wall / sum(loaded), peak, max(loaded))
+    return rates
+
+
+def load_benchmark_rates(plan):
+    """
+    service -> (seconds per source row per combination, peak mb, rows)
+    from the most recent benchmark of each service
+    """
+    rates = {}
+    if os.path.exists(results_file) is False:
+        return rates
+    combos = {}
+    for row in plan:
+        combos[row["service"]] = combos.get(row["service"], 0) + 1
+    with open(results_file) as f:
+        results = [json.loads(x) for x in f if x.strip()]
+    for result in results:
+        for stage in result["stages"]:
+            if stage["stage"].startswith("run_all ") is False:
+                continue
+            service = stage["stage"][len("run_all "):]
+            if service not in combos or not result["rows"]:
+                continue
+            per_row = stage["seconds"] / (result["rows"] * combos[service])
+            rates[service] = (per_row, stage["peak_mb"], result["rows"])
+    return rates
+
+
+def estimate(plan):
+    """
+    add estimated seconds and memory to each pending row
+    """
+    rates = load_benchmark_rates(plan)
+    rates.update(load_report_rates())
+    for row in plan:
+        row["seconds"] = None
+        row["memory_mb"] = None
+        rate = rates.get(row["service"])
+        if row["pending"] and rate and row["rows"]:
+            per_row, peak, measured_rows = rate
+            row["seconds"] = per_row * row["rows"]
+            row["memory_mb"] = peak * row["rows"] / float(measured_rows)
+    return plan
+
+
+def make_plan(registers, force=False):
+    seen_columns = set()
+    plan = []
+    for register in registers:
+        plan += plan_register(register, force, seen_columns)
+    return estimate(plan)
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0}:{1:02d}:{2:02d}".format(hours, minutes, seconds)
+
+
+def print_plan(plan, verbose=False):
+    services = OrderedDict()
+    for row in plan:
+        services.setdefault(row["service"], []).append(row)
+
+    header = "{0:<18} {1:>7} {2:>8} {3:>11} {4:>6} {5:>7} {6:>10} {7:>9}"
+    print(header.format("service", "combos", "pending", "rows",
+                        "hits", "misses", "est time", "est mb"))
+    total_seconds = 0
+    unknown = False
+    for service, rows in services.items():
+        pending = [x for x in rows if x["pending"]]
+        seconds = [x["seconds"] for x in pending]
+        if None in seconds and pending:
+            unknown = True
+        service_seconds = sum(x for x in seconds if x)
+        total_seconds += service_seconds
+        memory = max([x["memory_mb"] or 0 for x in pending] or [0])
+        print(header.format(
+            service, len(rows), len(pending),
+            rows[0]["rows"] if rows[0]["rows"] is not None else "?",
+            sum(len(x["cache_hits"]) for x in pending),
+            sum(len(x["cache_misses"]) for x in pending),
+            format_seconds(service_seconds) if pending else "-",
+            "{0:.0f}".format(memory) if memory else "?"))
+        if verbose:
+            for x in pending:
+                print("    {0} / {1}  misses: {2}".format(
+                    x["collection"], x["analysis"],
+                    ", ".join(x["cache_misses"]) or "-"))
+    print("total pending: {0} of {1} combinations, estimated {2}{3}".format(
+        len([x for x in plan if x["pending"]]), len(plan),
+        format_seconds(total_seconds),
+        " (no timings for some services)" if unknown else ""))
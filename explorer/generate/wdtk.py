@@ -3,18 +3,78 @@ import os
 from collections import Counter
 from useful_grid import QuickGrid
 from .base import AnalysisRegister, AnalysisType, CollectionType
+from . import instrument
+from .derived import DerivedColumn
 from .funcs import md5_hash
 import calendar
 
 import pandas as pd
 from proj import settings
 from functools import lru_cache
+import numpy as np
 # when re-running this, fix the absolute references below
 current_year = settings.WDTK_CURRENT_YEAR
 
 join = os.path.join
 
 
+class Question(object):
+    """
+    answers to one survey question, ordered by answer code
+    "please select" placeholders and non numeric codes are dropped
+    and the first label for a repeated code is kept
+    """
+
+    def __init__(self, qid, rows):
+        self.qid = qid
+        answers = {}
+        listed = []
+        for code, label in rows:
+            if "select" in label or code.lstrip("-").isdigit() is False:
+                continue
+            if code not in answers:
+                answers[code] = label
+                listed.append(label)
+        self.listed_labels = listed  # in file order
+        self.codes = sorted(answers, key=int)
+        self.labels = [answers[x] for x in self.codes]
+        self.lookup = {x: answers[x] for x in self.codes}
+        self.code_array = np.array([int(x) for x in self.codes], dtype=int)
+        self.label_array = np.array(self.labels + [np.nan], dtype=object)
+
+    def map(self, series):
+        """
+        answer codes to labels in one take - unknown codes become nan
+        """
+        codes = pd.to_numeric(series, errors="coerce").to_numpy()
+        position = np.searchsorted(self.code_array, codes)
+        position = np.clip(position, 0, max(len(self.codes) - 1, 0))
+        if len(self.codes):
+            found = self.code_array.take(position) == codes
+        else:
+            found = np.zeros(len(codes), dtype=bool)
+        # the extra last label is the missing value
+        position[~found] = len(self.codes)
+        return pd.Series(self.label_array.take(position), index=series.index)
+
+
+class Codebook(object):
+    """
+    survey_lookup.csv compiled into questions indexed by qid
+    """
+
+    def __init__(self, rows):
+        grouped = {}
+        for x in rows:
+            grouped.setdefault(x["qid"], []).append((x["aid"], x["aname"]))
+        self.questions = {k: Question(k, v) for k, v in grouped.items()}
+
+    def __getitem__(self, qid):
+        if qid not in self.questions:
+            self.questions[qid] = Question(qid, [])
+        return self.questions[qid]
+
+
 @lru_cache(maxsize=None)
 def get_value_lookup():
     lookup_folder = os.path.join("resources", "wdtk")
@@ -23,6 +83,11 @@ def get_value_lookup():
     return df
 
 
+@lru_cache(maxsize=None)
+def get_codebook():
+    return Codebook(get_value_lookup())
+
+
 class wdtk_register(AnalysisRegister):
     service = "wdtk"
 
@@ -32,19 +97,11 @@ class WDTKCollection(CollectionType):
     lookup_value = ""
 
     def label_lookup(self):
-        df = get_value_lookup()
-        items = [x for x in df if x["qid"] == self.__class__.lookup_value]
-        items = [x for x in items if "select" not in x["aname"]]
-        return {x["aid"]: x["aname"] for x in items}
+        return dict(get_codebook()[self.__class__.lookup_value].lookup)
 
     def get_labels(self):
-        df = get_value_lookup()
-        items = [x["aname"]
-                 for x in df if x["qid"] == self.__class__.lookup_value]
-        items = [x for x in items if "select" not in x]
-        items = [[x, None] for x in items]
-
-        return items
+        question = get_codebook()[self.__class__.lookup_value]
+        return [[x, None] for x in question.listed_labels]
 
 
 class WDTKAnalysis(AnalysisType):
@@ -58,36 +115,10 @@ class WDTKAnalysis(AnalysisType):
     create_analysis = False
 
     def load_verbose_allowed_values(self):
-
-        df = get_value_lookup()
-
-        items = [x for x in df if x["qid"] ==
-                 self.slug and "select" not in x["aname"]]
-        items.sort(key=lambda x: int(x["aid"]))
-        done = []
-        final = []
-        for i in items:
-            if i["aid"] not in done:
-                final.append(i["aname"])
-                done.append(i["aid"])
-
-        return final
+        return list(get_codebook()[self.slug].labels)
 
     def load_allowed_values(self):
-
-        df = get_value_lookup()
-
-        items = [x for x in df if x["qid"] ==
-                 self.slug and "select" not in x["aname"]]
-        items.sort(key=lambda x: int(x["aid"]))
-        done = []
-        final = []
-        for i in items:
-            if i["aid"] not in done:
-                final.append(i["aid"])
-                done.append(i["aid"])
-
-        return final
+        return list(get_codebook()[self.slug].codes)
 
     def create_analysis_column(self):
         """
@@ -223,6 +254,19 @@ class Ethnicity(WDTKAnalysis):
     description = "Ethnicity of sender as declared in survey."
 
 
+class EthnicityName(DerivedColumn):
+    """
+    ethnicity answer code converted to its label
+    """
+    slug = "ethnicity_name"
+    require_columns = ["ethnicity"]
+    lookup_files = [join("resources", "wdtk", "survey_lookup.csv")]
+    version = 2
+
+    def create_column(self, df):
+        return get_codebook()["ethnicity"].map(df["ethnicity"])
+
+
 @wdtk_register.register
 class BAME(WDTKAnalysis):
     name = "Requests by Ethnicity (grouped)"
@@ -232,6 +276,7 @@ class BAME(WDTKAnalysis):
     description = "Grouped ethnicity of sender as declared in survey."
     create_analysis = True
     require_columns = ["ethnicity"]
+    derived_columns = [EthnicityName]
 
     def create_analysis_column(self):
 
@@ -248,18 +293,13 @@ class BAME(WDTKAnalysis):
         na = ["Don't know",
               "Don't want to answer"]
 
-        vdf = get_value_lookup()
-
-        items = [x for x in vdf if x["qid"] ==
-                 "ethnicity" and "select" not in x["aname"]]
-        items.sort(key=lambda x: int(x["aid"]))
-        lookup = {x["aid"]: x["aname"] for x in items}
-
-        df["ethnicity"] = df["ethnicity"].map(lookup)
+        # use the derived name column rather than rewriting the shared
+        # ethnicity column in place
+        ethnicity = df[EthnicityName.slug]
 
         df[self.slug] = "Ethnic minority (excluding white minorities)"
-        df.loc[df["ethnicity"].isin(white), self.slug] = "White ethnicities"
-        df.loc[df["ethnicity"].isin(na), self.slug] = "NA"
+        df.loc[ethnicity.isin(white), self.slug] = "White ethnicities"
+        df.loc[ethnicity.isin(na), self.slug] = "NA"
 
         return df
 
@@ -334,7 +374,7 @@ class TimeAnalysis(WDTKAnalysis):
         add column based on time
         """
         df = self.source_df
-        print("creating column: {0}".format(self.slug))
+        instrument.log("creating column: {0}".format(self.slug))
         dt = pd.to_datetime(df['whenstored'], format='%d/%m/%Y')
         df[self.slug] = getattr(dt.dt, self.__class__.time_part)
 
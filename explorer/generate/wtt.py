@@ -8,6 +8,7 @@ from django.conf import settings
 from useful_grid import QuickGrid
 
 from .base import AnalysisRegister, AnalysisType, CollectionType
+from . import instrument
 from .funcs import md5_hash
 
 try:
@@ -406,7 +407,7 @@ class TimeAnalysis(WTTAnalysis):
         add column based on time
         """
         df = self.source_df
-        print("creating column: {0}".format(self.slug))
+        instrument.log("creating column: {0}".format(self.slug))
         dt = pd.to_datetime(df['to_timestamp'], format='%Y-%m-%d %H:%M:%S.%f')
         df[self.slug] = getattr(dt.dt, self.__class__.time_part)
 
@@ -538,157 +539,180 @@ class DensityDeciles(WTTAnalysis):
         df[self.slug] = df["lsoa"].map(index_lookup)
 
 
-for i in welsh_imds:
-    # generate seperate classes for each w_imd
+@wtt_register.register_factory
+def welsh_imd_analyses():
+    """
+    one analysis class for each Welsh deprivation measure
+    """
+    for i in welsh_imds:
+        # generate seperate classes for each w_imd
+
+        nice_i = i.replace("_", " ").replace("-", " ").title()
+
+        class GenericWIMD(WTTAnalysis):
+            if i == "wimd":
+                overview = True
+                name = "Messages by Welsh index of multiple deprivation"
+                slug = i
+                h_label = "WIMD deciles"
+                priority = 1
+            else:
+                overview = False
+                name = "Messages by " + \
+                    nice_i.lower() + \
+                    " deprivation subdomain (Wales)"
+                slug = "w_" + i
+                h_label = "{0} deciles".format(nice_i)
+            exclusions = ["mp_gender"]
+            group = "Welsh IMD"
+            column = i
+            allowed_values = [x for x in range(1, 11)]
+            description = "Reports sorted by the decile rank in against the Welsh Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", "wimd2019.csv"))
+                imd = imd[:-2]
+                # convert score to index
+                imd[self.__class__.column] = (
+                    imd[self.__class__.column] / (1909 / 10)) + 1
+                imd[self.__class__.column] = imd[self.__class__.column].apply(
+                    np.floor)
+                imd[self.__class__.column] = imd[self.__class__.column].astype(
+                    "int")
+                index_lookup = imd.set_index(
+                    "lsoa")[self.__class__.column].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericWIMD.__name__ = GenericWIMD.slug
+        yield GenericWIMD
+
+
+@wtt_register.register_factory
+def english_imd_analyses():
+    """
+    one analysis class for each English deprivation measure
+    """
+    for i in english_imds:
 
-    nice_i = i.replace("_", " ").replace("-", " ").title()
+        nice_i = i.replace("_", " ").replace("-", " ").title()
 
-    class GenericWIMD(WTTAnalysis):
-        if i == "wimd":
-            overview = True
-            name = "Messages by Welsh index of multiple deprivation"
-            slug = i
-            h_label = "WIMD deciles"
-            priority = 1
-        else:
-            overview = False
-            name = "Messages by " + \
-                nice_i.lower() + \
-                " deprivation subdomain (Wales)"
-            slug = "w_" + i
-            h_label = "{0} deciles".format(nice_i)
-        exclusions = ["mp_gender"]
-        group = "Welsh IMD"
-        column = i
-        allowed_values = [x for x in range(1, 11)]
-        description = "Reports sorted by the decile rank in against the Welsh Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", "wimd2019.csv"))
-            imd = imd[:-2]
-            # convert score to index
-            imd[self.__class__.column] = (
-                imd[self.__class__.column] / (1909 / 10)) + 1
-            imd[self.__class__.column] = imd[self.__class__.column].apply(
-                np.floor)
-            imd[self.__class__.column] = imd[self.__class__.column].astype(
-                "int")
-            index_lookup = imd.set_index(
-                "lsoa")[self.__class__.column].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericWIMD.__name__ = GenericWIMD.slug
-    wtt_register.register(GenericWIMD)
-
-for i in english_imds:
-
-    nice_i = i.replace("_", " ").replace("-", " ").title()
-
-    class GenericEIMD(WTTAnalysis):
-        if i == "imd":
-            overview = True
-            name = "Messages by English index of multiple deprivation"
-            slug = i
-            h_label = "IMD deciles"
-            priority = 2
-        else:
-            overview = False
-            name = "Messages by " + \
-                english_name(nice_i).lower() + \
-                " deprivation subdomain (England)"
-            slug = "e_" + i
-            h_label = "{0} deciles".format(nice_i)
-        column = i
-        exclusions = ["mp_gender"]
-        group = "English IMD"
-        allowed_values = [x for x in range(1, 11)]
-        description = "Reports sorted by the decile rank in against the English Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", "imd2019.csv"))
-            index_lookup = imd.set_index(
-                "lsoa")[self.__class__.column + "_decile"].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericEIMD.__name__ = GenericEIMD.slug
-    wtt_register.register(GenericEIMD)
-
-for i in uk_imds:
-
-    class GenericUKIMD(WTTAnalysis):
-        if i == "UK_IMD_E":
-            overview = True
-            name = "Messages by composite UK index of multiple deprivation"
-            priority = 3
-        if i == "GB_IMD_E":
-            overview = False
-            name = "Messages by composite GB index of multiple deprivation"
-            priority = 2
-        slug = i
-        column = i
-        exclusions = ["mp_gender"]
-        h_label = "Composite UK deprivation deciles"
-        group = "UK IMD"
-        allowed_values = [x for x in range(1, 11)]
-        description = "Reports sorted by the decile rank in against the composite Index of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure. This measure excludes NI."
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", f"{self.slug}.csv"))
-            index_lookup = imd.set_index(
-                "lsoa")[f"{self.slug}_pop_decile"].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericUKIMD.__name__ = GenericUKIMD.slug
-    wtt_register.register(GenericUKIMD)
-
-for i in scottish_imds:
-
-    nice_i = i.replace("_", " ").replace("-", " ").title()
-
-    class GenericSIMD(WTTAnalysis):
-        if i == "simd":
-            overview = True
-            name = "Messages by Scottish index of multiple deprivation"
+        class GenericEIMD(WTTAnalysis):
+            if i == "imd":
+                overview = True
+                name = "Messages by English index of multiple deprivation"
+                slug = i
+                h_label = "IMD deciles"
+                priority = 2
+            else:
+                overview = False
+                name = "Messages by " + \
+                    english_name(nice_i).lower() + \
+                    " deprivation subdomain (England)"
+                slug = "e_" + i
+                h_label = "{0} deciles".format(nice_i)
+            column = i
+            exclusions = ["mp_gender"]
+            group = "English IMD"
+            allowed_values = [x for x in range(1, 11)]
+            description = "Reports sorted by the decile rank in against the English Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", "imd2019.csv"))
+                index_lookup = imd.set_index(
+                    "lsoa")[self.__class__.column + "_decile"].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericEIMD.__name__ = GenericEIMD.slug
+        yield GenericEIMD
+
+
+@wtt_register.register_factory
+def uk_imd_analyses():
+    """
+    one analysis class for each composite UK deprivation measure
+    """
+    for i in uk_imds:
+
+        class GenericUKIMD(WTTAnalysis):
+            if i == "UK_IMD_E":
+                overview = True
+                name = "Messages by composite UK index of multiple deprivation"
+                priority = 3
+            if i == "GB_IMD_E":
+                overview = False
+                name = "Messages by composite GB index of multiple deprivation"
+                priority = 2
             slug = i
-            h_label = "SIMD deciles"
-            priority = 1
-        else:
-            overview = False
-            name = "Messages by " + \
-                nice_i.lower() + \
-                " deprivation subdomain (Scotland)"
-            slug = "s_" + i
-            h_label = "{0} deciles".format(nice_i)
-        column = i
-        exclusions = ["mp_gender"]
-        group = "Scottish IMD"
-        allowed_values = [x for x in range(1, 11)]
-        description = "Reports sorted by the decile rank in against the English Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
-        require_columns = ["lsoa"]
-
-        def create_analysis_column(self):
-
-            df = self.source_df
-            imd = pd.read_csv(join(self.lookup_folder, "imd", "simd2020.csv"))
-            # convert score to index
-            imd[self.__class__.column] = (
-                imd[self.__class__.column] / (6976 / 10)) + 1
-            imd[self.__class__.column] = imd[self.__class__.column].apply(
-                np.floor)
-            index_lookup = imd.set_index(
-                "lsoa")[self.__class__.column].to_dict()
-            df[self.slug] = df["lsoa"].map(index_lookup)
-
-    GenericSIMD.__name__ = GenericSIMD.slug
-    wtt_register.register(GenericSIMD)
+            column = i
+            exclusions = ["mp_gender"]
+            h_label = "Composite UK deprivation deciles"
+            group = "UK IMD"
+            allowed_values = [x for x in range(1, 11)]
+            description = "Reports sorted by the decile rank in against the composite Index of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure. This measure excludes NI."
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", f"{self.slug}.csv"))
+                index_lookup = imd.set_index(
+                    "lsoa")[f"{self.slug}_pop_decile"].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericUKIMD.__name__ = GenericUKIMD.slug
+        yield GenericUKIMD
+
+
+@wtt_register.register_factory
+def scottish_imd_analyses():
+    """
+    one analysis class for each Scottish deprivation measure
+    """
+    for i in scottish_imds:
+
+        nice_i = i.replace("_", " ").replace("-", " ").title()
+
+        class GenericSIMD(WTTAnalysis):
+            if i == "simd":
+                overview = True
+                name = "Messages by Scottish index of multiple deprivation"
+                slug = i
+                h_label = "SIMD deciles"
+                priority = 1
+            else:
+                overview = False
+                name = "Messages by " + \
+                    nice_i.lower() + \
+                    " deprivation subdomain (Scotland)"
+                slug = "s_" + i
+                h_label = "{0} deciles".format(nice_i)
+            column = i
+            exclusions = ["mp_gender"]
+            group = "Scottish IMD"
+            allowed_values = [x for x in range(1, 11)]
+            description = "Reports sorted by the decile rank in against the English Indices of Multiple Deprivation of the LSOA a report was made in.\n Lower deciles are more deprived, while higher deciles are better off on this measure."
+            require_columns = ["lsoa"]
+
+            def create_analysis_column(self):
+
+                df = self.source_df
+                imd = pd.read_csv(join(self.lookup_folder, "imd", "simd2020.csv"))
+                # convert score to index
+                imd[self.__class__.column] = (
+                    imd[self.__class__.column] / (6976 / 10)) + 1
+                imd[self.__class__.column] = imd[self.__class__.column].apply(
+                    np.floor)
+                index_lookup = imd.set_index(
+                    "lsoa")[self.__class__.column].to_dict()
+                df[self.slug] = df["lsoa"].map(index_lookup)
+
+        GenericSIMD.__name__ = GenericSIMD.slug
+        yield GenericSIMD
 
 
 class wtt_subset(AnalysisRegister):
@@ -743,25 +767,30 @@ for y in range(2019, current_year + 1):
     class indiv_year(wtt_year_base):
         service = "wtt_{0}".format(y)
         year = y
+        clone_from = wtt_register
+        clone_options = {"exclude": ["YearCollection", "Year"]}
 
     indiv_year.__name__ == indiv_year.service
 
-    indiv_year.clone(wtt_register, exclude=[
-        "YearCollection", "Year"])
     wtt_year_clones.append(indiv_year)
 
 
 class wtt_mp_only(wtt_subset):
     service = "wtt-mp"
     allowed = ["WMC"]
+    clone_from = wtt_register
+    clone_options = {"exclude": ["RecipientCollection", "RecipientGender"]}
 
 
-wtt_mp_only.clone(wtt_register, exclude=[
-                  "RecipientCollection", "RecipientGender"])
-
 # need to set a new default collection
 
 
-@wtt_mp_only.register
-class MpRecipientGender(RecipientGender):
-    default = True
+@wtt_mp_only.register_factory
+def mp_collections():
+    """
+    MP version of the gender collection - registered after the clone
+    """
+    class MpRecipientGender(RecipientGender):
+        default = True
+
+    return [MpRecipientGender]
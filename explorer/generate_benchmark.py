@@ -0,0 +1,234 @@
+"""
+End to end benchmark of the generation and populate steps
+
+Writes synthetic sources at a given scale (see explorer.synthetic) and then,
+for each service using proj.benchmark_settings, times every register's
+run_all and populate step. Each stage runs in a fresh interpreter, so the
+peak memory recorded is that stage's own. Results are appended to
+benchmarks/results.jsonl with the current commit so runs can be compared.
+The run_all reports of the synthetic runs go to benchmarks/synthetic_reports
+so they don't replace the reports of real runs the planner reads.
+
+    invoke benchmark --scale 1m --service fms
+    python -m explorer.generate_benchmark 100k all
+
+Grids are written to the synthetic source folders rather than resources/.
+"""
+import datetime
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from functools import partial
+
+join = os.path.join
+
+services = ["fms", "wtt", "wdtk"]
+result_marker = "BENCHMARK_RESULT "
+results_file = join("benchmarks", "results.jsonl")
+reports_folder = join("benchmarks", "synthetic_reports")
+synthetic_root = join("_sources", "synthetic")
+
+
+def peak_memory_mb():
+    # ru_maxrss is in kilobytes on linux - the peak of the whole process,
+    # hence a process per stage
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def service_stages(service):
+    """
+    (stage name, function) in the order populate runs them
+    """
+    from . import populate as p
+
+    if service == "fms":
+        from .generate.fms import fms_register, fms_no_cobrands, year_clones
+        registers = [fms_register, fms_no_cobrands] + year_clones
+        populate = [("fms", p.populate_fms_plain),
+                    ("fms-no-cobrands", p.populate_fms_no_cobrand)]
+        populate += [(y.service, partial(p.populate_fms_year, y))
+                     for y in year_clones]
+    elif service == "wtt":
+        from .generate.wtt import wtt_register, wtt_mp_only, wtt_year_clones
+        registers = [wtt_register, wtt_mp_only] + wtt_year_clones
+        populate = [("wtt", p.populate_wtt),
+                    ("wtt-mp", p.populate_wtt_sub_groups)]
+        populate += [(y.service, partial(p.populate_wtt_year, y))
+                     for y in wtt_year_clones]
+    elif service == "wdtk":
+        from .generate.wdtk import wdtk_register
+        registers = [wdtk_register]
+        populate = [("wdtk", p.populate_wdtk)]
+    else:
+        raise ValueError("unknown service: {0}".format(service))
+
+    stages = [("run_all " + r.service, partial(r.run_all, force=True))
+              for r in registers]
+    stages += [("populate " + name, func) for name, func in populate]
+    return stages
+
+
+def setup_worker(service, keep_cache=False):
+    """
+    run inside the benchmark settings - clear caches and migrate
+    """
+    from django.conf import settings
+    from django.core.management import call_command
+
+    source = getattr(settings, service.upper() + "_EXPLORER_SOURCE")
+    pickle_folder = join(source, "pickle")
+    if keep_cache is False and os.path.exists(pickle_folder):
+        shutil.rmtree(pickle_folder)
+    call_command("migrate", verbosity=0)
+
+
+def run_worker(service, stage):
+    """
+    run inside the benchmark settings - time one stage of a service
+    returns None once past the last stage
+    """
+    from .generate import base, instrument
+
+    base.store_in_demographics_folder = False
+    instrument.configure(report_folder=reports_folder)
+
+    stages = service_stages(service)
+    if stage >= len(stages):
+        return None
+    name, func = stages[stage]
+    start = time.perf_counter()
+    func()
+    return {"stage": name,
+            "seconds": round(time.perf_counter() - start, 3),
+            "peak_mb": round(peak_memory_mb(), 1)}
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            universal_newlines=True).strip()
+    except Exception:
+        return ""
+
+
+def run_child(service, source, arguments):
+    """
+    run the worker in a fresh interpreter - returns its result
+    """
+    env = dict(os.environ)
+    env["DJANGO_SETTINGS_MODULE"] = "proj.benchmark_settings"
+    env["BENCHMARK_SOURCE"] = source
+    command = [sys.executable, "-m", "explorer.generate_benchmark",
+               "--worker", service] + arguments
+    result = subprocess.run(command, env=env, stdout=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError("benchmark of {0} failed".format(service))
+    for line in result.stdout.splitlines():
+        if line.startswith(result_marker):
+            return json.loads(line[len(result_marker):])
+    raise RuntimeError("no result from {0} benchmark".format(service))
+
+
+def run_service(service, source, keep_cache=False):
+    """
+    time each stage of a service, a process per stage
+    """
+    setup = ["--setup"] + (["--keep-cache"] if keep_cache else [])
+    run_child(service, source, setup)
+    stages = []
+    while True:
+        stage = run_child(service, source, ["--stage", str(len(stages))])
+        if stage is None:
+            return stages
+        stages.append(stage)
+
+
+def load_results():
+    if os.path.exists(results_file) is False:
+        return []
+    with open(results_file) as f:
+        return [json.loads(x) for x in f if x.strip()]
+
+
+def store_result(result):
+    folder = os.path.dirname(results_file)
+    if os.path.exists(folder) is False:
+        os.makedirs(folder)
+    with open(results_file, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+def print_comparison(result, previous=None):
+    before = {}
+    if previous:
+        before = {x["stage"]: x for x in previous["stages"]}
+        print("{0} {1} ({2}) vs {3}".format(
+            result["service"], result["scale"], result["commit"],
+            previous["commit"]))
+    else:
+        print("{0} {1} ({2})".format(
+            result["service"], result["scale"], result["commit"]))
+    for stage in result["stages"]:
+        line = "  {0:<35} {1:>9.2f}s {2:>9.1f}MB".format(
+            stage["stage"], stage["seconds"], stage["peak_mb"])
+        if stage["stage"] in before:
+            line += "  (was {0:.2f}s {1:.1f}MB)".format(
+                before[stage["stage"]]["seconds"],
+                before[stage["stage"]]["peak_mb"])
+        print(line)
+
+
+def benchmark(scale="100k", service="all", keep_cache=False,
+              regenerate=False):
+    """
+    write synthetic data if needed and benchmark each service
+    """
+    from .synthetic import scale_rows, write_all
+
+    run_services = services if service == "all" else [service]
+    source = os.path.abspath(join(synthetic_root, scale))
+
+    for s in run_services:
+        if regenerate or os.path.exists(join(source, s)) is False:
+            write_all(source, scale, [s])
+
+    previous_results = load_results()
+    commit = current_commit()
+    results = []
+    for s in run_services:
+        result = {"service": s,
+                  "scale": scale,
+                  "rows": scale_rows(scale),
+                  "commit": commit,
+                  "date": datetime.datetime.now().isoformat(),
+                  "keep_cache": keep_cache,
+                  "stages": run_service(s, source, keep_cache)}
+        store_result(result)
+        previous = [x for x in previous_results
+                    if x["service"] == s and x["scale"] == scale]
+        print_comparison(result, previous[-1] if previous else None)
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    import django
+    if sys.argv[1] == "--worker":
+        django.setup()
+        if "--setup" in sys.argv:
+            setup_worker(sys.argv[2], keep_cache="--keep-cache" in sys.argv)
+            result = True
+        else:
+            stage = int(sys.argv[sys.argv.index("--stage") + 1])
+            result = run_worker(sys.argv[2], stage)
+        print(result_marker + json.dumps(result))
+    else:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "proj.settings")
+        django.setup()
+        benchmark(*sys.argv[1:3])
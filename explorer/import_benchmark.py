@@ -0,0 +1,92 @@
+"""
+Import time check for django startup
+
+Runs django.setup() in a fresh interpreter with `python -X importtime`
+and reports the slowest imports. Fails if any of the heavy chart/analysis
+libraries are pulled in by the explorer modules, or if total startup
+import time is over the given limit.
+
+    invoke importtime
+    python -m explorer.import_benchmark
+"""
+import os
+import subprocess
+import sys
+
+heavy_modules = ["altair", "pandas", "numpy", "scipy", "markdown",
+                 "useful_grid", "research_common.charts", "pyarrow"]
+
+setup_code = ("import os, django;"
+              "os.environ.setdefault('DJANGO_SETTINGS_MODULE', "
+              "'proj.settings');"
+              "django.setup();"
+              "import explorer.views")
+
+
+def run_importtime(code=setup_code):
+    """
+    returns list of (depth, self_us, cumulative_us, module) in output order
+    """
+    env = dict(os.environ)
+    env.pop("DJANGO_SETTINGS_MODULE", None)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            stderr=subprocess.PIPE, stdout=subprocess.PIPE,
+                            universal_newlines=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((depth, int(self_us), int(cumulative), name.strip()))
+    return rows
+
+
+def importers(rows):
+    """
+    map module -> top level module (below the setup code) that imported it
+    importtime prints children before parents, so walk backwards
+    """
+    result = {}
+    stack = []
+    for depth, self_us, cumulative, name in reversed(rows):
+        stack = stack[:depth]
+        stack.append(name)
+        result[name] = stack
+    return result
+
+
+def check(limit_seconds=None, show=15):
+    rows = run_importtime()
+    chains = importers(rows)
+    total = sum(x[1] for x in rows) / 1000000.0
+
+    print("total import time: {0:.2f}s".format(total))
+    print("slowest (cumulative):")
+    for depth, self_us, cumulative, name in sorted(
+            rows, key=lambda x: x[2], reverse=True)[:show]:
+        print("  {0:>8.3f}s  {1}".format(cumulative / 1000000.0, name))
+
+    problems = []
+    for name, chain in chains.items():
+        if name not in heavy_modules:
+            continue
+        explorer_parents = [x for x in chain if x.startswith("explorer")]
+        if explorer_parents:
+            problems.append("{0} imported via {1}".format(
+                name, " > ".join(chain)))
+
+    if limit_seconds and total > limit_seconds:
+        problems.append("startup imports took {0:.2f}s (limit {1}s)".format(
+            total, limit_seconds))
+
+    for p in problems:
+        print("FAIL: " + p)
+    return problems
+
+
+if __name__ == "__main__":
+    limit = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    sys.exit(1 if check(limit) else 0)
@@ -0,0 +1,107 @@
+"""
+Charts rendered when they are scrolled into view
+
+The item pages (especially the "all" tab) and the grouped analysis
+charts embed a chart for every superset, and rendering them all at load
+holds up the page. With LAZY_CHARTS on, defer(chart) wraps a chart so
+its div is a placeholder sized to roughly the height vega-lite will
+give it, and its code hands the spec (as a string, only parsed when
+needed) to ExplorerCharts (web/js/lazy_charts.js), which renders it
+with vegaEmbed when a waypoint says it is near the viewport.
+
+Charts that aren't SpecCharts have their own render code wrapped in a
+function instead, so the altair path is deferred the same way.
+"""
+import json
+import uuid
+
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from . import vl_spec as vl
+
+# vega-lite v4 defaults
+band_step = 20
+continuous_height = 200
+# title, subtitle lines and axis labels
+chrome_height = 80
+subtitle_height = 16
+
+
+def enabled():
+    return getattr(settings, "LAZY_CHARTS", False)
+
+
+def script_string(content):
+    """
+    js string literal that is safe inside a script tag
+    """
+    return json.dumps(content).replace("</", "<\\/")
+
+
+def y_rows(chart):
+    """
+    number of bands on a discrete y axis, or None if continuous
+    """
+    spec = getattr(chart, "spec", None)
+    if spec:
+        # stored chart - read the spec and its values
+        encoding = spec.get("layer", [spec])[0].get("encoding", {})
+        y = encoding.get("y", {})
+        if y.get("type") not in ["nominal", "ordinal"]:
+            return None
+        return len(set(str(x.get(y.get("field"))) for x in chart.values))
+    df = getattr(chart, "df", None)
+    y = getattr(chart, "options", {}).get("y")
+    field = getattr(y, "shorthand", y)
+    if df is None or field not in df.columns:
+        return None
+    if vl.column_type(df[field]) != "nominal":
+        return None
+    return df[field].nunique()
+
+
+def placeholder_height(chart):
+    rows = y_rows(chart)
+    height = continuous_height if rows is None else rows * band_step
+    title = getattr(chart, "title", None)
+    if isinstance(title, dict):
+        height += subtitle_height * len(title.get("subtitle", []))
+    return height + chrome_height
+
+
+class DeferredChart(object):
+    """
+    wraps a chart - anything else is passed through to it
+    """
+
+    def __init__(self, chart):
+        self.chart = chart
+        self.placeholder = "lazy_" + uuid.uuid4().hex[:12]
+        self.height = placeholder_height(chart)
+
+    def __getattr__(self, name):
+        if name == "chart":
+            raise AttributeError(name)
+        return getattr(self.chart, name)
+
+    def render_div(self):
+        div = '<div id="{0}" class="lazy-chart" style="min-height:{1}px">'
+        div = div.format(self.placeholder, self.height)
+        return mark_safe(div + self.chart.render_div() + '</div>')
+
+    def render_code(self):
+        if isinstance(self.chart, vl.SpecChart):
+            code = 'ExplorerCharts.defer("{0}", "#{1}", {2});'.format(
+                self.placeholder, self.chart.ident,
+                script_string(self.chart.json()))
+        else:
+            code = 'ExplorerCharts.deferCode("{0}", function () {{{1}}});'
+            code = code.format(self.placeholder, self.chart.render_code())
+        return mark_safe(code)
+
+
+def defer(chart):
+    if enabled() is False or isinstance(chart, DeferredChart):
+        return chart
+    return DeferredChart(chart)
@@ -0,0 +1,16 @@
+"""
+Write the static JSON API of the crosstabs to the bake folder
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Write api/ set files and indexes alongside the baked site"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--folder", default=None)
+
+    def handle(self, *args, **options):
+        from explorer.static_api import write_api
+        folder = write_api(options["folder"])
+        print("api written to {0}".format(folder))
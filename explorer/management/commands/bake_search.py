@@ -0,0 +1,16 @@
+"""
+Write the prebuilt search indexes to the bake folder
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Write search/[service].[hash].json and search/index.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--folder", default=None)
+
+    def handle(self, *args, **options):
+        from explorer.search_index import write_search
+        folder = write_search(options["folder"])
+        print("search indexes written to {0}".format(folder))
@@ -0,0 +1,25 @@
+"""
+Rebuild the year-over-year trend cube without a populate
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Line up the year clone services (e.g. fms_2019) by year"
+
+    def add_arguments(self, parser):
+        parser.add_argument("family", nargs="*",
+                            help="base service slugs, e.g. fms wtt")
+
+    def handle(self, *args, **options):
+        from explorer import trends
+        from explorer.models import DataVersion
+
+        families = options["family"]
+        if not families:
+            families = [x.slug for x in trends.families()]
+        if not families:
+            raise CommandError("no services with year clones")
+        for family in families:
+            trends.rebuild(family)
+        DataVersion.bump()
@@ -0,0 +1,34 @@
+"""
+Compare alternative crosstab engines against AnalysisType.cross_table
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Check registered crosstab engines produce identical grids"
+
+    def add_arguments(self, parser):
+        parser.add_argument("service", nargs="+")
+        parser.add_argument("--engine", action="append", default=[])
+        parser.add_argument("--limit", type=int, default=None)
+
+    def handle(self, *args, **options):
+        from explorer.generate.base import cross_table_engines
+        from explorer.generate.engine_check import (check_register,
+                                                    find_register,
+                                                    print_summary)
+
+        for name in options["engine"]:
+            if name not in cross_table_engines:
+                raise CommandError("unknown engine: {0}".format(name))
+
+        failed = False
+        for service in options["service"]:
+            summary = check_register(find_register(service),
+                                     options["engine"] or None,
+                                     options["limit"])
+            print_summary(summary)
+            if any(summary["mismatches"].values()):
+                failed = True
+        if failed:
+            raise CommandError("engines do not match the reference")
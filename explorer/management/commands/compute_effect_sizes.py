@@ -0,0 +1,27 @@
+"""
+Fill in the effect sizes of the comparison sets without a populate
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Compute Cramer's V and related effect sizes for services"
+
+    def add_arguments(self, parser):
+        parser.add_argument("service", nargs="*")
+
+    def handle(self, *args, **options):
+        from explorer import read_model
+        from explorer.effect_size import update_service
+        from explorer.models import DataVersion, Service
+
+        services = Service.objects.all().order_by("slug")
+        if options["service"]:
+            services = services.filter(slug__in=options["service"])
+        if services.exists() is False:
+            raise CommandError("no matching services")
+        for service in services:
+            update_service(service)
+            # item pages order their sets by effect size
+            read_model.rebuild(service)
+        DataVersion.bump()
@@ -0,0 +1,41 @@
+"""
+Write the bulk crosstab download for services
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Export every ComparisonUnit of a service as csv.gz and/or parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("service", nargs="*")
+        parser.add_argument("--format", default="both",
+                            choices=["csv", "parquet", "both"])
+        parser.add_argument("--folder", default="exports")
+
+    def handle(self, *args, **options):
+        from explorer import export
+        from explorer.models import Service
+
+        services = Service.objects.all().order_by("slug")
+        if options["service"]:
+            services = services.filter(slug__in=options["service"])
+        if services.exists() is False:
+            raise CommandError("no matching services")
+
+        formats = ["csv", "parquet"]
+        if options["format"] != "both":
+            formats = [options["format"]]
+        if "parquet" in formats and export.load_pyarrow() is None:
+            if options["format"] == "parquet":
+                raise CommandError("parquet export needs pyarrow")
+            print("pyarrow not installed, skipping parquet")
+            formats.remove("parquet")
+
+        for service in services:
+            for format in formats:
+                path = export.write_export(service, format, options["folder"])
+                print("{0}: {1:.1f}MB".format(
+                    path, os.path.getsize(path) / 1048576))
@@ -0,0 +1,26 @@
+"""
+Show what a generation run would do and roughly how long it would take
+"""
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "List pending grid generation, column cache use and estimates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("service", nargs="*")
+        parser.add_argument("--force", action="store_true",
+                            help="plan as if regenerating existing grids")
+        parser.add_argument("--verbose-combos", action="store_true",
+                            help="list each pending combination")
+
+    def handle(self, *args, **options):
+        from explorer.generate.engine_check import all_registers
+        from explorer.generate.planner import make_plan, print_plan
+
+        registers = all_registers()
+        if options["service"]:
+            registers = [x for x in registers
+                         if x.service in options["service"]]
+        plan = make_plan(registers, force=options["force"])
+        print_plan(plan, verbose=options["verbose_combos"])
@@ -0,0 +1,26 @@
+"""
+Render every baked page into the runtime page cache
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Warm the page cache by walking the views' bake_args"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--server", default=None,
+                            help="fetch from a running site e.g. "
+                                 "http://127.0.0.1:8000")
+        parser.add_argument("--limit", type=int, default=None)
+
+    def handle(self, *args, **options):
+        from explorer import page_cache
+
+        if page_cache.cache_enabled() is False:
+            raise CommandError("PAGE_CACHE is not enabled in these settings "
+                               "(use proj.runtime_settings)")
+        urls = page_cache.view_urls()
+        if options["limit"]:
+            urls = urls[:options["limit"]]
+        page_cache.warm(urls, options["workers"], options["server"])
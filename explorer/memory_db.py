@@ -0,0 +1,109 @@
+"""
+Fast database load for the bake
+
+The bake settings point the default database at a shared-cache in-memory
+sqlite database and keep the populated file as memory_source. When the
+first connection to the in-memory database is opened in a process, the
+file is copied into it in one operation with sqlite's online backup API
+rather than replayed row by row.
+
+BAKE_DATABASE_LOAD = "memory" does the backup copy, "immutable" instead
+opens the file directly as read-only/immutable with memory mapped io
+(see bake_settings). Either way the load time is logged.
+
+A shared-cache in-memory database is dropped when its last connection
+closes, and django closes connections between requests, so install()
+(called from ExplorerConfig.ready) opens an anchor connection that holds
+it, loaded once, for the life of the process.
+"""
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+source_alias = "memory_source"
+mmap_size = 1024 * 1024 * 1024
+
+# keeps the shared-cache database alive - see open_anchor
+anchor = None
+anchor_pid = None
+
+
+def load_mode():
+    return getattr(settings, "BAKE_DATABASE_LOAD", "")
+
+
+def is_memory_database(connection):
+    name = str(connection.settings_dict.get("NAME", ""))
+    return name == ":memory:" or "mode=memory" in name
+
+
+def has_tables(raw_connection):
+    cursor = raw_connection.execute(
+        "select count(*) from sqlite_master where type='table'")
+    return cursor.fetchone()[0] > 0
+
+
+def backup_into(raw_connection):
+    """
+    copy the memory_source file into the (empty) in-memory connection
+    """
+    source_path = settings.DATABASES[source_alias]["NAME"]
+    start = time.perf_counter()
+    source = sqlite3.connect("file:{0}?mode=ro".format(source_path),
+                             uri=True)
+    try:
+        # pages=-1 copies the whole database in a single step
+        source.backup(raw_connection, pages=-1)
+    finally:
+        source.close()
+    duration = time.perf_counter() - start
+    print("loaded {0} into memory in {1:.3f}s".format(
+        source_path, duration))
+    return duration
+
+
+def prepare_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or connection.alias != "default":
+        return
+    raw = connection.connection
+    if load_mode() == "immutable":
+        start = time.perf_counter()
+        raw.execute("PRAGMA mmap_size={0}".format(mmap_size))
+        raw.execute("PRAGMA query_only=1")
+        print("opened {0} immutable in {1:.3f}s".format(
+            connection.settings_dict["NAME"], time.perf_counter() - start))
+    elif load_mode() == "memory" and is_memory_database(connection):
+        # shared cache - the anchor is the first connection in a process
+        if has_tables(raw) is False:
+            open_anchor()
+
+
+def open_anchor():
+    """
+    connection to the shared-cache database held for the process
+    """
+    global anchor, anchor_pid
+    # bake workers are forked - each process opens its own
+    if anchor is None or anchor_pid != os.getpid():
+        name = settings.DATABASES["default"]["NAME"]
+        anchor = sqlite3.connect(name, uri=True, check_same_thread=False)
+        anchor_pid = os.getpid()
+        if has_tables(anchor) is False:
+            backup_into(anchor)
+    return anchor
+
+
+def install():
+    """
+    prepare current and future default connections
+    """
+    connection = connections["default"]
+    if load_mode() == "memory" and is_memory_database(connection):
+        open_anchor()
+    connection_created.connect(prepare_connection)
+    if connection.connection is not None:
+        prepare_connection(None, connection)
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.4 on 2026-10-19 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0031_auto_20210319_0832'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopulateCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('superset_slug', models.CharField(max_length=255)),
+                ('collectiontype_slug', models.CharField(max_length=255)),
+                ('completed', models.DateTimeField(auto_now_add=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='explorer.Service')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
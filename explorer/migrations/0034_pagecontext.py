@@ -0,0 +1,26 @@
+# Generated by Django 3.0.4 on 2026-10-19 13:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0033_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageContext',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('signature', models.CharField(max_length=40)),
+                ('data', models.TextField()),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='page_contexts', to='explorer.Service')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
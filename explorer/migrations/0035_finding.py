@@ -0,0 +1,36 @@
+# Generated by Django 3.0.4 on 2026-10-19 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0034_pagecontext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Finding',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chi_value', models.FloatField(default=0)),
+                ('diff_percent', models.FloatField(default=0)),
+                ('rank', models.IntegerField(default=0)),
+                ('collection_rank', models.IntegerField(default=0)),
+                ('collectiontype', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='explorer.CollectionType')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='explorer.ComparisonGroup')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='explorer.Service')),
+                ('unit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='findings', to='explorer.ComparisonUnit')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='finding',
+            index=models.Index(fields=['collectiontype', 'group', 'rank'], name='explorer_finding_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='finding',
+            index=models.Index(fields=['collectiontype', 'collection_rank'], name='explorer_finding_crank_idx'),
+        ),
+    ]
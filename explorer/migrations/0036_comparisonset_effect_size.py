@@ -0,0 +1,33 @@
+# Generated by Django 3.0.4 on 2026-10-19 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0035_finding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comparisonset',
+            name='cramers_v',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='comparisonset',
+            name='cramers_v_corrected',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comparisonset',
+            name='effect_dof',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comparisonset',
+            name='tschuprows_t',
+            field=models.FloatField(default=0),
+        ),
+    ]
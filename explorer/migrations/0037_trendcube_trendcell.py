@@ -0,0 +1,53 @@
+# Generated by Django 3.0.4 on 2026-10-19 17:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0036_comparisonset_effect_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendCube',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('years', models.TextField(default='[]')),
+                ('built', models.DateTimeField(auto_now=True)),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trend_cubes', to='explorer.Service')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendCell',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection_slug', models.CharField(max_length=255)),
+                ('item_slug', models.CharField(max_length=255)),
+                ('item_name', models.CharField(max_length=255, null=True)),
+                ('superset_slug', models.CharField(max_length=255)),
+                ('superset_name', models.CharField(max_length=255, null=True)),
+                ('label_slug', models.CharField(max_length=255)),
+                ('label', models.CharField(max_length=255, null=True)),
+                ('order', models.IntegerField(default=0)),
+                ('values', models.TextField(default='[]')),
+                ('shares', models.TextField(default='[]')),
+                ('residuals', models.TextField(default='[]')),
+                ('change', models.FloatField(default=0)),
+                ('cube', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cells', to='explorer.TrendCube')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='trendcell',
+            index=models.Index(fields=['cube', 'collection_slug', 'change'], name='explorer_trend_change_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trendcell',
+            index=models.Index(fields=['cube', 'collection_slug', 'item_slug', 'superset_slug'], name='explorer_trend_cell_idx'),
+        ),
+    ]
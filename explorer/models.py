@@ -1,24 +1,19 @@
 import datetime
-from collections import Counter, OrderedDict
+import json
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
 from itertools import groupby
 
-import altair as alt
-import numpy as np
-import pandas as pd
 from django.db import models
 from django.urls import reverse
 from django.utils.html import escapejs
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify as dslugify
 from django_sourdough.models import FlexiBulkModel
-from markdown import markdown
-from research_common.charts import AltairChart, Table, query_to_df
-import research_common.altair_theme as theme
-from scipy.stats import chi2_contingency
-from scipy.stats.contingency import margins
-from useful_grid import QuickGrid
 import calendar
 
+from . import vl_spec as vl
+
 month_lookup = {month: index for index,
                 month in enumerate(calendar.month_abbr) if month}
 
@@ -26,18 +21,47 @@ def get_long_month(x):
     index = list(calendar.month_abbr).index(x)
     return calendar.month_name[index]
 
-local_negative = theme.adjusted_colours["colour_blue"]
-local_positive = theme.adjusted_colours["colour_berry"]
 local_positive_label = "Red"
 local_negative_label = "Blue"
 
-local_grey = theme.colours["colour_light_grey"]
-dark_grey = theme.colours["colour_dark_grey"]
-background_blue = theme.monochrome_colours["colour_blue_light_20"]
-highlight_blue = theme.monochrome_colours["colour_blue_dark_30"]
-offwhite = theme.colours["colour_off_white"]
 end_year = 2020
 
+# chart and table dependencies (altair, pandas, scipy etc) are imported
+# where they are used so that management commands that don't build
+# charts or tables (migrate, runserver reloads, bake workers) don't pay
+# for them at startup
+
+
+@lru_cache(maxsize=None)
+def theme_colours():
+    """
+    colours from the research theme (imports altair, so loaded on first use)
+    """
+    import research_common.altair_theme as theme
+    return {"local_negative": theme.adjusted_colours["colour_blue"],
+            "local_positive": theme.adjusted_colours["colour_berry"],
+            "local_grey": theme.colours["colour_light_grey"],
+            "dark_grey": theme.colours["colour_dark_grey"],
+            "background_blue": theme.monochrome_colours["colour_blue_light_20"],
+            "highlight_blue": theme.monochrome_colours["colour_blue_dark_30"],
+            "offwhite": theme.colours["colour_off_white"]}
+
+
+def __getattr__(name):
+    """
+    allow 'from .models import local_negative' without loading the theme
+    """
+    if name in ["local_negative", "local_positive", "local_grey", "dark_grey",
+                "background_blue", "highlight_blue", "offwhite"]:
+        return theme_colours()[name]
+    raise AttributeError(
+        "module {0} has no attribute {1}".format(__name__, name))
+
+
+def markdown(text):
+    from markdown import markdown as render_markdown
+    return render_markdown(text)
+
 
 class ObjectsToDataFrame(dict):
     """
@@ -46,6 +70,7 @@ class ObjectsToDataFrame(dict):
     """
 
     def apply_objects(self, objects):
+        import pandas as pd
         result = {}
         for k, v in self.items():
             result[k] = [v(x) for x in objects]
@@ -85,10 +110,13 @@ large_cutoff = 1
 
 
 def residuals(observed, expected):
+    import numpy as np
     return (observed - expected) / np.sqrt(expected)
 
 
 def stdres(observed, expected):
+    import numpy as np
+    from scipy.stats.contingency import margins
     n = observed.sum()
     rsum, csum = margins(observed)
     v = csum * rsum * (n - rsum) * (n - csum) / n**3
@@ -190,15 +218,75 @@ class CollectionType(FlexiBulkModel):
 
         SubCollectionItem.save_queue()
 
+    # item totals by year for each collection type, filled once per data
+    # version (the bake renders every year tab from the same matrix)
+    # dropped when populate bumps DataVersion so a running server
+    # doesn't serve the old totals
+    _totals_cache = {}
+    _totals_version = None
+
+    def get_totals_matrix(self):
+        """
+        return {item_id: {year: total}} for all items in this collection type
+        with a year of 0 representing all time.
+        Follows the same rules as CollectionItem.total but uses
+        a fixed number of queries rather than several per item.
+        """
+        cls = self.__class__
+        version = DataVersion.current()
+        if version != cls._totals_version:
+            cls._totals_cache.clear()
+            cls._totals_version = version
+        if self.id in cls._totals_cache:
+            return cls._totals_cache[self.id]
+
+        populated = set(ComparisonUnit.objects.filter(
+            collection__parent=self).values_list("collection_id",
+                                                 flat=True).distinct())
+
+        units = ComparisonUnit.objects.filter(
+            collection__parent=self,
+            parent__superset__slug__in=["year", "month"])
+        units = units.values_list("collection_id", "parent__superset__slug",
+                                  "label", "value", "row_total")
+
+        year_values = {}
+        year_row_total = {}
+        month_row_total = {}
+        for item_id, superset_slug, label, value, row_total in units:
+            if superset_slug == "month":
+                month_row_total.setdefault(item_id, row_total)
+                continue
+            year_row_total.setdefault(item_id, row_total)
+            try:
+                year = int(float(label))
+            except ValueError:
+                continue
+            year_values.setdefault(item_id, {})[year] = int(value)
+
+        parent_is_year = self.slug == "year"
+        matrix = {}
+        for item_id in populated:
+            if parent_is_year or item_id not in year_row_total:
+                # no per year breakdown - same figure used for every year
+                total = month_row_total.get(item_id, 1)
+                matrix[item_id] = defaultdict(lambda total=total: total)
+            else:
+                matrix[item_id] = defaultdict(int, year_values.get(item_id, {}))
+                matrix[item_id][0] = int(year_row_total[item_id])
+
+        cls._totals_cache[self.id] = matrix
+        return matrix
+
     def get_table_count(self, year):
         """
         generate table given year
         """
-        categories = list(self.items.all())
-        categories = [
-            x for x in categories if x.units.all().exists()]
+        matrix = self.get_totals_matrix()
+
+        categories = [x for x in self.items.all() if x.id in matrix]
         for c in categories:
-            c.computed_total = c.total(year)
+            c.computed_total = matrix[c.id][year]
 
         grand_total = sum([x.computed_total for x in categories])
 
@@ -210,6 +298,7 @@ class CollectionType(FlexiBulkModel):
         categories.sort(key=lambda x: x.computed_total, reverse=True)
         categories = [x for x in categories if x.computed_total]
 
+        from research_common.charts import Table
         table = Table(name=self.name + " " + str(year))
 
         odf = ObjectsToDataFrame()
@@ -467,6 +556,28 @@ class ComparisonSet(FlexiBulkModel):
     chi2 = models.FloatField(default=0)
     p = models.FloatField(default=0)
     dof = models.FloatField(default=0)
+    # effect sizes - filled in by populate (see effect_size)
+    cramers_v = models.FloatField(default=0, db_index=True)
+    cramers_v_corrected = models.FloatField(default=0)
+    tschuprows_t = models.FloatField(default=0)
+    effect_dof = models.IntegerField(default=0)
+
+    @property
+    def effect_label(self):
+        """
+        Cohen's thresholds for V, scaled by min(rows, columns) - 1
+        """
+        if self.effect_dof < 1:
+            return ""
+        scale = self.effect_dof ** 0.5
+        v = self.cramers_v * scale
+        if v >= 0.5:
+            return "large"
+        elif v >= 0.3:
+            return "medium"
+        elif v >= 0.1:
+            return "small"
+        return "negligible"
 
     def get_units(self, collection_item):
         """
@@ -513,8 +624,9 @@ class ComparisonSet(FlexiBulkModel):
 
         df["percent"] = (df[col_name] / df[col_name].sum() * 100).round(2)
         df["url"] = df.apply(make_url, axis="columns")
-        df["color"] = local_grey
-        df.loc[df["label_slug"] == label.slug, "color"] = highlight_blue
+        colours = theme_colours()
+        df["color"] = colours["local_grey"]
+        df.loc[df["label_slug"] == label.slug, "color"] = colours["highlight_blue"]
 
         name = " ".join(
             [self.superset.name, self.collectiontype.name, label.name])
@@ -522,12 +634,12 @@ class ComparisonSet(FlexiBulkModel):
         switch = avg_length > 10
         if switch:
             xx = col_name
-            yy = alt.Y("label", sort=None, axis=alt.Axis(title=""))
+            yy = vl.Y("label", sort=None, axis=vl.Axis(title=""))
             text_options = {'align': 'left',
                             'baseline': 'middle',
                             'dx': 3}
         else:
-            xx = alt.X("label", sort=None, axis=alt.Axis(
+            xx = vl.X("label", sort=None, axis=vl.Axis(
                 title="", labelAngle=0))
             yy = col_name
             text_options = {'align': 'center',
@@ -540,22 +652,22 @@ class ComparisonSet(FlexiBulkModel):
                 l_case_name = l_case_name.lower()[0] + l_case_name[1:]
 
         if summary:
-            title = alt.TitleParams(service.name + ": " + l_case_name,
+            title = vl.TitleParams(service.name + ": " + l_case_name,
                                     subtitle=[])
         else:
             title = None
 
-        chart = AltairChart(df, name=name, title=title, chart_type="bar")
+        chart = vl.make_chart(df, name=name, title=title, chart_type="bar")
         chart.set_options(x=xx,
                           y=yy,
-                          color=alt.Color("color", scale=None),
+                          color=vl.Color("color", scale=None),
                           href="url",
                           tooltip=["label",
-                                   alt.Tooltip(col_name, format=',.2r'),
+                                   vl.Tooltip(col_name, format=',.2r'),
                                    "percent"])
         if summary:
             text_format = ".2s"
-            chart.set_text_options(text=alt.Text(
+            chart.set_text_options(text=vl.Text(
                 col_name, format=text_format), **text_options)
 
         if summary:
@@ -572,6 +684,7 @@ class ComparisonSet(FlexiBulkModel):
 
         name = " ".join([self.collectiontype.name,
                          collection_item.name, self.superset.name])
+        from research_common.charts import Table
         table = Table(name=name)
 
         odf = ObjectsToDataFrame()
@@ -599,8 +712,8 @@ class ComparisonSet(FlexiBulkModel):
         def highlight_sig(row):
             not_sig = ""
 
-            sig_less_than_expected = local_negative
-            sig_more_than_expected = local_positive
+            sig_less_than_expected = theme_colours()["local_negative"]
+            sig_more_than_expected = theme_colours()["local_positive"]
 
             diff = row["Expected Diff%"]
             chi = row["Std. Res."]
@@ -654,8 +767,9 @@ class ComparisonSet(FlexiBulkModel):
 
         expected = odf.apply_objects(units)
         expected["series"] = "E"
-        expected["style"] = dark_grey
+        expected["style"] = theme_colours()["dark_grey"]
 
+        import pandas as pd
         df = pd.concat([actual, expected])
 
         category_label = " - ".join([service.name,
@@ -665,7 +779,7 @@ class ComparisonSet(FlexiBulkModel):
         subtitle = [self.superset.name,
                     category_label]
 
-        title = alt.TitleParams("Actual vs expected", subtitle=subtitle)
+        title = vl.TitleParams("Actual vs expected", subtitle=subtitle)
 
         # default width is like this because of a bug in autosizing for facet plots
         # keep an eye on https://github.com/vega/vega-lite/pull/6672
@@ -680,19 +794,19 @@ class ComparisonSet(FlexiBulkModel):
         if "Jan" in df["item"].unique():
             sort = list(df["item"].map(month_lookup))
 
-        chart = AltairChart(df, name=name, title=title,
+        chart = vl.make_chart(df, name=name, title=title,
                             chart_type="bar", facet_width=unique_options)
 
-        header_options = alt.Header(
+        header_options = vl.Header(
             labelFont="Source Sans Pro", labelFontSize=12)
 
-        chart.set_options(x=alt.X("series", sort=None, axis=alt.Axis(
+        chart.set_options(x=vl.X("series", sort=None, axis=vl.Axis(
             title="", labelAngle=0)),
-            y=alt.Y(collective_name, title="",
-                    axis=alt.Axis(offset=0, titleX=-15)),
+            y=vl.Y(collective_name, title="",
+                    axis=vl.Axis(offset=0, titleX=-15)),
             tooltip="tooltip",
-            color=alt.Color("style", scale=None),
-            column=alt.Column("item", sort=sort, title=None, header=header_options))
+            color=vl.Color("style", scale=None),
+            column=vl.Column("item", sort=sort, title=None, header=header_options))
 
         return chart
 
@@ -753,15 +867,15 @@ class ComparisonSet(FlexiBulkModel):
                                      self.collectiontype.name,
                                      collection_item.name])
 
-        title = alt.TitleParams(title_str, subtitle=[
+        title = vl.TitleParams(title_str, subtitle=[
                                 disclaimer, category_label])
 
-        axis_options = alt.Axis(title="", labelAngle=0)
-        chart = AltairChart(df, name=name, title=title, chart_type="bar")
-        chart.set_options(x=alt.X("Item", sort=None, axis=axis_options),
+        axis_options = vl.Axis(title="", labelAngle=0)
+        chart = vl.make_chart(df, name=name, title=title, chart_type="bar")
+        chart.set_options(x=vl.X("Item", sort=None, axis=axis_options),
                           y=label,
                           tooltip="tooltip",
-                          color=alt.Color("style", scale=None))
+                          color=vl.Color("style", scale=None))
 
         return chart
 
@@ -822,22 +936,22 @@ class ComparisonSet(FlexiBulkModel):
 
         if percentage is not None:
             y_label = ""
-            y_axis = alt.Axis(format=".0%")
+            y_axis = vl.Axis(format=".0%")
             text_format = ".0%"
         else:
             y_label = collective_name
-            y_axis = alt.Axis()
+            y_axis = vl.Axis()
             text_format = ".2s"
 
         if switch:
-            xx = alt.X(collective_name, title=y_label, axis=y_axis)
-            yy = alt.Y(h_label, sort=None, axis=alt.Axis(labelAngle=0))
+            xx = vl.X(collective_name, title=y_label, axis=y_axis)
+            yy = vl.Y(h_label, sort=None, axis=vl.Axis(labelAngle=0))
             text_options = {'align': 'left',
                             'baseline': 'middle',
                             'dx': 3}
         else:
-            xx = alt.X(h_label, sort=None, axis=alt.Axis(labelAngle=0))
-            yy = alt.Y(collective_name, title=y_label, axis=y_axis)
+            xx = vl.X(h_label, sort=None, axis=vl.Axis(labelAngle=0))
+            yy = vl.Y(collective_name, title=y_label, axis=y_axis)
             text_options = {'align': 'center',
                             'baseline': 'bottom'}
 
@@ -859,19 +973,19 @@ class ComparisonSet(FlexiBulkModel):
         elif percentage == "row":
             title = f"Relative proportion of {collection_item.name} {collective_name.lower()}"
         else:
-            title = alt.TitleParams(self.superset.name, subtitle=subtitle)
+            title = vl.TitleParams(self.superset.name, subtitle=subtitle)
 
-        chart = AltairChart(
+        chart = vl.make_chart(
             df=df, name=name, title=title, chart_type="bar")
         chart.set_options(x=xx,
                           y=yy,
                           tooltip=[h_label, collective_name, "%",
                                    "Expected", "Diff", "Std. Res"],
-                          color=alt.Color("style", scale=None),
+                          color=vl.Color("style", scale=None),
                           href="url")
 
         if tidy:
-            chart.set_text_options(text=alt.Text(
+            chart.set_text_options(text=vl.Text(
                 collective_name, format=text_format), **text_options)
 
         if tidy:
@@ -884,6 +998,10 @@ class ComparisonSet(FlexiBulkModel):
         """
         digest source - assuming categories as row labels
         """
+        import numpy as np
+        from scipy.stats import chi2_contingency
+        from useful_grid import QuickGrid
+
         self.units.all().delete()
 
         meta_lookup = {x.name: x.id for x in CollectionItem.objects.filter(
@@ -1037,14 +1155,14 @@ class ComparisonLabel(FlexiBulkModel):
         if percentage:
             col_name = "%"
             y_label = "%"
-            y_axis = alt.Axis(format=".0%")
+            y_axis = vl.Axis(format=".0%")
             text_format = ".0%"
             title = f"Proportion of {lower(collection_type.name)} that were {lower(self.short_name())} {lower(service.collective_name)}"
             subtitle = superset.name
         else:
             col_name = "Reports"
             y_label = service.collective_name
-            y_axis = alt.Axis()
+            y_axis = vl.Axis()
             text_format = ".2s"
             title = f"{self.short_name()} {lower(service.collective_name)} by {lower(collection_type.name)}"
             subtitle = superset.name
@@ -1052,26 +1170,26 @@ class ComparisonLabel(FlexiBulkModel):
         df = df.sort_values(col_name, ascending=False)
         switch = avg_length > 10
         if switch:
-            xx = alt.X(col_name, title=y_label, axis=y_axis)
-            yy = alt.Y("Category", sort=None, axis=alt.Axis(title=""))
+            xx = vl.X(col_name, title=y_label, axis=y_axis)
+            yy = vl.Y("Category", sort=None, axis=vl.Axis(title=""))
             text_options = {'align': 'left',
                             'baseline': 'middle',
                             'dx': 3}
         else:
-            xx = alt.X("Category", axis=alt.Axis(
+            xx = vl.X("Category", axis=vl.Axis(
                 title="", labelAngle=0))
-            yy = alt.Y(col_name, title=y_label, axis=y_axis)
+            yy = vl.Y(col_name, title=y_label, axis=y_axis)
             text_options = {'align': 'center',
                             'baseline': 'bottom'}
 
-        chart = AltairChart(df, chart_type="bar", title=alt.TitleParams(
+        chart = vl.make_chart(df, chart_type="bar", title=vl.TitleParams(
             text=title, subtitle=subtitle), name=name)
 
         chart.set_options(x=xx,
                           y=yy)
 
         chart.set_text_options(
-            text=alt.Text(col_name, format=text_format), **text_options)
+            text=vl.Text(col_name, format=text_format), **text_options)
 
         return chart
 
@@ -1084,6 +1202,7 @@ class ComparisonLabel(FlexiBulkModel):
 
         name = " ".join([self.name, superset.name, collection_type.name])
 
+        from research_common.charts import Table
         table = Table(name=name)
 
         odf = ObjectsToDataFrame()
@@ -1111,9 +1230,10 @@ class ComparisonLabel(FlexiBulkModel):
 
         def highlight_sig(row):
             not_sig = ""
-            sig_less_than_expected = f'background-color: {local_negative};'
-            sig_more_than_expected = f'background-color: {local_positive};'
-            sig_more_than_expected += f"color: {offwhite};"
+            colours = theme_colours()
+            sig_less_than_expected = f'background-color: {colours["local_negative"]};'
+            sig_more_than_expected = f'background-color: {colours["local_positive"]};'
+            sig_more_than_expected += f"color: {colours['offwhite']};"
 
             diff = row["Expected Diff%"]
             chi = row["Std. Res."]
@@ -1187,13 +1307,14 @@ class ComparisonUnit(FlexiBulkModel):
     chi_value = models.FloatField(default=0, null=True)
 
     def cell_style(self):
-        not_sig = local_grey  # grey
+        colours = theme_colours()
+        not_sig = colours["local_grey"]  # grey
 
-        sig_less_than_expected_large = local_negative
+        sig_less_than_expected_large = colours["local_negative"]
         sig_less_than_expected_small = not_sig
         sig_more_than_expected_small = not_sig
 
-        sig_more_than_expected_large = local_positive
+        sig_more_than_expected_large = colours["local_positive"]
 
         upper = sig_cutoff
         lower = 0 - upper
@@ -1260,3 +1381,130 @@ class ComparisonUnit(FlexiBulkModel):
             return round((ed / float(self.expected)) * 100, 2)
         else:
             return 100
+
+
+class PopulateCheckpoint(FlexiBulkModel):
+    """
+    record of a comparison set completed by populate
+    lets an interrupted populate resume rather than starting again
+    replaced by a single service complete marker once the service finishes
+    """
+    service = models.ForeignKey(
+        Service, related_name="checkpoints", on_delete=models.CASCADE)
+    superset_slug = models.CharField(max_length=255)
+    collectiontype_slug = models.CharField(max_length=255)
+    completed = models.DateTimeField(auto_now_add=True)
+
+
+class DataVersion(FlexiBulkModel):
+    """
+    stamp bumped each time populate finishes a service
+    part of the runtime page cache key (see page_cache) so pages
+    rendered against older data are never served
+    """
+    version = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def current(cls):
+        version = cls.objects.filter(pk=1).values_list("version", flat=True)
+        return version.first() or 0
+
+    @classmethod
+    def bump(cls):
+        stamp, new = cls.objects.get_or_create(pk=1)
+        stamp.version += 1
+        stamp.save()
+        return stamp.version
+
+
+class PageContext(FlexiBulkModel):
+    """
+    finished charts and tables for one page of the heavier views
+    keyed by view and args - built after populate (see read_model)
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    service = models.ForeignKey(
+        Service, related_name="page_contexts", on_delete=models.CASCADE)
+    signature = models.CharField(max_length=40)
+    data = models.TextField()
+
+
+class Finding(FlexiBulkModel):
+    """
+    significant and large cell of a service, ranked by effect
+    rank is within the collection type and group, collection_rank
+    across the groups - built by populate (see findings)
+    """
+    service = models.ForeignKey(
+        Service, related_name="findings", on_delete=models.CASCADE)
+    collectiontype = models.ForeignKey(
+        CollectionType, related_name="findings", on_delete=models.CASCADE)
+    group = models.ForeignKey(
+        ComparisonGroup, related_name="findings", on_delete=models.CASCADE)
+    unit = models.ForeignKey(
+        ComparisonUnit, related_name="findings", on_delete=models.CASCADE)
+    chi_value = models.FloatField(default=0)
+    diff_percent = models.FloatField(default=0)
+    rank = models.IntegerField(default=0)
+    collection_rank = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["collectiontype", "group", "rank"],
+                                name="explorer_finding_rank_idx"),
+                   models.Index(fields=["collectiontype", "collection_rank"],
+                                name="explorer_finding_crank_idx")]
+
+
+class TrendCube(FlexiBulkModel):
+    """
+    cells of a service's year clones (e.g. fms_2019, fms_2020) lined up
+    by year - built after populate (see trends)
+    years is a json list, the index of the arrays in each TrendCell
+    """
+    service = models.ForeignKey(
+        Service, related_name="trend_cubes", on_delete=models.CASCADE)
+    years = models.TextField(default="[]")
+    built = models.DateTimeField(auto_now=True)
+
+    def year_list(self):
+        return json.loads(self.years)
+
+
+class TrendCell(FlexiBulkModel):
+    """
+    one (collection item, superset, label) cell across the years
+    values, shares (% of row) and residuals are json lists by year,
+    null where a year doesn't have the cell
+    change is the share in the last year it appears less the first
+    """
+    cube = models.ForeignKey(
+        TrendCube, related_name="cells", on_delete=models.CASCADE)
+    collection_slug = models.CharField(max_length=255)
+    item_slug = models.CharField(max_length=255)
+    item_name = models.CharField(max_length=255, null=True)
+    superset_slug = models.CharField(max_length=255)
+    superset_name = models.CharField(max_length=255, null=True)
+    label_slug = models.CharField(max_length=255)
+    label = models.CharField(max_length=255, null=True)
+    order = models.IntegerField(default=0)
+    values = models.TextField(default="[]")
+    shares = models.TextField(default="[]")
+    residuals = models.TextField(default="[]")
+    change = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=["cube", "collection_slug", "change"],
+                                name="explorer_trend_change_idx"),
+                   models.Index(fields=["cube", "collection_slug",
+                                        "item_slug", "superset_slug"],
+                                name="explorer_trend_cell_idx")]
+
+    def value_list(self):
+        return json.loads(self.values)
+
+    def share_list(self):
+        return json.loads(self.shares)
+
+    def residual_list(self):
+        return json.loads(self.residuals)
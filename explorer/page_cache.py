@@ -0,0 +1,196 @@
+"""
+Response cache for serving the explorer at runtime rather than baked
+
+Enabled with PAGE_CACHE in settings (see runtime_settings). Rendered
+pages are stored in the PAGE_CACHE_ALIAS cache (file or local memory,
+with MAX_ENTRIES bounding the size) keyed by path and versioned by the
+DataVersion stamp that populate bumps, so a refresh is picked up on the
+next request and the old pages are culled as the cache fills.
+
+warm() walks the bake_args of the views (the same pages the bake
+renders) and requests them in parallel, either in worker processes
+writing straight to a shared file cache or against a running server.
+"""
+import hashlib
+import inspect
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.http import HttpResponse
+
+header = "X-Page-Cache"
+
+
+def cache_enabled():
+    return getattr(settings, "PAGE_CACHE", False)
+
+
+def page_cache():
+    return caches[getattr(settings, "PAGE_CACHE_ALIAS", "pages")]
+
+
+def data_version():
+    from .models import DataVersion
+    return DataVersion.current()
+
+
+def url_prefix():
+    return "/sites/{0}/".format(settings.SITE_SLUG)
+
+
+def page_key(path):
+    return "page:" + hashlib.md5(path.encode("utf-8")).hexdigest()
+
+
+def cacheable(request):
+    path = request.path
+    if request.method != "GET" or path.startswith(url_prefix()) is False:
+        return False
+    for skip in [settings.STATIC_URL, settings.MEDIA_URL]:
+        if path.startswith(skip):
+            return False
+    return True
+
+
+class PageCacheMiddleware(object):
+    """
+    outermost middleware, so cached content is post-minify
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if cache_enabled() is False or cacheable(request) is False:
+            return self.get_response(request)
+        cache = page_cache()
+        key = page_key(request.get_full_path())
+        version = data_version()
+        stored = cache.get(key, version=version)
+        if stored is not None:
+            content, content_type = stored
+            response = HttpResponse(content, content_type=content_type)
+            response[header] = "hit"
+            return response
+        response = self.get_response(request)
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, (response.content, response["Content-Type"]),
+                      version=version)
+            response[header] = "miss"
+        return response
+
+
+def view_url(view, values):
+    """
+    fill the view's url pattern with the values from bake_args
+    trailing values with defaults are left off if no pattern takes them
+    """
+    values = [str(x) for x in values]
+    patterns = sorted(view.url_patterns, key=lambda x: x.count("(.*)"),
+                      reverse=True)
+    for pattern in patterns:
+        groups = pattern.count("(.*)")
+        if groups <= len(values):
+            path = pattern.lstrip("^").rstrip("$")
+            for v in values[:groups]:
+                path = path.replace("(.*)", v, 1)
+            return url_prefix() + path
+    return None
+
+
+def view_urls(views_module=None):
+    """
+    every page the bake would render
+    """
+    from django_sourdough.views import ComboView
+    if views_module is None:
+        from . import views as views_module
+
+    urls = []
+    done = set()
+    for name, view in inspect.getmembers(views_module, inspect.isclass):
+        if (issubclass(view, ComboView) is False or
+                view.__module__ != views_module.__name__):
+            continue
+        args = None
+        if hasattr(view, "bake_args"):
+            args = view().bake_args()
+        for values in args or [[]]:
+            url = view_url(view, values)
+            if url and url not in done:
+                done.add(url)
+                urls.append(url)
+    return urls
+
+
+_client = None
+
+
+def request_local(url):
+    """
+    render a page in this process (a pool worker) through the middleware
+    """
+    global _client
+    if _client is None:
+        from django.test import Client
+        _client = Client()
+    response = _client.get(url)
+    return url, response.status_code, response.get(header, "")
+
+
+def request_remote(base, url):
+    try:
+        with urlopen(base.rstrip("/") + url) as response:
+            return url, response.status, response.headers.get(header, "")
+    except HTTPError as e:
+        return url, e.code, ""
+
+
+def warm(urls=None, workers=4, server=None):
+    """
+    request each page so it is cached for the current data version
+    with server (e.g. http://127.0.0.1:8000) pages are fetched from the
+    running site, otherwise rendered here into the shared cache
+    """
+    if urls is None:
+        urls = view_urls()
+    backend = settings.CACHES[getattr(settings, "PAGE_CACHE_ALIAS",
+                                      "pages")]["BACKEND"]
+    if server is None and backend.endswith("LocMemCache"):
+        print("local memory cache is per process - warming a running "
+              "server needs --server")
+        return
+
+    print("warming {0} pages with {1} workers (data version {2})".format(
+        len(urls), workers, data_version()))
+    start = time.perf_counter()
+    if server:
+        pool = ThreadPoolExecutor(workers)
+        results = pool.map(lambda x: request_remote(server, x), urls)
+    else:
+        # workers are forked, so shouldn't inherit open connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(workers)
+        results = pool.map(request_local, urls, chunksize=20)
+
+    counts = {}
+    failed = []
+    for count, (url, status, cached) in enumerate(results, 1):
+        counts[cached or status] = counts.get(cached or status, 0) + 1
+        if status != 200:
+            failed.append((url, status))
+        if count % 500 == 0:
+            print("{0}/{1}".format(count, len(urls)))
+    pool.shutdown()
+
+    print("warmed in {0:.1f}s: {1}".format(
+        time.perf_counter() - start,
+        ", ".join("{0} {1}".format(v, k) for k, v in counts.items())))
+    for url, status in failed[:20]:
+        print("  {0} {1}".format(status, url))
+    return counts
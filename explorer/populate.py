@@ -12,64 +12,87 @@ from itertools import groupby
 
 from .models import (Service, ComparisonSuperSet, CollectionType,
                      CollectionItem, ComparisonSet, ComparisonUnit,
-                     ComparisonLabel, ComparisonGroup)
+                     ComparisonLabel, ComparisonGroup, PopulateCheckpoint,
+                     DataVersion)
 
-from .views import (CollectionTypeView, ServiceView,
-                    ExploringOptionsView, AnalysisView,
-                    CollectionItemViewGroups)
+from django.db import transaction
+from django.utils.text import slugify as dslugify
 
-from .generate.fms import fms_register, fms_no_cobrands, year_clones
-from .generate.wtt import wtt_register, wtt_mp_only, wtt_year_clones
+from . import effect_size, findings, read_model, trends
+from .generate import instrument
 
-from .generate.wdtk import wdtk_register
-from django.utils.text import slugify as dslugify
+# generator modules (and pandas/numpy with them) are imported by the
+# functions that need them so only the requested service is loaded
 
 
 def slugify(x): return dslugify(x[:40])
 
 
-def populate_fms_service(service, register):
-    # create service
+# pick up from the checkpoints of an interrupted populate
+# rather than clearing the service and starting again
+resume = False
 
-    # create comparison groups
+# checkpoint superset slug marking a service as finished, so a resumed
+# populate all skips the services done before the interruption
+service_complete = "__complete__"
+
+
+def resuming(slug):
+    """
+    is there an interrupted populate of this service to continue
+    """
+    if resume is False:
+        return False
+    return PopulateCheckpoint.objects.filter(service__slug=slug).exists()
+
+
+def completed(slug):
+    """
+    did this service finish before the interrupted populate stopped
+    """
+    if resume is False:
+        return False
+    return PopulateCheckpoint.objects.filter(
+        service__slug=slug, superset_slug=service_complete).exists()
 
-    ComparisonGroup.objects.filter(service=service).delete()
 
-    ComparisonGroup(name="Categories",
-                    slug=slugify("Categories"),
-                    service=service,
-                    order=6).queue()
-    ComparisonGroup(name="Scottish IMD",
-                    slug=slugify("Scottish IMD"),
-                    service=service,
-                    order=4).queue()
-    ComparisonGroup(name="Welsh IMD",
-                    slug=slugify("Welsh IMD"),
-                    service=service,
-                    order=5).queue()
-    ComparisonGroup(name="UK IMD",
-                    slug=slugify("UK IMD"),
-                    service=service,
-                    order=6).queue()
-    ComparisonGroup(name="English IMD",
-                    slug=slugify("English IMD"),
-                    service=service,
-                    order=3).queue()
-    ComparisonGroup(name="Characteristics",
-                    slug=slugify("Characteristics"),
-                    service=service,
-                    order=2).queue()
-    ComparisonGroup(name="Time",
-                    slug=slugify("Time"),
-                    service=service,
-                    order=1).queue()
+def clear_service(slug):
+    if resuming(slug) is False:
+        Service.objects.filter(slug=slug).delete()
 
+
+def create_groups(service, groups):
+    """
+    (re)create comparison groups from (name, order)
+    kept as they are when resuming
+    """
+    if resuming(service.slug):
+        return
+    ComparisonGroup.objects.filter(service=service).delete()
+    for name, order in groups:
+        ComparisonGroup(name=name,
+                        slug=slugify(name),
+                        service=service,
+                        order=order).queue()
     ComparisonGroup.save_queue()
 
+
+def populate_fms_service(service, register):
+    # create comparison groups
+    create_groups(service, [
+        ("Categories", 6),
+        ("Scottish IMD", 4),
+        ("Welsh IMD", 5),
+        ("UK IMD", 6),
+        ("English IMD", 3),
+        ("Characteristics", 2),
+        ("Time", 1)])
+
     populate_service(service, register)
 
 
 def populate_fms_plain():
+    from .generate.fms import fms_register
 
     service, new = Service.objects.get_or_create(name="FixMyStreet",
                                                  collective_name="Reports",
@@ -81,8 +104,9 @@ def populate_fms_plain():
 
 
 def populate_fms_no_cobrand():
+    from .generate.fms import fms_no_cobrands
 
-    Service.objects.filter(slug="fms_no_cobrands").delete()
+    clear_service("fms_no_cobrands")
 
     service, new = Service.objects.get_or_create(name="FMS (no cobrands)",
                                                  collective_name="Reports",
@@ -99,7 +123,7 @@ def populate_fms_year(register):
 
     slug = "fms_{0}".format(year)
 
-    Service.objects.filter(slug=slug).delete()
+    clear_service(slug)
 
     service, new = Service.objects.get_or_create(name="FMS ({0})".format(year),
                                                  collective_name="Reports",
@@ -111,13 +135,14 @@ def populate_fms_year(register):
 
 
 def populate_wtt_restriction(slug, name, register):
-    Service.objects.filter(slug=slug).delete()
+    clear_service(slug)
     service, new = Service.objects.get_or_create(
         name=name, slug=slug, collective_name="Messages", singular_name="Message",)
     populate_wtt_groups(service, register)
 
 
 def populate_wtt():
+    from .generate.wtt import wtt_register
     populate_wtt_restriction("wtt", "WriteToThem", wtt_register)
 
 
@@ -128,57 +153,55 @@ def populate_wtt_year(service):
 
 
 def populate_wtt_sub_groups():
+    from .generate.wtt import wtt_mp_only
     populate_wtt_restriction("wtt-mps", "WTT (MPs)", wtt_mp_only)
 
 
 def populate_wtt_groups(service, register):
 
-    ComparisonGroup.objects.filter(service=service).delete()
     # create comparison groups
-    ComparisonGroup(name="Scottish IMD",
-                    slug=slugify("Scottish IMD"),
-                    service=service,
-                    order=4).queue()
-    ComparisonGroup(name="Welsh IMD",
-                    slug=slugify("Welsh IMD"),
-                    service=service,
-                    order=5).queue()
-    ComparisonGroup(name="English IMD",
-                    slug=slugify("English IMD"),
-                    service=service,
-                    order=3).queue()
-    ComparisonGroup(name="UK IMD",
-                    slug=slugify("UK IMD"),
-                    service=service,
-                    order=6).queue()
-    ComparisonGroup(name="Characteristics",
-                    slug=slugify("Characteristics"),
-                    service=service,
-                    order=2).queue()
-    ComparisonGroup(name="Time",
-                    slug=slugify("Time"),
-                    service=service,
-                    order=1).queue()
-
-    ComparisonGroup.save_queue()
+    create_groups(service, [
+        ("Scottish IMD", 4),
+        ("Welsh IMD", 5),
+        ("English IMD", 3),
+        ("UK IMD", 6),
+        ("Characteristics", 2),
+        ("Time", 1)])
 
     populate_service(service, register)
 
 
 def populate_service(service, register):
-    ComparisonSet.objects.filter(collectiontype__service=service).delete()
-    CollectionType.objects.filter(service=service).delete()
+    if completed(service.slug):
+        instrument.log("resuming - {0} already complete".format(
+            service.slug))
+        return
+    resumed = resuming(service.slug)
+    if resumed:
+        done = set(PopulateCheckpoint.objects.filter(
+            service=service).values_list("superset_slug",
+                                         "collectiontype_slug"))
+        instrument.log("resuming {0} - {1} sets already complete".format(
+            service.slug, len(done)))
+    else:
+        done = set()
+        PopulateCheckpoint.objects.filter(service=service).delete()
+        ComparisonSet.objects.filter(collectiontype__service=service).delete()
+        CollectionType.objects.filter(service=service).delete()
     collect_type_gc = CollectionType.objects.get_or_create
     types = []
-    for c in register.collections_stored:
-        collectiontype, new = collect_type_gc(service=service,
-                                              name=c.name,
-                                              slug=c.slug,
-                                              description=c.description,
-                                              display_in_header=c.display_in_header,
-                                              default=c.default)
-        print(c.name)
-        collectiontype.create_items(c)
+    for c in register.get_collections():
+        with transaction.atomic():
+            collectiontype, new = collect_type_gc(service=service,
+                                                  name=c.name,
+                                                  slug=c.slug,
+                                                  description=c.description,
+                                                  display_in_header=c.display_in_header,
+                                                  default=c.default)
+            instrument.log(c.name)
+            if new or collectiontype.items.exists() is False:
+                with instrument.span("collection items", collection=c.slug):
+                    collectiontype.create_items(c)
         collectiontype.model = c
         types.append(collectiontype)
 
@@ -188,7 +211,7 @@ def populate_service(service, register):
     groups = service.groups.all()
     group_lookup = {x.name: x for x in groups}
 
-    analysis = register.analysis_stored
+    analysis = list(register.get_analysis())
 
     def key(x): return x.group
 
@@ -197,9 +220,14 @@ def populate_service(service, register):
     superset_gc = ComparisonSuperSet.objects.get_or_create
     set_gc = ComparisonSet.objects.get_or_create
 
+    total = sum(len([t for t in types if t.slug not in a.exclusions])
+                for a in analysis)
+    progress = instrument.Progress(total, service.slug)
+
     for g, ll in groupby(analysis, key):
         parent_group = group_lookup[g]
-        parent_group.sets.all().delete()
+        if resumed is False:
+            parent_group.sets.all().delete()
         for item in ll:
             group, new = superset_gc(name=item.name,
                                      slug=item.slug,
@@ -211,53 +239,72 @@ def populate_service(service, register):
             # create a set for each comparison type
             for t in types:
                 if t.slug not in item.exclusions:
+                    progress.update(1, "{0} / {1}".format(t.slug, item.slug))
+                    if (item.slug, t.slug) in done:
+                        continue
                     combo = item(t.model)
-                    comboset, created = set_gc(superset=group,
-                                               collectiontype=t,
-                                               source_file=combo.final_location)
-                    if os.path.exists(comboset.source_file) is False:
+                    if os.path.exists(combo.final_location) is False:
                         combo.process()
-                    comboset.generate(save=False)
-            ComparisonUnit.save_queue()
+                    # each set and its checkpoint is written or rolled
+                    # back as a whole
+                    with transaction.atomic():
+                        comboset, created = set_gc(superset=group,
+                                                   collectiontype=t,
+                                                   source_file=combo.final_location)
+                        with instrument.span("db insert", collection=t.slug,
+                                             analysis=item.slug):
+                            comboset.generate(save=False)
+                            ComparisonUnit.save_queue()
+                        PopulateCheckpoint(service=service,
+                                           superset_slug=item.slug,
+                                           collectiontype_slug=t.slug).save()
     # populate comparison sets from classes
 
-    ComparisonLabel.generate(service)
+    with instrument.span("label generation"):
+        ComparisonLabel.generate(service)
+
+    with instrument.span("effect sizes"):
+        effect_size.update_service(service)
+
+    with instrument.span("read model"):
+        read_model.rebuild(service)
+
+    with instrument.span("findings"):
+        findings.rebuild(service)
+
+    # finished - only the marker is left, cleared by the next fresh run
+    PopulateCheckpoint.objects.filter(service=service).delete()
+    PopulateCheckpoint(service=service, superset_slug=service_complete,
+                       collectiontype_slug="").save()
+
+    # pages cached at runtime against the old data are now stale
+    DataVersion.bump()
+
+    instrument.write_report("populate_" + service.slug)
 
 
 def populate_wdtk():
+    from .generate.wdtk import wdtk_register
 
     wdtk_register.run_all()
     name = "WhatDoTheyKnow survey"
     slug = ("wdtk")
-    Service.objects.filter(slug=slug).delete()
+    clear_service(slug)
     service, new = Service.objects.get_or_create(
         name=name, slug=slug, collective_name="Requests", singular_name="Request")
 
-    ComparisonGroup.objects.filter(service=service).delete()
     # create comparison groups
-    ComparisonGroup(name="Request",
-                    slug=slugify("Request"),
-                    service=service,
-                    order=0).queue()
-    ComparisonGroup(name="Demographics",
-                    slug=slugify("Demographics"),
-                    service=service,
-                    order=1).queue()
-    ComparisonGroup(name="Participation",
-                    slug=slugify("Participation"),
-                    service=service,
-                    order=2).queue()
-    ComparisonGroup(name="WDTK",
-                    slug=slugify("WDTK"),
-                    service=service,
-                    order=3).queue()
-
-    ComparisonGroup.save_queue()
+    create_groups(service, [
+        ("Request", 0),
+        ("Demographics", 1),
+        ("Participation", 2),
+        ("WDTK", 3)])
 
     populate_service(service, wdtk_register)
 
 
 def populate_all_fms():
+    from .generate.fms import fms_register, fms_no_cobrands, year_clones
 
     fms_register.run_all()
     fms_no_cobrands.run_all()
@@ -269,8 +316,12 @@ def populate_all_fms():
     for y in year_clones:
         populate_fms_year(y)
 
+    trends.rebuild("fms")
+    DataVersion.bump()
+
 
 def populate_all_wtt():
+    from .generate.wtt import wtt_register, wtt_mp_only, wtt_year_clones
 
     wtt_register.run_all()
     wtt_mp_only.run_all()
@@ -282,9 +333,25 @@ def populate_all_wtt():
     for y in wtt_year_clones:
         populate_wtt_year(y)
 
+    trends.rebuild("wtt")
+    DataVersion.bump()
+
+
+def clear_completed(family):
+    """
+    a fresh run starts the services of a family (fms, fms_2019 ...) again
+    """
+    if resume is False:
+        PopulateCheckpoint.objects.filter(
+            service__slug__startswith=family,
+            superset_slug=service_complete).delete()
+
 
 def populate(service=["all"]):
     service = service[0].lower().strip()
+    for family in ["fms", "wtt", "wdtk"]:
+        if service in ["all", family]:
+            clear_completed(family)
     if service in ["all", "fms"]:
         populate_all_fms()
     if service in ["all", "wtt"]:
@@ -0,0 +1,187 @@
+"""
+Write precompressed .gz and .br siblings for the baked site
+
+Lets the web server serve compressed files directly (gzip_static/brotli_static)
+rather than compressing every html and json response on request.
+A manifest of content hashes (kept in _cache, outside the published
+folder) means unchanged files are not recompressed on the next run, and
+the siblings of files that have gone or dropped below min_size since the
+last run are removed rather than left to be served.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+text_extensions = [".html", ".json", ".js", ".css", ".svg", ".csv", ".txt",
+                   ".xml"]
+manifest_folder = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "_cache", "precompress")
+
+# used to group the report by kind of page (follows the url patterns in views)
+page_types = [("comparison", re.compile(r"/item/[^/]+/comparison/")),
+              ("category", re.compile(r"/item/")),
+              ("analysis charts", re.compile(r"/analysis/charts/")),
+              ("label", re.compile(r"/analysis/[^/]+/")),
+              ("chart data", re.compile(r"/media/chart_data/")),
+              ("static", re.compile(r"/static/")),
+              ("media", re.compile(r"/media/")),
+              ]
+
+
+def page_type(path):
+    path = "/" + path.replace(os.sep, "/")
+    for name, pattern in page_types:
+        if pattern.search(path):
+            if name in ["static", "media"]:
+                return "{0} ({1})".format(name, os.path.splitext(path)[1])
+            return name
+    return "other"
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def compress_file(path, use_brotli=True):
+    """
+    write compressed versions of path, returns (raw, gzip, brotli) sizes
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+
+    gz_content = gzip.compress(content, compresslevel=9, mtime=0)
+    with open(path + ".gz", "wb") as f:
+        f.write(gz_content)
+
+    br_size = 0
+    if use_brotli and brotli:
+        br_content = brotli.compress(content, quality=11)
+        with open(path + ".br", "wb") as f:
+            f.write(br_content)
+        br_size = len(br_content)
+    elif os.path.exists(path + ".br"):
+        # would be stale now the source has changed
+        os.remove(path + ".br")
+
+    return len(content), len(gz_content), br_size
+
+
+def default_manifest_path(folder):
+    """
+    one manifest per bake folder, kept out of what gets published
+    """
+    key = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()
+    return os.path.join(manifest_folder, key[:12] + ".json")
+
+
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path) is False:
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def remove_siblings(folder, rel_paths):
+    """
+    delete the .gz/.br written for files that are no longer compressed
+    """
+    removed = 0
+    for rel_path in rel_paths:
+        for ext in [".gz", ".br"]:
+            path = os.path.join(folder, rel_path + ext)
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def existing_sizes(path):
+    sizes = [os.path.getsize(path)]
+    for ext in [".gz", ".br"]:
+        if os.path.exists(path + ext):
+            sizes.append(os.path.getsize(path + ext))
+        else:
+            sizes.append(0)
+    return tuple(sizes)
+
+
+def text_files(folder, min_size):
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in text_extensions:
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) >= min_size:
+                yield path
+
+
+def precompress(folder, min_size=1024, workers=None, use_brotli=True,
+                manifest_path=None):
+    """
+    compress all text assets in folder above min_size bytes
+    returns report of sizes by page type
+    """
+    if use_brotli and brotli is None:
+        print("brotli module not installed, only writing .gz files")
+
+    if manifest_path is None:
+        manifest_path = default_manifest_path(folder)
+    manifest = load_manifest(manifest_path)
+
+    def process(path):
+        rel_path = os.path.relpath(path, folder)
+        digest = file_hash(path)
+        outputs_present = os.path.exists(path + ".gz")
+        if use_brotli and brotli:
+            outputs_present = outputs_present and os.path.exists(path + ".br")
+        if manifest.get(rel_path) == digest and outputs_present:
+            return rel_path, digest, False, existing_sizes(path)
+        return rel_path, digest, True, compress_file(path, use_brotli)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(process, text_files(folder, min_size)))
+
+    report = OrderedDict()
+    new_manifest = {}
+    changed = 0
+    for rel_path, digest, was_compressed, sizes in results:
+        new_manifest[rel_path] = digest
+        changed += was_compressed
+        row = report.setdefault(page_type(rel_path), [0, 0, 0, 0])
+        row[0] += 1
+        for n, size in enumerate(sizes):
+            row[n + 1] += size
+
+    orphaned = [x for x in manifest if x not in new_manifest]
+    removed = remove_siblings(folder, orphaned)
+
+    if os.path.exists(os.path.dirname(manifest_path)) is False:
+        os.makedirs(os.path.dirname(manifest_path))
+    with open(manifest_path, "w") as f:
+        json.dump(new_manifest, f)
+
+    print("{0} files compressed, {1} unchanged, {2} stale removed".format(
+        changed, len(results) - changed, removed))
+    print_report(report)
+    return report
+
+
+def print_report(report):
+    template = "{0:<24}{1:>8}{2:>14}{3:>14}{4:>14}"
+    print(template.format("type", "files", "raw", "gzip", "brotli"))
+    totals = [0, 0, 0, 0]
+    for name, row in sorted(report.items(), key=lambda x: x[1][1],
+                            reverse=True):
+        print(template.format(name, *["{:,}".format(x) for x in row]))
+        totals = [x + y for x, y in zip(totals, row)]
+    print(template.format("total", *["{:,}".format(x) for x in totals]))
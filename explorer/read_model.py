@@ -0,0 +1,319 @@
+"""
+Precomputed page context for the heaviest views
+
+ComparisonSetView, AnalysisView and CollectionItemView build their
+charts and tables from joins over the comparison units on every render.
+After populate, rebuild(service) stores the finished result for every
+page of these views in PageContext, keyed by view and args: chart specs
+(with the data kept beside them so the bake can still move it out of
+the page, see chart_data), table html, and for the item pages the
+groups and sets to show. The views render from that row when there is
+one and build as before when there isn't (or PAGE_READ_MODEL is off).
+
+Each row has a signature of what it was built from - the grid files of
+the sets it shows, the names that appear on the page and
+READ_MODEL_VERSION (bump this when the charts or tables change) - and
+only pages whose signature has changed are rebuilt.
+"""
+import copy
+import hashlib
+import json
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils.safestring import mark_safe
+
+from . import vl_spec as vl
+from .chart_data import enable_external_chart_data
+from .models import (ComparisonGroup, ComparisonLabel, ComparisonSet,
+                     ComparisonUnit, CollectionType, PageContext)
+
+READ_MODEL_VERSION = 2
+
+
+def enabled():
+    return getattr(settings, "PAGE_READ_MODEL", False)
+
+
+class StoredChart(vl.SpecChart):
+    """
+    chart from a stored spec - data goes through the active transformer
+    """
+
+    def __init__(self, spec, values, name=""):
+        enable_external_chart_data()
+        super().__init__(None, name=name)
+        self.spec = spec
+        self.values = values
+
+    def to_dict(self):
+        spec = copy.deepcopy(self.spec)
+        spec["data"] = vl.chart_data({"values": self.values})
+        return spec
+
+
+class StoredTable(object):
+
+    def __init__(self, html, name=""):
+        self.html = html
+        self.name = name
+
+    def render_div(self):
+        return mark_safe(self.html)
+
+    def render_code(self):
+        return ""
+
+
+def is_table(item):
+    from research_common.charts import Table
+    return isinstance(item, (Table, StoredTable))
+
+
+def chart_spec(chart):
+    spec = chart.to_dict()
+    for k in ["data", "datasets"]:
+        spec.pop(k, None)
+    values = json.loads(chart.df.to_json(orient="records"))
+    return {"spec": spec, "values": values, "name": chart.name}
+
+
+def serialize(context):
+    """
+    charts and tables to json-able dicts
+    """
+    data = {"charts": {}, "tables": {}}
+    for k, v in context.items():
+        if is_table(v):
+            data["tables"][k] = {"html": str(v.render_div()),
+                                 "name": v.name}
+        else:
+            data["charts"][k] = chart_spec(v)
+    return data
+
+
+def deserialize(data):
+    context = {k: StoredChart(**v) for k, v in data["charts"].items()}
+    context.update({k: StoredTable(**v) for k, v in data["tables"].items()})
+    return context
+
+
+# contexts - shared by the views and rebuild
+
+
+def comparison_context(comparison_set, category):
+    cs = comparison_set
+    return {"chart": cs.get_chart(category),
+            "tidy_chart": cs.get_chart(category, tidy=True),
+            "tidy_percent_row_chart": cs.get_chart(
+                category, tidy=True, percentage="row"),
+            "tidy_percent_column_chart": cs.get_chart(
+                category, tidy=True, percentage="column"),
+            "expected_chart": cs.get_expected_comparison_chart(category),
+            "percentage_diff": cs.get_comparison_chart(category, True),
+            "absolute_diff": cs.get_comparison_chart(category, False),
+            "table": cs.get_table(category)}
+
+
+def analysis_context(label, collection_type, superset):
+    return {"table": label.label_table(collection_type, superset),
+            "label_chart": label.label_chart(collection_type, superset),
+            "label_chart_p": label.label_chart(collection_type, superset,
+                                               percentage=True)}
+
+
+def item_sets(category, collection, group):
+    """
+    populated sets in the group for this item, each with its chart
+    ordered by priority then effect size
+    """
+    populated = ComparisonUnit.objects.filter(
+        parent=OuterRef("pk"), collection=category).exclude(value=0)
+    sets = group.get_sets(collection).annotate(
+        populated=Exists(populated)).filter(populated=True)
+    sets = sets.select_related("superset", "collectiontype")
+    sets = list(sets.order_by("-superset__priority", "-cramers_v",
+                              "superset__name"))
+
+    for s in sets:
+        s.chart = s.get_chart(category)
+    return sets
+
+
+# lookup from the views
+
+
+def page_key(name, args):
+    return "/".join([name] + [str(x) for x in args])
+
+
+def view_key(view):
+    args = []
+    for a in view.args:
+        if isinstance(a, (list, tuple)):
+            a = a[0]
+        args.append(getattr(view, a))
+    return page_key(view.read_model_name, args)
+
+
+def load(view):
+    """
+    stored data for the view's page or None
+    """
+    if enabled() is False:
+        return None
+    data = PageContext.objects.filter(
+        pk=view_key(view)).values_list("data", flat=True).first()
+    if data is None:
+        return None
+    return json.loads(data)
+
+
+def stored_item(data, service, collection):
+    """
+    (groups, sets with charts) for a CollectionItemView page
+    """
+    lookup = {x.slug: x for x in ComparisonGroup.objects.filter(
+        service=service, slug__in=data["groups"])}
+    groups = [ComparisonGroup(name="All", slug="all", service=service),
+              ComparisonGroup(name="Overview", slug="overview",
+                              service=service)]
+    groups += [lookup[x] for x in data["groups"] if x in lookup]
+
+    sets = ComparisonSet.objects.filter(collectiontype=collection,
+                                        superset__slug__in=[
+                                            x[0] for x in data["sets"]])
+    sets = {x.superset.slug: x for x in sets.select_related("superset")}
+    ordered = []
+    for slug, chart in data["sets"]:
+        if slug in sets:
+            s = sets[slug]
+            s.chart = StoredChart(**chart)
+            ordered.append(s)
+    return groups, ordered
+
+
+# rebuild after populate
+
+_file_hashes = {}
+
+
+def file_hash(path):
+    if path not in _file_hashes:
+        try:
+            with open(path, "rb") as f:
+                _file_hashes[path] = hashlib.sha1(f.read()).hexdigest()
+        except (IOError, TypeError):
+            _file_hashes[path] = None
+    return _file_hashes[path]
+
+
+def signature(*parts):
+    content = json.dumps([READ_MODEL_VERSION] + list(parts), default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def set_signature(cs):
+    superset = cs.superset
+    collectiontype = cs.collectiontype
+    return [superset.slug, superset.name, superset.h_label,
+            superset.priority, collectiontype.slug, collectiontype.name,
+            cs.cramers_v, file_hash(cs.source_file)]
+
+
+def service_pages(service):
+    """
+    (key, signature, build) for every stored page of the service
+    build returns the data to store
+    """
+    names = [service.name, service.collective_name, service.singular_name]
+    sets = ComparisonSet.objects.filter(
+        superset__group__service=service).select_related(
+            "superset", "collectiontype")
+    set_lookup = {(x.superset.slug, x.collectiontype_id): x for x in sets}
+
+    # ComparisonSetView
+    for cs in set_lookup.values():
+        base = set_signature(cs)
+        for category in cs.collectiontype.items.all():
+            key = page_key("comparison", [service.slug,
+                                          cs.collectiontype.slug,
+                                          category.slug,
+                                          cs.superset.slug])
+            yield (key, signature(names, base, category.name),
+                   lambda cs=cs, category=category: serialize(
+                       comparison_context(cs, category)))
+
+    # AnalysisView
+    types = list(CollectionType.objects.filter(service=service))
+    labels = ComparisonLabel.objects.filter(parent__group__service=service)
+    for label in labels.select_related("parent"):
+        superset = label.parent
+        for t in types:
+            if t.applies_to_superset(superset) is False:
+                continue
+            cs = set_lookup.get((superset.slug, t.id))
+            if cs is None:
+                continue
+            key = page_key("analysis", [service.slug, superset.slug,
+                                        label.slug, t.slug])
+            yield (key, signature(names, set_signature(cs), label.name),
+                   lambda label=label, t=t, superset=superset: serialize(
+                       analysis_context(label, t, superset)))
+
+    # CollectionItemView
+    for t in types:
+        for category in t.items.all():
+            groups = ComparisonGroup.get_all(service, category)
+            group_slugs = [x.slug for x in groups[2:]]
+            for group in groups:
+                shown = [set_signature(x) for x in group.get_sets(t)
+                         .select_related("superset", "collectiontype")]
+                key = page_key("item", [service.slug, t.slug,
+                                        category.slug, group.slug])
+
+                def build(category=category, t=t, group=group,
+                          group_slugs=group_slugs):
+                    sets = item_sets(category, t, group)
+                    return {"groups": group_slugs,
+                            "sets": [[x.superset.slug, chart_spec(x.chart)]
+                                     for x in sets]}
+
+                yield (key, signature(names, shown, category.name,
+                                      group_slugs), build)
+
+
+def save_batch(batch):
+    PageContext.objects.filter(key__in=[x.key for x in batch]).delete()
+    PageContext.objects.bulk_create(batch)
+
+
+def rebuild(service, force=False, batch_size=500):
+    """
+    store contexts for pages that are new or whose inputs changed
+    and remove those for pages that no longer exist
+    """
+    _file_hashes.clear()
+    existing = dict(PageContext.objects.filter(
+        service=service).values_list("key", "signature"))
+    seen = set()
+    changed = 0
+    batch = []
+    for key, sig, build in service_pages(service):
+        seen.add(key)
+        if force is False and existing.get(key) == sig:
+            continue
+        data = json.dumps(build(), separators=(",", ":"), default=str)
+        batch.append(PageContext(key=key, service=service, signature=sig,
+                                 data=data))
+        changed += 1
+        if len(batch) >= batch_size:
+            save_batch(batch)
+            batch = []
+    save_batch(batch)
+
+    removed = [x for x in existing if x not in seen]
+    PageContext.objects.filter(key__in=removed).delete()
+    print("read model {0}: {1} pages rebuilt, {2} unchanged, {3} removed"
+          .format(service.slug, changed, len(seen) - changed, len(removed)))
+    return changed
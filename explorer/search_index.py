@@ -0,0 +1,166 @@
+"""
+Prebuilt search index for the category and label typeahead
+
+For each service the bake writes search/[service].[hash].json holding
+every collection item, sub collection item (e.g. the SHEF category
+children, linking to their parent's page) and comparison label with the
+path of its page, and a sorted list of normalised search keys pointing
+at them. Each name is keyed from the start of every word, so the client
+(web/js/explorer_search.js) finds a prefix with a binary search over
+the keys and needs no server.
+
+search/index.json maps each service to its current file. The service
+files are named by their content hash so can be cached indefinitely,
+and are compact, sorted json that compresses well.
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+from django.conf import settings
+from django.urls import reverse
+
+from .models import (CollectionItem, CollectionType, ComparisonLabel,
+                     ComparisonSet, Service, SubCollectionItem)
+
+join = os.path.join
+
+index_version = 1
+
+kinds = ["item", "sub", "label"]
+
+
+def search_folder():
+    return join(settings.BAKE_LOCATION, "sites", settings.SITE_SLUG,
+                "search")
+
+
+def search_url(filename):
+    return "/sites/{0}/search/{1}".format(settings.SITE_SLUG, filename)
+
+
+def normalise(text):
+    """
+    lower case ascii words - must match normalise in explorer_search.js
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    # marks (unicode category M) - the \p{M} explorer_search.js strips
+    text = "".join(x for x in text
+                   if not unicodedata.category(x).startswith("M"))
+    text = re.sub(r"[^a-z0-9]+", " ", text.lower())
+    return text.strip()
+
+
+def word_keys(text):
+    """
+    the name from the start of each word
+    """
+    words = normalise(text).split(" ")
+    return [" ".join(words[n:]) for n in range(len(words)) if words[n]]
+
+
+def service_records(service):
+    """
+    (name, kind, url, context) for everything searchable in the service
+    """
+    records = []
+    collections = {x.id: x for x in CollectionType.objects.filter(
+        service=service)}
+
+    items = CollectionItem.objects.filter(parent__service=service)
+    item_urls = {}
+    for i in items:
+        collection = collections[i.parent_id]
+        url = reverse('exp_category_view', args=(service.slug,
+                                                 collection.slug, i.slug))
+        item_urls[i.id] = url
+        records.append((i.name, "item", url, collection.name))
+
+    children = SubCollectionItem.objects.filter(
+        parent__parent__service=service).select_related("parent")
+    for c in children:
+        records.append((c.name, "sub", item_urls[c.parent_id],
+                        c.parent.name))
+
+    # labels go to the default collection type if it has that analysis
+    applies = {}
+    for superset_id, collection_id in ComparisonSet.objects.filter(
+            collectiontype__service=service).values_list(
+                "superset_id", "collectiontype_id"):
+        applies.setdefault(superset_id, []).append(collection_id)
+    ordered = sorted(collections.values(),
+                     key=lambda x: (x.default is False, x.name))
+    labels = ComparisonLabel.objects.filter(
+        parent__group__service=service).select_related("parent")
+    for label in labels:
+        options = [x for x in ordered
+                   if x.id in applies.get(label.parent_id, [])]
+        if not options:
+            continue
+        url = reverse('exp_label_view', args=(service.slug,
+                                              label.parent.slug,
+                                              label.slug,
+                                              options[0].slug))
+        records.append((label.name, "label", url, label.parent.name))
+    return records
+
+
+def build_index(service):
+    records = sorted(set(service_records(service)),
+                     key=lambda x: (normalise(x[0]), x))
+    base = os.path.commonprefix([x[2] for x in records]) if records else ""
+    base = base[:base.rfind("/") + 1]
+
+    keys = []
+    for n, (name, kind, url, context) in enumerate(records):
+        for key in word_keys(name):
+            keys.append((key, n))
+    keys = sorted(set(keys))
+
+    return {"version": index_version,
+            "service": service.slug,
+            "base": base,
+            "kinds": kinds,
+            "records": [[name, kinds.index(kind), url[len(base):], context]
+                        for name, kind, url, context in records],
+            "keys": [x[0] for x in keys],
+            "refs": [x[1] for x in keys]}
+
+
+def write_index(service, folder):
+    """
+    write [service].[hash].json, removing older versions
+    """
+    content = json.dumps(build_index(service), separators=(",", ":"),
+                         ensure_ascii=False).encode("utf-8")
+    digest = hashlib.sha1(content).hexdigest()[:12]
+    filename = "{0}.{1}.json".format(service.slug, digest)
+    path = join(folder, filename)
+    if os.path.exists(path) is False:
+        temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    pattern = re.compile(r"^{0}\.[0-9a-f]{{12}}\.json$".format(
+        re.escape(service.slug)))
+    for old in os.listdir(folder):
+        if pattern.match(old) and old != filename:
+            os.remove(join(folder, old))
+    print("search {0}: {1}KB".format(service.slug, len(content) // 1024))
+    return filename
+
+
+def write_search(folder=None):
+    if folder is None:
+        folder = search_folder()
+    if os.path.exists(folder) is False:
+        os.makedirs(folder)
+    services = {}
+    for service in Service.objects.all().order_by("slug"):
+        services[service.slug] = search_url(write_index(service, folder))
+    with open(join(folder, "index.json"), "w") as f:
+        json.dump({"version": index_version, "services": services}, f,
+                  separators=(",", ":"))
+    return folder
@@ -0,0 +1,208 @@
+"""
+Static JSON API of the crosstabs, written alongside the bake
+
+    api/index.json                                services
+    api/[service]/index.json                      collections, supersets
+                                                  and their set files
+    api/[service]/[collection]/index.json         items and set files
+    api/[service]/sets/[superset]__[collection].json
+
+Each set file holds the whole matrix for one ComparisonSet in columnar
+form - labels (columns), items (rows), and counts, expected values and
+standardised residuals as item x label lists (null where there is no
+cell) with the row and column totals and the chi-square results - so a
+page or a third party can draw any chart for the table from one
+cacheable file.
+
+Files are only rewritten when their content changes (and set files for
+tables that are gone are removed), and the indexes carry a short content
+hash of each set file for cache busting.
+"""
+import hashlib
+import json
+import os
+from itertools import groupby
+
+from django.conf import settings
+
+from .models import (CollectionItem, CollectionType, ComparisonSet,
+                     ComparisonUnit, Service)
+
+join = os.path.join
+
+api_version = 1
+
+
+def api_folder():
+    return join(settings.BAKE_LOCATION, "sites", settings.SITE_SLUG, "api")
+
+
+def api_url(*parts):
+    return "/sites/{0}/api/{1}".format(settings.SITE_SLUG, "/".join(parts))
+
+
+def write_json(path, data):
+    """
+    write if changed - returns short content hash
+    """
+    content = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+    content = content.encode("utf-8")
+    digest = hashlib.sha1(content).hexdigest()[:12]
+    existing = None
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            existing = f.read()
+    if existing != content:
+        folder = os.path.dirname(path)
+        if os.path.exists(folder) is False:
+            os.makedirs(folder)
+        temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    return digest
+
+
+def set_filename(cs):
+    return "{0}__{1}.json".format(cs.superset.slug, cs.collectiontype.slug)
+
+
+def set_matrix(cs, units, items):
+    """
+    units in label order for one set, items [(id, slug, name)]
+    """
+    labels = []
+    label_slugs = []
+    column_totals = []
+    cells = {}
+    row_totals = {}
+    for u in units:
+        collection_id, label, label_slug, value, expected, chi, row, col = u
+        if label_slug not in label_slugs:
+            label_slugs.append(label_slug)
+            labels.append(label)
+            column_totals.append(col)
+        cells[(collection_id, label_slug)] = (value, expected, chi)
+        row_totals[collection_id] = row
+
+    # only items with a row in this table
+    items = [x for x in items if x[0] in row_totals]
+
+    def grid(index):
+        return [[cells[(i[0], l)][index] if (i[0], l) in cells else None
+                 for l in label_slugs] for i in items]
+
+    return {"version": api_version,
+            "service": cs.superset.group.service.slug,
+            "superset": {"slug": cs.superset.slug,
+                         "name": cs.superset.name,
+                         "h_label": cs.superset.h_label,
+                         "group": cs.superset.group.slug},
+            "collection": {"slug": cs.collectiontype.slug,
+                           "name": cs.collectiontype.name},
+            "grand_total": cs.grand_total,
+            "chi2": cs.chi2,
+            "p": cs.p,
+            "dof": cs.dof,
+            "cramers_v": cs.cramers_v,
+            "labels": labels,
+            "label_slugs": label_slugs,
+            "items": [x[2] for x in items],
+            "item_slugs": [x[1] for x in items],
+            "counts": grid(0),
+            "expected": grid(1),
+            "residuals": grid(2),
+            "row_totals": [row_totals[x[0]] for x in items],
+            "column_totals": column_totals}
+
+
+def write_service(service, folder):
+    """
+    set files and indexes for one service - returns the service index
+    """
+    service_folder = join(folder, service.slug)
+    collections = list(CollectionType.objects.filter(
+        service=service).order_by("name"))
+    items = {c.id: [] for c in collections}
+    for i in CollectionItem.objects.filter(
+            parent__service=service).order_by("name"):
+        items[i.parent_id].append((i.id, i.slug, i.name))
+
+    sets = ComparisonSet.objects.filter(superset__group__service=service)
+    sets = {x.id: x for x in sets.select_related(
+        "superset", "superset__group", "superset__group__service",
+        "collectiontype")}
+
+    # one pass over the units of the service, a set at a time
+    units = ComparisonUnit.objects.filter(parent_id__in=list(sets))
+    units = units.order_by("parent_id", "order").values_list(
+        "parent_id", "collection_id", "label", "label_slug", "value",
+        "expected_value", "chi_value", "row_total", "column_total")
+
+    set_files = []
+    for set_id, ll in groupby(units.iterator(), lambda x: x[0]):
+        cs = sets[set_id]
+        matrix = set_matrix(cs, [x[1:] for x in ll],
+                            items[cs.collectiontype_id])
+        filename = set_filename(cs)
+        digest = write_json(join(service_folder, "sets", filename), matrix)
+        set_files.append({"superset": cs.superset.slug,
+                          "collection": cs.collectiontype.slug,
+                          "group": cs.superset.group.slug,
+                          "url": api_url(service.slug, "sets", filename),
+                          "hash": digest})
+
+    # tables that no longer exist
+    written = [x["url"].split("/")[-1] for x in set_files]
+    sets_folder = join(service_folder, "sets")
+    if os.path.exists(sets_folder):
+        for filename in os.listdir(sets_folder):
+            if filename.endswith(".json") and filename not in written:
+                os.remove(join(sets_folder, filename))
+
+    for c in collections:
+        write_json(join(service_folder, c.slug, "index.json"), {
+            "version": api_version,
+            "service": service.slug,
+            "slug": c.slug,
+            "name": c.name,
+            "description": c.description,
+            "items": [{"slug": x[1], "name": x[2]} for x in items[c.id]],
+            "sets": [x for x in set_files if x["collection"] == c.slug]})
+
+    supersets = {}
+    for cs in sets.values():
+        s = cs.superset
+        supersets[s.slug] = {"slug": s.slug, "name": s.name,
+                             "h_label": s.h_label, "group": s.group.slug,
+                             "overview": s.overview, "priority": s.priority}
+
+    index = {"version": api_version,
+             "slug": service.slug,
+             "name": service.name,
+             "collective_name": service.collective_name,
+             "singular_name": service.singular_name,
+             "collections": [{"slug": c.slug, "name": c.name,
+                              "default": c.default,
+                              "url": api_url(service.slug, c.slug,
+                                             "index.json")}
+                             for c in collections],
+             "supersets": sorted(supersets.values(),
+                                 key=lambda x: (-x["priority"], x["name"])),
+             "sets": set_files}
+    write_json(join(service_folder, "index.json"), index)
+    print("api {0}: {1} set files".format(service.slug, len(set_files)))
+    return index
+
+
+def write_api(folder=None):
+    if folder is None:
+        folder = api_folder()
+    services = []
+    for service in Service.objects.all().order_by("name"):
+        write_service(service, folder)
+        services.append({"slug": service.slug, "name": service.name,
+                         "url": api_url(service.slug, "index.json")})
+    write_json(join(folder, "index.json"), {"version": api_version,
+                                            "services": services})
+    return folder
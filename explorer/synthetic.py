@@ -0,0 +1,247 @@
+"""
+Synthetic source files for benchmarking the generation step
+
+The real FMS, WTT and WDTK exports aren't public, so this writes files
+with the same names and columns the generate modules read, at a given
+number of rows. LSOAs, categories and survey answers are drawn from the
+lookup tables in resources/ so every analysis has something to match.
+
+    python -m explorer.synthetic _sources/synthetic 100k
+
+Rows are written in chunks so the 10m scale doesn't need to fit in memory.
+"""
+import csv
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+join = os.path.join
+
+scales = {"100k": 100000,
+          "1m": 1000000,
+          "10m": 10000000}
+
+chunk_size = 500000
+timestamp_format = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def scale_rows(scale):
+    if str(scale).lower() in scales:
+        return scales[str(scale).lower()]
+    return int(scale)
+
+
+def lsoas():
+    ruc = pd.read_csv(join("resources", "fms", "composite_ruc.csv"),
+                      usecols=["lsoa"])
+    return ruc["lsoa"].values
+
+
+def categories():
+    """
+    fms categories with their A/B/C groupings
+    """
+    df = None
+    for level in ["SHEF_A", "SHEF_B", "SHEF_C"]:
+        level_df = pd.read_csv(join("resources", "fms", level + ".csv"),
+                               usecols=["category", level])
+        level_df = level_df.drop_duplicates("category")
+        if df is None:
+            df = level_df
+        else:
+            df = df.merge(level_df, on="category")
+    return df
+
+
+def recipient_types():
+    try:
+        types = pd.read_excel(join("resources", "wtt", "type_lookup.xlsx"))
+        return types["short"].values
+    except Exception:
+        return np.array(["WMC", "SPC", "SPE", "WAC", "WAE", "LBW",
+                         "DIW", "CED", "UTW", "MTW", "LAC", "LAE"])
+
+
+def random_timestamps(rng, rows, start_year, end_year, date_format):
+    start = pd.Timestamp(year=start_year, month=1, day=1).value // 10 ** 9
+    end = pd.Timestamp(year=end_year + 1, month=1, day=1).value // 10 ** 9
+    seconds = rng.randint(start, end, size=rows)
+    micro = rng.randint(0, 1000000, size=rows)
+    stamps = pd.to_datetime(seconds, unit="s") + \
+        pd.to_timedelta(micro, unit="us")
+    return pd.Series(stamps).dt.strftime(date_format).values
+
+
+def choice(rng, values, rows, p=None):
+    return np.asarray(values)[rng.choice(len(values), size=rows, p=p)]
+
+
+def write_chunk(df, path, first):
+    df.to_csv(path, index=False, mode="w" if first else "a",
+              header=first)
+
+
+def chunks(rows):
+    start = 0
+    while start < rows:
+        end = min(rows, start + chunk_size)
+        yield start, end
+        start = end
+
+
+def write_fms(folder, rows, seed=0):
+    """
+    merged_points_whole_years.csv and the id keyed side files
+    """
+    rng = np.random.RandomState(seed)
+    os.makedirs(folder, exist_ok=True)
+    all_lsoas = lsoas()
+    cats = categories()
+    cobrands = ["fixmystreet", None, "bromley", "oxfordshire", "tfl"]
+    services = ["desktop", "Open311", "iPhone", "Android", "mobile", None]
+
+    for start, end in chunks(rows):
+        n = end - start
+        first = start == 0
+        ids = np.arange(start + 1, end + 1)
+        picked = cats.iloc[rng.randint(0, len(cats), size=n)]
+        df = pd.DataFrame({
+            "id": ids,
+            "created": random_timestamps(rng, n, 2007,
+                                         settings.FMS_CURRENT_YEAR,
+                                         timestamp_format),
+            "category": picked["category"].values,
+            "SHEF_A": picked["SHEF_A"].values,
+            "SHEF_B": picked["SHEF_B"].values,
+            "SHEF_C": picked["SHEF_C"].values,
+            "cobrand": choice(rng, cobrands, n, [0.6, 0.2, 0.1, 0.05, 0.05]),
+            "derived_gender": choice(rng, ["male", "female", "unknown"], n,
+                                     [0.45, 0.35, 0.2]),
+            "lsoa": choice(rng, all_lsoas, n),
+            "first_report_by_user": rng.rand(n) < 0.4,
+        })
+        write_chunk(df, join(folder, "merged_points_whole_years.csv"), first)
+
+        write_chunk(pd.DataFrame({"id": ids[rng.rand(n) < 0.3]}),
+                    join(folder, "photo_ids.csv"), first)
+
+        fixed = ids[rng.rand(n) < 0.4]
+        write_chunk(pd.DataFrame({
+            "id": fixed,
+            "state": choice(rng, ["fixed - user", "fixed - council"],
+                            len(fixed), [0.7, 0.3])}),
+            join(folder, "fixed_ids.csv"), first)
+
+        surveyed = ids[rng.rand(n) < 0.05]
+        write_chunk(pd.DataFrame({
+            "id": surveyed,
+            "ever_reported": rng.randint(0, 2, size=len(surveyed))}),
+            join(folder, "survey_response.csv"), first)
+
+        write_chunk(pd.DataFrame({
+            "id": ids,
+            "user_count": rng.zipf(1.6, size=n).clip(1, 500)}),
+            join(folder, "first_report.csv"), first)
+
+        write_chunk(pd.DataFrame({
+            "id": ids,
+            "service": choice(rng, services, n,
+                              [0.5, 0.1, 0.15, 0.15, 0.05, 0.05])}),
+            join(folder, "service_ids.csv"), first)
+
+
+def write_wtt(folder, rows, seed=0):
+    """
+    merged_points_whole_years.csv and questionnaire files
+    """
+    rng = np.random.RandomState(seed)
+    os.makedirs(folder, exist_ok=True)
+    all_lsoas = lsoas()
+    types = recipient_types()
+    genders = ["male", "female", "unknown"]
+
+    for start, end in chunks(rows):
+        n = end - start
+        first = start == 0
+        ids = np.arange(start + 1, end + 1)
+        df = pd.DataFrame({
+            "id": ids,
+            "to_timestamp": random_timestamps(rng, n, 2005,
+                                              settings.WTT_CURRENT_YEAR,
+                                              timestamp_format),
+            "recipient_type": choice(rng, types, n),
+            "recipient_gender": choice(rng, genders, n, [0.6, 0.35, 0.05]),
+            "sender_gender": choice(rng, genders, n, [0.45, 0.4, 0.15]),
+            "lsoa": choice(rng, all_lsoas, n),
+        })
+        write_chunk(df, join(folder, "merged_points_whole_years.csv"), first)
+
+        for filename in ["questionnaire_first_time.csv",
+                         "questionnaire_get_response.csv"]:
+            answered = ids[rng.rand(n) < 0.2]
+            write_chunk(pd.DataFrame({
+                "message_id": answered,
+                "answer": choice(rng, ["yes", "no", "Unsatisfactory"],
+                                 len(answered), [0.5, 0.4, 0.1])}),
+                join(folder, filename), first)
+
+
+def survey_answers():
+    """
+    qid -> list of numeric answer ids from the wdtk survey lookup
+    """
+    answers = {}
+    with open(join("resources", "wdtk", "survey_lookup.csv"),
+              encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            if row["aid"].isdigit() and "select" not in row["aname"]:
+                answers.setdefault(row["qid"], []).append(int(row["aid"]))
+    return answers
+
+
+def write_wdtk(folder, rows, seed=0):
+    """
+    survey_reduced.csv with an answer for every survey question
+    """
+    rng = np.random.RandomState(seed)
+    os.makedirs(folder, exist_ok=True)
+    answers = survey_answers()
+
+    for start, end in chunks(rows):
+        n = end - start
+        first = start == 0
+        df = pd.DataFrame({
+            "id": np.arange(start + 1, end + 1),
+            "whenstored": random_timestamps(rng, n, 2012,
+                                            settings.WDTK_CURRENT_YEAR,
+                                            "%d/%m/%Y")})
+        for qid, options in answers.items():
+            df[qid] = choice(rng, options, n)
+        write_chunk(df, join(folder, "survey_reduced.csv"), first)
+
+
+writers = {"fms": write_fms,
+           "wtt": write_wtt,
+           "wdtk": write_wdtk}
+
+
+def write_all(root, scale, services=None, seed=0):
+    """
+    write synthetic sources for each service into root/[service]
+    """
+    rows = scale_rows(scale)
+    for service in services or list(writers.keys()):
+        folder = join(root, service)
+        print("writing {0} rows of synthetic {1} data to {2}".format(
+            rows, service, folder))
+        writers[service](folder, rows, seed=seed)
+
+
+if __name__ == "__main__":
+    import django
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "proj.settings")
+    django.setup()
+    write_all(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "100k")
@@ -0,0 +1,301 @@
+"""
+Golden spec tests - the direct vega-lite builder against the production
+altair chart class, for every chart shape the pages use - and resuming
+an interrupted populate
+"""
+import time
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from . import populate, trends
+from . import vl_spec as vl
+from .models import (CollectionItem, CollectionType, ComparisonGroup,
+                     ComparisonLabel, ComparisonSet, ComparisonSuperSet,
+                     ComparisonUnit, PopulateCheckpoint, Service,
+                     TrendCell)
+
+short_items = ["North", "South", "East"]
+long_items = ["North Somerset Council", "South Gloucestershire Council",
+              "East Riding of Yorkshire Council"]
+short_labels = ["Yes", "No", "Unsure"]
+# over the average length where the charts switch to horizontal bars
+long_labels = ["Not enough information", "Already reported elsewhere",
+               "Fixed before the report was read"]
+month_labels = ["Jan", "Feb", "Mar"]
+
+
+@override_settings(FAST_CHART_SPECS=True)
+class ChartSpecTest(TestCase):
+
+    def setUp(self):
+        self.service = Service.objects.create(name="Test", slug="test",
+                                              collective_name="Tests",
+                                              singular_name="Test")
+        self.group = ComparisonGroup.objects.create(
+            service=self.service, name="Group", slug="group", order=0)
+        area = self.make_collection("area", short_items)
+        council = self.make_collection("council", long_items)
+        self.short_set = self.make_set(area, "question", short_labels)
+        self.long_set = self.make_set(council, "reason", long_labels)
+        self.month_set = self.make_set(area, "created_month", month_labels)
+
+    def make_collection(self, slug, names):
+        collection = CollectionType.objects.create(
+            service=self.service, name=slug.title(), slug=slug)
+        for name in names:
+            CollectionItem.objects.create(parent=collection, name=name,
+                                          slug=name.lower().replace(" ", "_"))
+        return collection
+
+    def make_set(self, collection, slug, labels):
+        superset = ComparisonSuperSet.objects.create(
+            name=slug.title(), slug=slug, h_label="Answer",
+            group=self.group, overview=True)
+        comparison_set = ComparisonSet.objects.create(
+            superset=superset, collectiontype=collection, chi2=4.2,
+            p=0.01, dof=4)
+        for order, name in enumerate(labels):
+            ComparisonLabel.objects.create(parent=superset, name=name,
+                                           order=order,
+                                           slug=name.lower().replace(" ", "_"))
+        grand_total = 0
+        for n, item in enumerate(collection.items.all().order_by("id")):
+            for order, label in enumerate(labels):
+                value = 10 + n * 5 + order * 3
+                grand_total += value
+                ComparisonUnit.objects.create(
+                    parent=comparison_set, collection=item, order=order,
+                    label=label, label_slug=label.lower().replace(" ", "_"),
+                    value=value, expected_value=value - 2 + order,
+                    row_total=60, column_total=60, chi_value=order - 1.0)
+        comparison_set.grand_total = grand_total
+        comparison_set.save()
+        return comparison_set
+
+    def set_builders(self, prefix, s):
+        item = s.collectiontype.items.order_by("id").first()
+        label = s.superset.labels.first()
+        yield prefix + " chart", lambda: s.get_chart(item)
+        yield prefix + " tidy", lambda: s.get_chart(item, tidy=True)
+        yield prefix + " row percent", lambda: s.get_chart(
+            item, tidy=True, percentage="row")
+        yield prefix + " column percent", lambda: s.get_chart(
+            item, tidy=True, percentage="column")
+        yield prefix + " expected", lambda: s.get_expected_comparison_chart(
+            item)
+        yield prefix + " percentage difference", lambda: (
+            s.get_comparison_chart(item, True))
+        yield prefix + " absolute difference", lambda: (
+            s.get_comparison_chart(item, False))
+        yield prefix + " grand total", lambda: s.get_grand_total_chart(
+            label, summary=True)
+        yield prefix + " label", lambda: label.label_chart(
+            s.collectiontype, s.superset)
+        yield prefix + " label percent", lambda: label.label_chart(
+            s.collectiontype, s.superset, percentage=True)
+
+    def trend_chart(self):
+        cells = [TrendCell(collection_slug="area", item_slug="north",
+                           item_name="North", superset_slug="question",
+                           superset_name="Question", label_slug=x.lower(),
+                           label=x, shares="[10.0, null, 12.5]")
+                 for x in short_labels]
+        return trends.trend_chart(self.service, [2019, 2020, 2021], cells)
+
+    def object_column_chart(self):
+        import pandas as pd
+        df = pd.DataFrame({"label": short_labels,
+                           "count": pd.Series([1, 2, 3], dtype=object)})
+        chart = vl.make_chart(df, name="object column", chart_type="bar")
+        chart.set_options(x=vl.X("label"), y=vl.Y("count"),
+                          tooltip=["label", "count"])
+        return chart
+
+    def chart_builders(self):
+        yield from self.set_builders("short", self.short_set)
+        yield from self.set_builders("long", self.long_set)
+        yield from self.set_builders("month", self.month_set)
+        yield "trend", self.trend_chart
+        yield "object column", self.object_column_chart
+
+    def test_specs_match_altair(self):
+        for name, builder in self.chart_builders():
+            chart = builder()
+            with self.subTest(chart=name):
+                self.assertIsInstance(chart, vl.SpecChart)
+                self.assertEqual(vl.compare_with_altair(chart), [])
+
+    def encoding(self, chart):
+        spec = chart.to_dict()
+        return spec.get("layer", [spec])[0]["encoding"]
+
+    def test_shapes_covered(self):
+        item = self.long_set.collectiontype.items.first()
+        # long labels - the label axis is y
+        encoding = self.encoding(self.long_set.get_chart(item))
+        self.assertEqual(encoding["y"]["field"], "Answer")
+        item = self.month_set.collectiontype.items.first()
+        encoding = self.encoding(
+            self.month_set.get_expected_comparison_chart(item))
+        self.assertIsInstance(encoding["column"]["sort"], list)
+        encoding = self.encoding(self.object_column_chart())
+        self.assertEqual(encoding["y"]["type"], "quantitative")
+
+    def test_facet_sizing_in_spec(self):
+        item = self.short_set.collectiontype.items.first()
+        chart = self.short_set.get_expected_comparison_chart(item)
+        spec = chart.to_dict()
+        for key, value in vl.facet_sizing(chart.facet_width).items():
+            self.assertEqual(spec[key], value)
+
+    def test_theme_config_in_spec(self):
+        item = self.short_set.collectiontype.items.first()
+        spec = self.short_set.get_chart(item).to_dict()
+        reference = vl.altair_reference(self.short_set.get_chart(item))
+        self.assertEqual(spec.get("config"), reference.get("config"))
+
+    def test_spec_path_faster(self):
+        charts = [builder() for name, builder in self.chart_builders()]
+        # warm the caches both paths keep
+        for chart in charts:
+            chart.to_dict()
+            vl.altair_reference(chart)
+        start = time.perf_counter()
+        for chart in charts:
+            chart.to_dict()
+        spec_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for chart in charts:
+            vl.altair_reference(chart)
+        altair_time = time.perf_counter() - start
+        print("\n{0} charts: spec builder {1:.3f}s, altair {2:.3f}s "
+              "({3:.1f}x)".format(len(charts), spec_time, altair_time,
+                                  altair_time / spec_time))
+        self.assertLess(spec_time, altair_time)
+
+
+class FakeCollection(object):
+    name = "Area"
+    slug = "area"
+    description = ""
+    display_in_header = True
+    default = True
+
+
+def fake_analysis(slug):
+
+    class FakeAnalysis(object):
+        name = slug.title()
+        h_label = "Answer"
+        priority = 0
+        description = ""
+        overview = False
+        group = "Group"
+        exclusions = []
+
+        def __init__(self, collection):
+            # an existing file, so no grid is generated
+            self.final_location = __file__
+
+    FakeAnalysis.slug = slug
+    return FakeAnalysis
+
+
+class FakeRegister(object):
+
+    def get_collections(self):
+        return [FakeCollection]
+
+    def get_analysis(self):
+        return [fake_analysis(x) for x in ["first", "second", "third"]]
+
+
+class Interrupted(Exception):
+    pass
+
+
+class PopulateResumeTest(TestCase):
+    """
+    populate of several services killed part way and resumed
+    """
+    slugs = ["fms", "fms_no_cobrands", "fms_2019"]
+
+    def setUp(self):
+        self.generated = []
+        self.fail_at = None
+        patches = [
+            mock.patch.object(ComparisonSet, "generate", autospec=True,
+                              side_effect=self.fake_generate),
+            mock.patch.object(CollectionType, "create_items"),
+            mock.patch.object(ComparisonLabel, "generate"),
+            mock.patch("explorer.effect_size.update_service"),
+            mock.patch("explorer.read_model.rebuild"),
+            mock.patch("explorer.findings.rebuild"),
+            mock.patch("explorer.generate.instrument.write_report"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def fake_generate(self, comparison_set, save=True):
+        key = (comparison_set.superset.group.service.slug,
+               comparison_set.superset.slug)
+        if key == self.fail_at:
+            raise Interrupted()
+        self.generated.append(key)
+
+    def populate_all(self):
+        for slug in self.slugs:
+            populate.clear_service(slug)
+            service, new = Service.objects.get_or_create(
+                name=slug.title(), slug=slug, collective_name="Tests",
+                singular_name="Test")
+            populate.create_groups(service, [("Group", 0)])
+            populate.populate_service(service, FakeRegister())
+
+    def service_sets(self, slug):
+        return set(ComparisonSet.objects.filter(
+            superset__group__service__slug=slug).values_list("id", flat=True))
+
+    def interrupt_and_resume(self):
+        # killed part way through the second service
+        self.generated = []
+        self.fail_at = ("fms_no_cobrands", "second")
+        with self.assertRaises(Interrupted):
+            self.populate_all()
+        self.assertEqual(self.generated, [("fms", "first"), ("fms", "second"),
+                                          ("fms", "third"),
+                                          ("fms_no_cobrands", "first")])
+        first_sets = self.service_sets("fms")
+
+        self.generated = []
+        self.fail_at = None
+        with mock.patch.object(populate, "resume", True):
+            self.populate_all()
+
+        # the finished service is kept as it was, the interrupted one
+        # carries on from its checkpoints
+        self.assertEqual(self.generated, [("fms_no_cobrands", "second"),
+                                          ("fms_no_cobrands", "third"),
+                                          ("fms_2019", "first"),
+                                          ("fms_2019", "second"),
+                                          ("fms_2019", "third")])
+        self.assertEqual(first_sets, self.service_sets("fms"))
+        for slug in self.slugs:
+            self.assertEqual(len(self.service_sets(slug)), 3)
+            markers = PopulateCheckpoint.objects.filter(service__slug=slug)
+            self.assertEqual(
+                list(markers.values_list("superset_slug", flat=True)),
+                [populate.service_complete])
+
+    def test_resume_after_interruption(self):
+        self.interrupt_and_resume()
+
+    def test_fresh_run_clears_markers(self):
+        # markers left by a finished run mustn't let a resume of a later
+        # interrupted run skip services it hadn't reached
+        self.populate_all()
+        populate.clear_completed("fms")
+        self.assertFalse(PopulateCheckpoint.objects.exists())
+        self.interrupt_and_resume()
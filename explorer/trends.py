@@ -0,0 +1,210 @@
+"""
+Year-over-year trend cube across the year clone services
+
+The year clones (fms_2019, fms_2020 ... and wtt_[year]) are populated as
+separate services, so following a cell across the years meant opening a
+page per year. rebuild(family) reads the units of all the clones of a
+family in one query, lines up every (collection item, superset, label)
+cell by year as a dense cells x years array (NaN where a year doesn't
+have the cell) and stores a row per cell against the family's base
+service (fms, wtt) - the counts, the share of the item's row and the
+standardised residual for each year, and the change in share between
+the first and last years present.
+
+The trend views read the cube without touching the year services.
+"""
+import json
+import re
+
+from . import vl_spec as vl
+from .models import ComparisonUnit, Service, TrendCell, TrendCube
+
+year_slug = re.compile(r"^(.+)_(\d{4})$")
+
+# (column, query field)
+unit_columns = [("service_id", "parent__superset__group__service_id"),
+                ("collection_slug", "parent__collectiontype__slug"),
+                ("item_slug", "collection__slug"),
+                ("item_name", "collection__name"),
+                ("superset_slug", "parent__superset__slug"),
+                ("superset_name", "parent__superset__name"),
+                ("label_slug", "label_slug"),
+                ("label", "label"),
+                ("order", "order"),
+                ("value", "value"),
+                ("row_total", "row_total"),
+                ("chi_value", "chi_value")]
+
+cell_key = ["collection_slug", "item_slug", "superset_slug", "label_slug"]
+name_columns = ["item_name", "superset_name", "label", "order"]
+array_columns = ["value", "share", "chi_value"]
+
+
+def year_services(family):
+    """
+    [(year, service)] for the year clones of a base service slug
+    """
+    clones = []
+    for s in Service.objects.filter(slug__startswith=family + "_"):
+        match = year_slug.match(s.slug)
+        if match and match.group(1) == family:
+            clones.append((int(match.group(2)), s))
+    clones.sort(key=lambda x: x[0])
+    return clones
+
+
+def families():
+    """
+    base services that have a year clone
+    """
+    slugs = set()
+    for slug in Service.objects.values_list("slug", flat=True):
+        match = year_slug.match(slug)
+        if match:
+            slugs.add(match.group(1))
+    return list(Service.objects.filter(slug__in=slugs).order_by("slug"))
+
+
+def build_cube(clones):
+    """
+    (names dataframe, {column: cells x years array}) for the clones
+    """
+    import numpy as np
+    import pandas as pd
+
+    year_index = {s.id: n for n, (year, s) in enumerate(clones)}
+    units = ComparisonUnit.objects.filter(
+        parent__superset__group__service__in=[s for y, s in clones])
+    df = pd.DataFrame.from_records(
+        units.values_list(*[x[1] for x in unit_columns]).iterator(
+            chunk_size=20000),
+        columns=[x[0] for x in unit_columns])
+    if len(df) == 0:
+        return None, {}
+
+    df["year"] = df["service_id"].map(year_index)
+    for c in ["value", "row_total", "chi_value"]:
+        df[c] = df[c].astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["share"] = np.where(df["row_total"] > 0,
+                               df["value"] / df["row_total"] * 100, np.nan)
+
+    # latest year's names win
+    df = df.sort_values("year")
+    names = df.groupby(cell_key)[name_columns].last()
+
+    dense = df.drop_duplicates(cell_key + ["year"], keep="last")
+    dense = dense.set_index(cell_key + ["year"])[array_columns]
+    dense = dense.unstack("year")
+    dense = dense.reindex(columns=pd.MultiIndex.from_product(
+        [array_columns, range(len(clones))]))
+    names = names.reindex(dense.index)
+    arrays = {c: dense[c].values for c in array_columns}
+    return names, arrays
+
+
+def share_change(shares):
+    """
+    last present share less the first, per cell
+    """
+    import numpy as np
+    present = ~np.isnan(shares)
+    rows = np.arange(len(shares))
+    first = present.argmax(axis=1)
+    last = shares.shape[1] - 1 - present[:, ::-1].argmax(axis=1)
+    change = shares[rows, last] - shares[rows, first]
+    return np.where(present.any(axis=1), np.nan_to_num(change), 0)
+
+
+def json_row(row, digits):
+    return json.dumps([None if x != x else round(float(x), digits)
+                       for x in row], separators=(",", ":"))
+
+
+def rebuild(family):
+    """
+    replace the cube for a base service slug (e.g. fms)
+    """
+    base = Service.objects.filter(slug=family).first()
+    clones = year_services(family)
+    if base is None or not clones:
+        print("trends {0}: no year services".format(family))
+        return 0
+
+    TrendCube.objects.filter(service=base).delete()
+    cube = TrendCube(service=base,
+                     years=json.dumps([y for y, s in clones]))
+    cube.save()
+
+    names, arrays = build_cube(clones)
+    if names is None:
+        return 0
+    changes = share_change(arrays["share"])
+
+    rows = zip(names.index, names.itertuples(index=False, name=None))
+    for n, (key, row) in enumerate(rows):
+        collection_slug, item_slug, superset_slug, label_slug = key
+        item_name, superset_name, label, order = row
+        TrendCell(cube=cube,
+                  collection_slug=collection_slug,
+                  item_slug=item_slug,
+                  item_name=item_name,
+                  superset_slug=superset_slug,
+                  superset_name=superset_name,
+                  label_slug=label_slug,
+                  label=label,
+                  order=int(order) if order == order else 0,
+                  values=json_row(arrays["value"][n], 2),
+                  shares=json_row(arrays["share"][n], 2),
+                  residuals=json_row(arrays["chi_value"][n], 2),
+                  change=round(float(changes[n]), 4)).queue()
+    TrendCell.save_queue()
+    print("trends {0}: {1} cells over {2}".format(
+        family, len(names), ", ".join(str(y) for y, s in clones)))
+    return len(names)
+
+
+def cube_for(service):
+    return TrendCube.objects.filter(service=service).first()
+
+
+def movers(cube, collection_slug, limit=25):
+    """
+    (risers, fallers) - the cells whose share changed most
+    """
+    cells = TrendCell.objects.filter(cube=cube,
+                                     collection_slug=collection_slug)
+    risers = cells.filter(change__gt=0).order_by("-change")[:limit]
+    fallers = cells.filter(change__lt=0).order_by("change")[:limit]
+    return list(risers), list(fallers)
+
+
+def cell_trend(cube, collection_slug, item_slug, superset_slug):
+    return list(TrendCell.objects.filter(
+        cube=cube, collection_slug=collection_slug, item_slug=item_slug,
+        superset_slug=superset_slug).order_by("order"))
+
+
+def trend_chart(service, years, cells):
+    """
+    line per label - share of the item's row each year
+    """
+    import pandas as pd
+    rows = []
+    for c in cells:
+        for year, share in zip(years, c.share_list()):
+            if share is not None:
+                rows.append({"year": str(year), "label": c.label,
+                             "share": share / 100})
+    df = pd.DataFrame(rows, columns=["year", "label", "share"])
+    name = " ".join(["trend", service.slug, cells[0].collection_slug,
+                     cells[0].item_slug, cells[0].superset_slug])
+    title = vl.TitleParams(cells[0].superset_name,
+                           subtitle=[cells[0].item_name])
+    chart = vl.make_chart(df, name=name, title=title, chart_type="line")
+    chart.set_options(x=vl.X("year", axis=vl.Axis(title="", labelAngle=0)),
+                      y=vl.Y("share", title="", axis=vl.Axis(format=".0%")),
+                      color=vl.Color("label", sort=None),
+                      tooltip=["year", "label",
+                               vl.Tooltip("share", format=".1%")])
+    return chart
@@ -7,15 +7,17 @@ from django_sourdough.views import ComboView, postlogic, prelogic
 
 from django.utils.timezone import now
 
-from .models import (large_cutoff, local_negative, local_positive,
+from .models import (large_cutoff, theme_colours,
                      local_negative_label, local_positive_label,
                      Service, CollectionType, CollectionItem,
                      ComparisonSuperSet, ComparisonSet, ComparisonLabel,
-                     ComparisonGroup, ComparisonUnit)
+                     ComparisonGroup)
 
 from research_common.views import AnchorChartsMixIn
+from . import bake_profile, findings, lazy_charts, read_model, trends
 from django.urls import reverse
 from django.conf import settings
+from django.http import Http404
 from collections import OrderedDict
 
 static_root = "http://research.mysociety.org/static/img"
@@ -23,6 +25,9 @@ media_root = "http://research.mysociety.org"
 
 service_query = Service.objects.all()
 
+if bake_profile.profile_enabled():
+    bake_profile.install()
+
 
 class GenericSocial(object):
     share_image = static_root + "/mysociety-circles-social.e9fe1879ff6d.png"
@@ -30,6 +35,16 @@ class GenericSocial(object):
     share_site_name = "mySociety Research"
     share_twitter = "@mysociety"
 
+    @prelogic
+    def profile_start(self):
+        if bake_profile.profile_enabled():
+            bake_profile.logic_started(self)
+
+    @postlogic
+    def profile_end(self):
+        if bake_profile.profile_enabled():
+            bake_profile.logic_finished(self)
+
     def extra_params(self, context):
         params = super(GenericSocial, self).extra_params(context)
         if hasattr(settings, "SITE_ROOT"):
@@ -50,8 +65,8 @@ class ServiceLogic(AnchorChartsMixIn):
         default = self.service.default()
         self.default_collection_type = default.slug
         self.large_cutoff = large_cutoff
-        self.local_negative = local_negative
-        self.local_positive = local_positive
+        self.local_negative = theme_colours()["local_negative"]
+        self.local_positive = theme_colours()["local_positive"]
         self.local_positive_label = local_positive_label
         self.local_negative_label = local_negative_label
 
@@ -82,6 +97,9 @@ class ServiceView(GenericSocial, ComboView, ServiceLogic):
     share_title = "mySociety Data Explorer - {{service.name}}"
     share_description = "Exploring data patterns in {{service.name}} data."
 
+    def logic(self):
+        self.trend_cube = trends.cube_for(self.service)
+
     def bake_args(self, limit_args=None):
         all_services = service_query
         for s in all_services:
@@ -147,15 +165,20 @@ class GroupedAnalysisChartView(GenericSocial, ComboView, ServiceLogic):
         self.groups = self.service.groups.filter(
             slug__in=populated_slugs).order_by("order")
 
-        # get supersets for this group
-        self.sets = ComparisonSuperSet.objects.filter(
-            group=self.group).order_by('-priority')
+        # get supersets for this group, by priority then effect size
+        default_sets = ComparisonSet.objects.filter(
+            superset__group=self.group, collectiontype__default=True)
+        default_sets = default_sets.select_related("superset").order_by(
+            "-superset__priority", "-cramers_v")
 
-        for s in self.sets:
+        self.sets = []
+        for set in default_sets:
+            s = set.superset
             label = s.labels.first()
-            set = s.sets.get(collectiontype__default=True)
-            s.chart = set.get_grand_total_chart(label, summary=True)
+            s.chart = lazy_charts.defer(
+                set.get_grand_total_chart(label, summary=True))
             self.chart_collection.register(s.chart)
+            self.sets.append(s)
 
     def bake_args(self, limit=None):
         all_services = service_query
@@ -174,6 +197,7 @@ class AnalysisView(GenericSocial, ComboView, ServiceLogic):
     args = ("service_slug", "parent_slug", "label_slug", "collectiontype_slug")
     share_title = "{{service.name}} - {{label.parent.h_label}} - {{label.name}}"
     share_description = "Exploring data patterns in {{service.name}} data."
+    read_model_name = "analysis"
 
     def logic(self):
         CSS = ComparisonSuperSet
@@ -200,19 +224,19 @@ class AnalysisView(GenericSocial, ComboView, ServiceLogic):
                                     slug=self.label_slug
                                     )
 
-        ordered_units = self.label.ordered_units(self.collectiontype_slug)
-
         CS = ComparisonSet
 
         self.local_set = CS.objects.get(superset=self.superset,
                                         collectiontype=self.collection_type)
 
-        self.table = self.label.label_table(
-            self.collection_type, self.superset)
-        self.label_chart = self.label.label_chart(
-            self.collection_type, self.superset)
-        self.label_chart_p = self.label.label_chart(
-            self.collection_type, self.superset, percentage=True)
+        stored = read_model.load(self)
+        if stored:
+            context = read_model.deserialize(stored)
+        else:
+            context = read_model.analysis_context(
+                self.label, self.collection_type, self.superset)
+        for k, v in context.items():
+            setattr(self, k, v)
         #self.chart = self.local_set.get_grand_total_chart(self.label)
 
     def bake_args(self):
@@ -304,31 +328,30 @@ class CollectionItemView(GenericSocial, ComboView, ServiceLogic):
             'slug', ("group_slug", "overview")]
     share_title = "{{collection.name}} - {{category.name}}"
     share_description = "Exploring data patterns in {{service.name}} data."
+    read_model_name = "item"
 
     def logic(self):
         self.collection = CollectionType.objects.get(
             slug=self.collection_slug, service=self.service)
         self.category = CollectionItem.objects.get(
             slug=self.slug, parent=self.collection)
-        self.groups = ComparisonGroup.get_all(self.service, self.category)
-        self.group = [x for x in self.groups if x.slug == self.group_slug][0]
-        set_slugs = [
-            x.superset.slug for x in self.group.get_sets(self.collection)]
-
-        def set_is_populated(set):
-            q = ComparisonUnit.objects.filter(parent=set,
-                                              collection=self.category)
-            q = q.exclude(value=0)
-            return q.exists()
-
-        self.sets = [self.category.get_set(
-            s, self.collection) for s in set_slugs]
-        self.sets = [x for x in self.sets if x and set_is_populated(x)]
-        self.sets.sort(key=lambda x: x.superset.name.lower())
-        self.sets.sort(key=lambda x: x.superset.priority, reverse=True)
 
+        stored = read_model.load(self)
+        if stored:
+            self.groups, self.sets = read_model.stored_item(
+                stored, self.service, self.collection)
+            self.group = [x for x in self.groups
+                          if x.slug == self.group_slug][0]
+        else:
+            self.groups = ComparisonGroup.get_all(self.service, self.category)
+            self.group = [x for x in self.groups
+                          if x.slug == self.group_slug][0]
+            self.sets = read_model.item_sets(self.category, self.collection,
+                                             self.group)
+
+        # charts come built from item_sets or the stored context
         for s in self.sets:
-            s.chart = s.get_chart(self.category)
+            s.chart = lazy_charts.defer(s.chart)
             self.chart_collection.register(s.chart)
 
     def bake_args(self, limit_args=None):
@@ -352,6 +375,7 @@ class ComparisonSetView(GenericSocial, ComboView, ServiceLogic):
             'category_slug', "superset_slug"]
     share_title = "{{superset.name}} - {{category.name}}"
     share_description = "Exploring data patterns in {{service.name}} data."
+    read_model_name = "comparison"
 
     def logic(self):
         # kind of categories
@@ -370,21 +394,14 @@ class ComparisonSetView(GenericSocial, ComboView, ServiceLogic):
         self.comparison_set = self.category.get_set(self.superset.slug,
                                                     self.collection)
 
-        cs = self.comparison_set
-
-        self.chart = cs.get_chart(self.category)
-        self.tidy_chart = cs.get_chart(self.category, tidy=True)
-        self.tidy_percent_row_chart = cs.get_chart(
-            self.category, tidy=True, percentage="row")
-        self.tidy_percent_column_chart = cs.get_chart(
-            self.category, tidy=True, percentage="column")
-        self.expected_chart = cs.get_expected_comparison_chart(
-            self.category)
-        self.percentage_diff = cs.get_comparison_chart(
-            self.category, True)
-        self.absolute_diff = cs.get_comparison_chart(
-            self.category, False)
-        self.table = cs.get_table(self.category)
+        stored = read_model.load(self)
+        if stored:
+            context = read_model.deserialize(stored)
+        else:
+            context = read_model.comparison_context(self.comparison_set,
+                                                    self.category)
+        for k, v in context.items():
+            setattr(self, k, v)
 
     def bake_args(self, limit_args=None):
         comparison_sets = ComparisonSet.objects.all()
@@ -414,3 +431,123 @@ class CollectionItemViewGroups(CollectionItemView):
                     groups = ComparisonGroup.get_all(s, i)
                     for g in groups:
                         yield [s.slug, t.slug, i.slug, g.slug]
+
+
+class HighlightsView(GenericSocial, ComboView, ServiceLogic):
+    """
+    the most notable cells of a service, a page at a time
+    """
+    template = "explorer/highlights.html"
+    url_patterns = [r'^(.*)/highlights/(.*)/(.*)/(.*)/']
+    url_name = "exp_highlights_view"
+    args = ["service_slug", "collection_slug", "group_slug", "page"]
+    share_title = "{{service.name}} - Notable findings"
+    share_description = "The largest differences in {{service.name}} data."
+
+    def logic(self):
+        self.collection = CollectionType.objects.get(
+            slug=self.collection_slug, service=self.service)
+        groups = self.service.groups.all().order_by("order")
+        self.groups = [x for x in groups
+                       if findings.has_page(self.collection, x, 1)]
+        if self.group_slug == "all":
+            self.group = None
+        else:
+            self.group = self.service.groups.get(slug=self.group_slug)
+
+        try:
+            self.page_number = int(self.page)
+        except ValueError:
+            raise Http404("No such page")
+        # page 1 is shown even when there is nothing notable
+        if self.page_number < 1 or (self.page_number > 1 and not
+                                    findings.has_page(self.collection,
+                                                      self.group,
+                                                      self.page_number)):
+            raise Http404("No such page")
+        self.findings = list(findings.page(self.collection, self.group,
+                                           self.page_number))
+        self.start_rank = (self.page_number - 1) * findings.page_size + 1
+        self.previous_page = self.page_number - 1
+        self.next_page = None
+        if findings.has_page(self.collection, self.group,
+                             self.page_number + 1):
+            self.next_page = self.page_number + 1
+
+    def bake_args(self, limit_args=None):
+        for s in service_query:
+            for t, group_slug, pages in findings.partitions(s):
+                for n in range(1, max(pages, 1) + 1):
+                    yield [s.slug, t.slug, group_slug, n]
+
+
+class TrendMoversView(GenericSocial, ComboView, ServiceLogic):
+    """
+    cells whose share changed most across the year services
+    """
+    template = "explorer/trends.html"
+    url_patterns = [r'^(.*)/trends/(.*)/']
+    url_name = "exp_trends_view"
+    args = ["service_slug", "collection_slug"]
+    share_title = "{{service.name}} - Trends by year"
+    share_description = "Changes over time in {{service.name}} data."
+
+    def logic(self):
+        self.collection = CollectionType.objects.get(
+            slug=self.collection_slug, service=self.service)
+        self.cube = trends.cube_for(self.service)
+        if self.cube is None:
+            raise Http404("No trends for this service")
+        self.years = self.cube.year_list()
+        risers, fallers = trends.movers(self.cube, self.collection_slug)
+        self.movers = [("Biggest rises", risers), ("Biggest falls", fallers)]
+
+    def bake_args(self, limit_args=None):
+        for s in trends.families():
+            if trends.cube_for(s) is None:
+                continue
+            for t in s.collections.all():
+                yield [s.slug, t.slug]
+
+
+class TrendCellView(GenericSocial, ComboView, ServiceLogic):
+    """
+    an item's distribution for one analysis, year by year
+    """
+    template = "explorer/trend.html"
+    url_patterns = [r'^(.*)/trends/(.*)/cell/(.*)/(.*)/']
+    url_name = "exp_trend_view"
+    args = ["service_slug", "collection_slug", "item_slug",
+            "superset_slug"]
+    share_title = "{{item_name}} - {{superset_name}} by year"
+    share_description = "Changes over time in {{service.name}} data."
+
+    def logic(self):
+        self.collection = CollectionType.objects.get(
+            slug=self.collection_slug, service=self.service)
+        self.cube = trends.cube_for(self.service)
+        if self.cube is None:
+            raise Http404("No trends for this service")
+        self.years = self.cube.year_list()
+        self.cells = trends.cell_trend(self.cube, self.collection_slug,
+                                       self.item_slug, self.superset_slug)
+        if not self.cells:
+            raise Http404("No such trend")
+        self.item_name = self.cells[0].item_name
+        self.superset_name = self.cells[0].superset_name
+        for c in self.cells:
+            c.year_rows = list(zip(self.years, c.value_list(),
+                                   c.share_list(), c.residual_list()))
+        self.chart = trends.trend_chart(self.service, self.years,
+                                        self.cells)
+        self.chart_collection.register(self.chart)
+
+    def bake_args(self, limit_args=None):
+        for s in trends.families():
+            cube = trends.cube_for(s)
+            if cube is None:
+                continue
+            cells = cube.cells.values_list(
+                "collection_slug", "item_slug", "superset_slug").distinct()
+            for collection_slug, item_slug, superset_slug in cells:
+                yield [s.slug, collection_slug, item_slug, superset_slug]
@@ -0,0 +1,322 @@
+"""
+Lightweight vega-lite spec builder for the explorer charts
+
+Building every chart through altair objects means schema validation and
+to_dict for thousands of charts in a bake. The charts in this app are
+all one of a few shapes (bar, bar with text labels, bar faceted by column)
+so the spec can be assembled directly as a dict.
+
+Channels are described with the small factories below, which mirror the
+parts of the altair api used in models.py (X, Y, Color, Text, Tooltip,
+Column, Axis, Header, TitleParams). make_chart returns a SpecChart when
+FAST_CHART_SPECS is set and otherwise a normal AltairChart with the
+channels converted back to altair objects, so both paths are built from
+the same description. compare_with_altair checks a SpecChart against the
+spec the production chart class (theme and facet sizing included)
+produces for the same options - see explorer/tests.py.
+"""
+import copy
+import json
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from .chart_data import enable_external_chart_data
+
+schema_url = "https://vega.github.io/schema/vega-lite/v4.json"
+
+
+class Channel(object):
+    """
+    encoding channel - stores the altair class name, shorthand and options
+    """
+
+    def __init__(self, channel_class, shorthand, **kwargs):
+        self.channel_class = channel_class
+        self.shorthand = shorthand
+        self.kwargs = kwargs
+
+    def to_altair(self):
+        import altair as alt
+        return getattr(alt, self.channel_class)(self.shorthand, **self.kwargs)
+
+    def to_spec(self, types):
+        spec = {"field": self.shorthand,
+                "type": types.get(self.shorthand, "nominal")}
+        spec.update(self.kwargs)
+        return spec
+
+
+def X(shorthand, **kwargs):
+    return Channel("X", shorthand, **kwargs)
+
+
+def Y(shorthand, **kwargs):
+    return Channel("Y", shorthand, **kwargs)
+
+
+def Color(shorthand, **kwargs):
+    return Channel("Color", shorthand, **kwargs)
+
+
+def Text(shorthand, **kwargs):
+    return Channel("Text", shorthand, **kwargs)
+
+
+def Tooltip(shorthand, **kwargs):
+    return Channel("Tooltip", shorthand, **kwargs)
+
+
+def Column(shorthand, **kwargs):
+    return Channel("Column", shorthand, **kwargs)
+
+
+def Axis(**kwargs):
+    return dict(kwargs)
+
+
+def Header(**kwargs):
+    return dict(kwargs)
+
+
+def TitleParams(text, **kwargs):
+    title = {"text": text}
+    title.update(kwargs)
+    return title
+
+
+@lru_cache(maxsize=None)
+def infer_type(dtype_kind):
+    """
+    same rules as altair's infer_vegalite_type for the dtype kinds used here
+    """
+    if dtype_kind in ["i", "u", "f", "c"]:
+        return "quantitative"
+    if dtype_kind == "M":
+        return "temporal"
+    return "nominal"
+
+
+def column_type(series):
+    """
+    vega-lite type of a dataframe column
+    """
+    if series.dtype.kind == "O":
+        # object columns may hold numbers - altair infers from the values
+        from altair.utils import infer_vegalite_type
+        return infer_vegalite_type(series)
+    return infer_type(series.dtype.kind)
+
+
+def chart_data(df):
+    """
+    data through the active altair data transformer
+    (so hashed external files are used in the bake)
+    """
+    from altair import data_transformers
+    return data_transformers.get()(df)
+
+
+def to_altair(value):
+    """
+    convert channel descriptions (or lists of) to altair objects
+    """
+    if isinstance(value, Channel):
+        return value.to_altair()
+    if isinstance(value, list):
+        return [to_altair(x) for x in value]
+    return value
+
+
+def encode_value(channel, value, types):
+    if isinstance(value, Channel):
+        return value.to_spec(types)
+    if isinstance(value, list):
+        return [encode_value(channel, x, types) for x in value]
+    if isinstance(value, str):
+        # plain shorthand - same as a channel without options
+        return Channel(channel, value).to_spec(types)
+    return value
+
+
+def with_theme(spec):
+    """
+    merge in the active altair theme, as altair's to_dict does
+    """
+    from altair import themes
+    from altair.utils import update_nested
+    return update_nested(themes.get()(), spec, copy=True)
+
+
+# top level properties a chart class may set for a faceted chart
+facet_keys = ["width", "height", "spacing", "autosize", "resolve"]
+
+
+@lru_cache(maxsize=None)
+def facet_sizing(facet_width):
+    """
+    the sizing the production chart class gives a faceted chart for
+    facet_width - taken from it once per value so the paths can't drift
+    """
+    import pandas as pd
+    df = pd.DataFrame({"item": ["a"], "series": ["A"], "value": [1]})
+    chart = converted_chart_class()(df, facet_width=facet_width,
+                                    chart_type="bar")
+    chart.set_options(x=X("series"), y=Y("value"), column=Column("item"))
+    spec = chart.to_dict()
+    return {k: spec[k] for k in facet_keys if k in spec}
+
+
+@lru_cache(maxsize=None)
+def layer_template(chart_type, text_option_keys):
+    """
+    skeleton for a chart shape, copied and filled for each chart
+    """
+    base = {"mark": chart_type, "encoding": {}}
+    if text_option_keys is None:
+        return base
+    text_layer = {"mark": {"type": "text"}, "encoding": {}}
+    return {"layer": [base, text_layer]}
+
+
+class SpecChart(object):
+    """
+    chart that assembles the vega-lite spec directly
+    follows the AltairChart interface used in models.py
+    """
+
+    def __init__(self, df, name="", title=None, chart_type="bar",
+                 facet_width=None, **kwargs):
+        self.df = df
+        self.name = name
+        self.title = title
+        self.chart_type = chart_type
+        # sizing for charts with a column facet (see facet_sizing)
+        self.facet_width = facet_width
+        self.options = {}
+        self.text_options = None
+        self.ident = "chart_" + uuid.uuid4().hex[:12]
+
+    def set_options(self, **kwargs):
+        self.options.update(kwargs)
+
+    def set_text_options(self, **kwargs):
+        self.text_options = kwargs
+
+    def _encoding(self, options, types):
+        return {k: encode_value(k, v, types) for k, v in options.items()}
+
+    def to_dict(self):
+        types = {k: column_type(self.df[k]) for k in self.df.columns}
+        text_keys = None
+        if self.text_options is not None:
+            text_keys = tuple(sorted(self.text_options.keys()))
+        spec = copy.deepcopy(layer_template(self.chart_type, text_keys))
+
+        encoding = self._encoding(self.options, types)
+        if text_keys is None:
+            spec["encoding"] = encoding
+        else:
+            # text layer repeats the bar encoding with the text added
+            text_options = dict(self.text_options)
+            text_encoding = dict(encoding)
+            text_encoding["text"] = encode_value(
+                "text", text_options.pop("text"), types)
+            spec["layer"][0]["encoding"] = encoding
+            spec["layer"][1]["encoding"] = text_encoding
+            spec["layer"][1]["mark"].update(text_options)
+
+        if self.title is not None:
+            spec["title"] = self.title
+        if self.facet_width is not None and "column" in self.options:
+            spec.update(copy.deepcopy(facet_sizing(self.facet_width)))
+        spec["data"] = chart_data(self.df)
+        spec["$schema"] = schema_url
+        return with_theme(spec)
+
+    def json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+    def render_div(self):
+        return mark_safe('<div id="{0}" class="vega-chart"></div>'.format(
+            self.ident))
+
+    def render_code(self):
+        code = 'vegaEmbed("#{0}", {1}, {{"actions": false}});'
+        return mark_safe(code.format(self.ident, self.json()))
+
+
+@lru_cache(maxsize=None)
+def converted_chart_class():
+    """
+    AltairChart that accepts the channel descriptions above
+    (created on first use to avoid importing altair at startup)
+    """
+    from research_common.charts import AltairChart
+
+    class ConvertedAltairChart(AltairChart):
+
+        def set_options(self, **kwargs):
+            super().set_options(
+                **{k: to_altair(v) for k, v in kwargs.items()})
+
+        def set_text_options(self, **kwargs):
+            super().set_text_options(
+                **{k: to_altair(v) for k, v in kwargs.items()})
+
+    return ConvertedAltairChart
+
+
+def make_chart(*args, **kwargs):
+    enable_external_chart_data()
+    if getattr(settings, "FAST_CHART_SPECS", False):
+        return SpecChart(*args, **kwargs)
+    return converted_chart_class()(*args, **kwargs)
+
+
+def altair_reference(chart):
+    """
+    build the same chart with the production chart class - returns spec
+    """
+    reference = converted_chart_class()(
+        chart.df, name=chart.name, title=chart.title,
+        chart_type=chart.chart_type, facet_width=chart.facet_width)
+    reference.set_options(**chart.options)
+    if chart.text_options is not None:
+        reference.set_text_options(**chart.text_options)
+    return reference.to_dict()
+
+
+def comparable(spec):
+    """
+    strip the parts that are expected to differ (data storage, schema
+    version) - the theme config is compared
+    """
+    spec = json.loads(json.dumps(spec, default=str))
+    for k in ["$schema", "datasets", "data"]:
+        spec.pop(k, None)
+    return spec
+
+
+def compare_with_altair(chart):
+    """
+    returns list of differences between the spec and altair path
+    """
+    ours = comparable(chart.to_dict())
+    theirs = comparable(altair_reference(chart))
+    differences = []
+
+    def walk(a, b, path):
+        if isinstance(a, dict) and isinstance(b, dict):
+            for k in sorted(set(a) | set(b)):
+                walk(a.get(k), b.get(k), path + [str(k)])
+        elif isinstance(a, list) and isinstance(b, list) and len(a) == len(b):
+            for n, (x, y) in enumerate(zip(a, b)):
+                walk(x, y, path + [str(n)])
+        elif a != b:
+            differences.append(("/".join(path), a, b))
+
+    walk(ours, theirs, [])
+    return differences
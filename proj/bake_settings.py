@@ -8,14 +8,24 @@ SITE_ROOT = "https://research.mysociety.org/sites"
 IS_LIVE = True
 STATICFILES_STORAGE = 'pipeline.storage.PipelineStorage'
 
+EXTERNAL_CHART_DATA = os.environ.get(
+    'EXTERNAL_CHART_DATA', 'True').lower() == "true"
+CHART_DATA_FOLDER = os.path.join(BAKE_MEDIA_LOCATION, "chart_data")
+FAST_CHART_SPECS = os.environ.get(
+    'FAST_CHART_SPECS', 'True').lower() == "true"
+
 DISABLE_APPS = ['django.contrib.admin', 'debug_toolbar']
 
 INSTALLED_APPS = [x for x in INSTALLED_APPS if x not in DISABLE_APPS]
 
+BAKE_DATABASE_LOAD = os.environ.get('BAKE_DATABASE_LOAD', 'memory').lower()
+
+source_database = os.path.join(BASE_DIR, "databases", 'db.sqlite3')
+
 DATABASES = {
     'memory_source': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, "databases", 'db.sqlite3'),
+        'NAME': source_database,
     },
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -23,6 +33,13 @@ DATABASES = {
     }
 }
 
+if BAKE_DATABASE_LOAD == "immutable":
+    DATABASES['default']['NAME'] = "file:{0}?mode=ro&immutable=1".format(
+        source_database)
+
+# per page timing manifest written to BAKE_LOCATION
+BAKE_PROFILE = os.environ.get('BAKE_PROFILE', 'True').lower() == "true"
+
 MIDDLEWARE = (
     #'debug_toolbar.middleware.DebugToolbarMiddleware',
     #'django.contrib.sessions.middleware.SessionMiddleware',
@@ -35,5 +52,8 @@ MIDDLEWARE = (
     'htmlmin.middleware.MarkRequestMiddleware',
 )
 
+if BAKE_PROFILE:
+    MIDDLEWARE = ('explorer.bake_profile.BakeProfileMiddleware',) + MIDDLEWARE
+
 INTERNAL_IPS = [
 ]
\ No newline at end of file
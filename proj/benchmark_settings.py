@@ -0,0 +1,25 @@
+from .settings import *
+
+print ("using benchmark settings")
+
+# generation benchmarks run against synthetic sources (see explorer.synthetic)
+# with their own database so the real one isn't touched
+BENCHMARK_SOURCE = os.environ.get(
+    'BENCHMARK_SOURCE', os.path.join(BASE_DIR, "_sources", "synthetic"))
+
+FMS_EXPLORER_SOURCE = os.path.join(BENCHMARK_SOURCE, "fms")
+WTT_EXPLORER_SOURCE = os.path.join(BENCHMARK_SOURCE, "wtt")
+WDTK_EXPLORER_SOURCE = os.path.join(BENCHMARK_SOURCE, "wdtk")
+
+DISABLE_APPS = ['debug_toolbar']
+
+INSTALLED_APPS = [x for x in INSTALLED_APPS if x not in DISABLE_APPS]
+
+MIDDLEWARE = tuple(x for x in MIDDLEWARE if "debug_toolbar" not in x)
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BENCHMARK_SOURCE, 'benchmark.sqlite3'),
+    },
+}
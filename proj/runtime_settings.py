@@ -0,0 +1,47 @@
+from .settings import *
+
+print ("using runtime settings")
+
+# serve the explorer live (behind a reverse proxy, or runserver to
+# preview a data refresh) with rendered pages cached until populate
+# bumps the data version - see explorer.page_cache
+
+DEBUG = os.environ.get('RUNTIME_DEBUG', 'False').lower() == "true"
+HTML_MINIFY = not DEBUG
+
+ALLOWED_HOSTS = ALLOWED_HOSTS + [x for x in os.environ.get(
+    'RUNTIME_ALLOWED_HOSTS', '').split(",") if x]
+
+DISABLE_APPS = ['debug_toolbar']
+
+INSTALLED_APPS = [x for x in INSTALLED_APPS if x not in DISABLE_APPS]
+
+PAGE_CACHE = os.environ.get('PAGE_CACHE', 'True').lower() == "true"
+
+# "file" can be shared by several server processes and the warm up,
+# "memory" is per process
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'file').lower()
+
+backends = {"file": 'django.core.cache.backends.filebased.FileBasedCache',
+            "memory": 'django.core.cache.backends.locmem.LocMemCache'}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    PAGE_CACHE_ALIAS: {
+        'BACKEND': backends[PAGE_CACHE_BACKEND],
+        'LOCATION': os.environ.get('PAGE_CACHE_LOCATION',
+                                   os.path.join(BASE_DIR, "_cache", "pages")),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            # a third of the entries are culled once this is reached
+            'MAX_ENTRIES': int(os.environ.get('PAGE_CACHE_MAX_ENTRIES',
+                                              '20000')),
+            'CULL_FREQUENCY': 3,
+        }
+    }
+}
+
+MIDDLEWARE = tuple(x for x in MIDDLEWARE if "debug_toolbar" not in x)
+MIDDLEWARE = ('explorer.page_cache.PageCacheMiddleware',) + MIDDLEWARE
@@ -161,5 +161,34 @@ PIPELINE = {
 EXPORT_CHARTS = False
 FORCE_EXPORT_CHARTS = False
 
+# write chart data to shared hashed json files rather than inline
+# (only enabled for the bake, see bake_settings)
+EXTERNAL_CHART_DATA = False
+
+# build vega-lite specs directly rather than through altair (see vl_spec)
+FAST_CHART_SPECS = False
+
+# record per page timings during the bake (see explorer.bake_profile)
+BAKE_PROFILE = False
+
+# how the bake loads the database - "memory" (backup api copy into the
+# in-memory default) or "immutable" (read-only file, memory mapped)
+# see explorer.memory_db
+BAKE_DATABASE_LOAD = ""
+
+# cache rendered pages by data version when serving at runtime
+# (only enabled in runtime_settings, see explorer.page_cache)
+PAGE_CACHE = False
+PAGE_CACHE_ALIAS = "pages"
+
+# render the comparison, analysis and item pages from the context stored
+# by populate where there is one (see explorer.read_model)
+PAGE_READ_MODEL = True
+
+# render the charts on the item and grouped analysis pages as they are
+# scrolled into view (see explorer.lazy_charts)
+LAZY_CHARTS = True
+
 COMMAND_SPECIFIC_SETTINGS = [
-    ("bake", 'proj.bake_settings'), ("collectstatic", 'proj.bake_settings')]
+    ("bake", 'proj.bake_settings'), ("collectstatic", 'proj.bake_settings'),
+    ("warm_page_cache", 'proj.runtime_settings')]
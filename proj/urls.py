@@ -9,6 +9,8 @@ from django_sourdough.views import AppUrl, include_view
 from django.conf.urls.static import static
 from django.conf import settings
 
+from explorer.export import download_view
+
 urlpatterns = static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 
@@ -23,6 +25,8 @@ def holder_frontpage(request):
 urlpatterns += [
     path('', holder_frontpage),
     path('__debug__/', include(debug_toolbar.urls)),
+    url(r'^sites/{0}/([^/]+)/download/(csv|parquet)/$'.format(
+        settings.SITE_SLUG), download_view),
     url(r'^sites/{0}/'.format(settings.SITE_SLUG),
         include_view('{0}.views'.format(settings.CORE_APP_NAME))),
 ]
@@ -55,13 +55,102 @@ def migrate(c):
 
 
 @task
-def populate(c):
+def populate(c, profile=False, tracemalloc=False, resume=False):
+    """
+    --profile dumps cProfile stats per stage to benchmarks/profiles
+    --resume continues an interrupted populate from its checkpoints
+    """
+    from explorer import populate as populate_module
+    from explorer.generate import instrument
+    populate_module.resume = resume
+    instrument.configure(
+        profile_folder=os.path.join("benchmarks", "profiles") if profile else None,
+        tracemalloc=tracemalloc)
     do_django_command("populate")
 
 
 @task
-def bake(c):
+def bake(c, compress=False, api=True):
+    from explorer import bake_profile
+    bake_profile.clear_parts()
     do_django_command("bake")
+    # rows from every bake process, if BAKE_PROFILE was on
+    bake_profile.write_manifest()
+    if api:
+        do_django_command("bake_api")
+        do_django_command("bake_search")
+    if compress:
+        precompress(c)
+
+
+@task
+def precompress(c, min_size=1024, brotli=True):
+    """
+    write .gz and .br versions of text files in the bake directory
+    """
+    from explorer.precompress import precompress as precompress_folder
+    precompress_folder(bake_dir, min_size=int(min_size), use_brotli=brotli)
+
+
+@task
+def importtime(c, limit=None):
+    """
+    check django startup doesn't import the heavy analysis libraries
+    """
+    from explorer.import_benchmark import check
+    if check(float(limit) if limit else None):
+        raise Exit(code=1)
+
+
+@task
+def synthetic(c, scale="100k", service="all"):
+    """
+    write synthetic source files to _sources/synthetic/[scale]
+    """
+    from explorer.synthetic import write_all
+    services = None if service == "all" else [service]
+    write_all(os.path.join("_sources", "synthetic", scale), scale, services)
+
+
+@task
+def benchmark(c, scale="100k", service="all", keep_cache=False,
+              regenerate=False):
+    """
+    time run_all and populate against synthetic data (100k, 1m, 10m)
+    """
+    from explorer.generate_benchmark import benchmark as run_benchmark
+    run_benchmark(scale, service, keep_cache=keep_cache,
+                  regenerate=regenerate)
+
+
+@task
+def serve(c, port=8000):
+    """
+    run the explorer live with the runtime page cache
+    """
+    c.run("python -m django runserver --insecure 0.0.0.0:{0}".format(port),
+          env={"DJANGO_SETTINGS_MODULE": "proj.runtime_settings"})
+
+
+@task
+def warm(c, workers=4, server=None):
+    """
+    render every baked page into the runtime page cache
+    --server fetches from a running site instead (e.g. http://127.0.0.1:8000)
+    """
+    command = "python -m django warm_page_cache --workers {0}".format(workers)
+    if server:
+        command += " --server {0}".format(server)
+    c.run(command, env={"DJANGO_SETTINGS_MODULE": "proj.runtime_settings"})
+
+
+@task
+def export(c, service="", format="both"):
+    """
+    write [service]_crosstabs.csv.gz / .parquet to exports (all services
+    if none given)
+    """
+    do_django_command("export_service", service, "--format", format)
 
 
 @task
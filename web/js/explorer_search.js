@@ -0,0 +1,81 @@
+/*
+ * Prefix search over the prebuilt index written by the bake
+ * (see explorer/search_index.py)
+ *
+ * ExplorerSearch.load(manifestUrl, service, function (index) {
+ *     index.search("pot", 10);
+ * });
+ */
+var ExplorerSearch = (function () {
+
+    // marks (unicode category M) - the combining blocks where \p{M}
+    // isn't supported
+    var marks;
+    try {
+        marks = new RegExp("\\p{M}", "gu");
+    } catch (e) {
+        marks = /[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]/g;
+    }
+
+    // must match normalise in search_index.py
+    function normalise(text) {
+        text = (text || "").normalize ? text.normalize("NFKD") : text;
+        text = text.replace(marks, "").toLowerCase();
+        return text.replace(/[^a-z0-9]+/g, " ").trim();
+    }
+
+    // first key not less than prefix
+    function lowerBound(keys, prefix) {
+        var low = 0, high = keys.length;
+        while (low < high) {
+            var mid = (low + high) >>> 1;
+            if (keys[mid] < prefix) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    function Index(data) {
+        this.data = data;
+    }
+
+    Index.prototype.search = function (query, limit) {
+        var data = this.data, prefix = normalise(query);
+        var results = [], seen = {};
+        if (!prefix) {
+            return results;
+        }
+        limit = limit || 10;
+        for (var i = lowerBound(data.keys, prefix);
+             i < data.keys.length && data.keys[i].lastIndexOf(prefix, 0) === 0 &&
+             results.length < limit; i++) {
+            var ref = data.refs[i];
+            if (seen[ref]) {
+                continue;
+            }
+            seen[ref] = true;
+            var record = data.records[ref];
+            results.push({name: record[0],
+                          kind: data.kinds[record[1]],
+                          url: data.base + record[2],
+                          context: record[3]});
+        }
+        return results;
+    };
+
+    function load(manifestUrl, service, callback) {
+        $.getJSON(manifestUrl, function (manifest) {
+            var url = manifest.services[service];
+            if (url) {
+                $.getJSON(url, function (data) {
+                    callback(new Index(data));
+                });
+            }
+        });
+    }
+
+    return {load: load, normalise: normalise, Index: Index};
+})();
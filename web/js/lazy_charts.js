@@ -0,0 +1,48 @@
+/*
+ * Charts rendered as they come near the viewport
+ * (see explorer/lazy_charts.py)
+ *
+ * ExplorerCharts.defer(placeholderId, target, specString);
+ * ExplorerCharts.deferCode(placeholderId, function () { ... });
+ *
+ * Needs jQuery and waypoints.min.js - without them charts render at once.
+ */
+var ExplorerCharts = (function () {
+
+    // render half a screen before the chart scrolls in
+    var offset = "150%";
+
+    function watch(placeholderId, render) {
+        var element = document.getElementById(placeholderId);
+        var done = false;
+
+        function run() {
+            if (done) {
+                return;
+            }
+            done = true;
+            render();
+            if (element) {
+                element.className += " lazy-chart-rendered";
+            }
+        }
+
+        if (!element || typeof jQuery === "undefined" || !jQuery.fn.waypoint) {
+            run();
+            return;
+        }
+        jQuery(element).waypoint(run, {offset: offset, triggerOnce: true});
+    }
+
+    function defer(placeholderId, target, specString) {
+        watch(placeholderId, function () {
+            vegaEmbed(target, JSON.parse(specString), {"actions": false});
+        });
+    }
+
+    function deferCode(placeholderId, code) {
+        watch(placeholderId, code);
+    }
+
+    return {defer: defer, deferCode: deferCode};
+}());